@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,6 +8,44 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL not found in environment variables")
 
+# asyncpg URL for the async request path; derived from DATABASE_URL unless set
+# (set it explicitly when DATABASE_URL carries libpq-only options such as sslmode)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or re.sub(
+    r"^postgres(?:ql)?(?:\+\w+)?://", "postgresql+asyncpg://", DATABASE_URL
+)
+
+# Optional read replica for GET endpoints (unset = read from the primary)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+ASYNC_DATABASE_REPLICA_URL = os.getenv("ASYNC_DATABASE_REPLICA_URL") or (re.sub(
+    r"^postgres(?:ql)?(?:\+\w+)?://", "postgresql+asyncpg://", DATABASE_REPLICA_URL
+) if DATABASE_REPLICA_URL else None)
+# After a successful write, the client's reads go to the primary for this long (read-your-writes)
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+# Connection pool, per engine and per process (the sync and the async primary engine each get one)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Batch engine (migrations, rebuilds, scheduler runs): only busy while a job runs
+DB_BATCH_POOL_SIZE = int(os.getenv("DB_BATCH_POOL_SIZE", "1"))
+DB_BATCH_MAX_OVERFLOW = int(os.getenv("DB_BATCH_MAX_OVERFLOW", "4"))
+# Replica engines (sync and async each), connecting to the replica server
+DB_REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_REPLICA_MAX_OVERFLOW = int(os.getenv("DB_REPLICA_MAX_OVERFLOW", str(DB_MAX_OVERFLOW)))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Server-side timeouts in milliseconds (0 = no limit)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_IDLE_IN_TRANSACTION_TIMEOUT_MS = int(os.getenv("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", "60000"))
+
+# Bus shared by all workers and replicas for Socket.IO emits (unset = single process only):
+# redis://host:6379/0 (needs the redis package), or a postgresql:// URL to use LISTEN/NOTIFY
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "socketio")
+# Window over which read receipts and unread updates are merged before they are emitted
+SOCKETIO_COALESCE_SECONDS = float(os.getenv("SOCKETIO_COALESCE_SECONDS", "0.25"))
+# Emits queued by sync endpoints for the event loop; further emits are dropped while it is full
+SOCKETIO_EMIT_QUEUE_SIZE = int(os.getenv("SOCKETIO_EMIT_QUEUE_SIZE", "1000"))
+
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     raise ValueError("SECRET_KEY not found in environment variables")
@@ -14,3 +53,36 @@ if not SECRET_KEY:
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 API_URL = os.getenv("API_URL", "http://127.0.0.1:8001")
 
+# Login service user directory client (see app/services/user_directory.py)
+USER_DIRECTORY_TIMEOUT = float(os.getenv("USER_DIRECTORY_TIMEOUT", "5"))
+USER_DIRECTORY_POOL_SIZE = int(os.getenv("USER_DIRECTORY_POOL_SIZE", "20"))
+USER_DIRECTORY_CACHE_SIZE = int(os.getenv("USER_DIRECTORY_CACHE_SIZE", "5000"))
+USER_DIRECTORY_CACHE_TTL = int(os.getenv("USER_DIRECTORY_CACHE_TTL", "300"))
+USER_DIRECTORY_NEGATIVE_CACHE_TTL = int(os.getenv("USER_DIRECTORY_NEGATIVE_CACHE_TTL", "60"))
+USER_DIRECTORY_BREAKER_FAILURES = int(os.getenv("USER_DIRECTORY_BREAKER_FAILURES", "5"))
+USER_DIRECTORY_BREAKER_RESET_SECONDS = float(os.getenv("USER_DIRECTORY_BREAKER_RESET_SECONDS", "30"))
+# Bulk lookup endpoint (POST {"user_ids": [...]}); leave empty to resolve batches with parallel single lookups
+USER_DIRECTORY_BATCH_PATH = os.getenv("USER_DIRECTORY_BATCH_PATH", "admin/users/batch")
+USER_DIRECTORY_FALLBACK_CONCURRENCY = int(os.getenv("USER_DIRECTORY_FALLBACK_CONCURRENCY", "8"))
+# After the batch endpoint rejects a token (401/403/422), that token uses single lookups for this long
+USER_DIRECTORY_BATCH_DENIED_COOLDOWN_SECONDS = float(os.getenv("USER_DIRECTORY_BATCH_DENIED_COOLDOWN_SECONDS", "600"))
+
+# Token used for service-to-service calls to the Login service (e.g. resolving notification recipients)
+INTERNAL_SERVICE_TOKEN = os.getenv("INTERNAL_SERVICE_TOKEN")
+
+# Notification outbox workers (see app/services/notification_worker.py)
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "2"))
+NOTIFICATION_MAX_CONCURRENT_SENDS = int(os.getenv("NOTIFICATION_MAX_CONCURRENT_SENDS", "4"))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "20"))
+NOTIFICATION_POLL_INTERVAL = float(os.getenv("NOTIFICATION_POLL_INTERVAL", "5"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "6"))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", "30"))
+NOTIFICATION_RETRY_MAX_SECONDS = float(os.getenv("NOTIFICATION_RETRY_MAX_SECONDS", "3600"))
+NOTIFICATION_STALE_LOCK_SECONDS = int(os.getenv("NOTIFICATION_STALE_LOCK_SECONDS", "600"))
+
+# Recurring task scheduler: templates materialized per transaction
+RECURRING_TASK_BATCH_SIZE = int(os.getenv("RECURRING_TASK_BATCH_SIZE", "500"))
+# Agencies materialized in parallel (1 = serial), on a "thread" or "process" pool
+RECURRING_SCHEDULER_WORKERS = int(os.getenv("RECURRING_SCHEDULER_WORKERS", "1"))
+RECURRING_SCHEDULER_EXECUTOR = os.getenv("RECURRING_SCHEDULER_EXECUTOR", "thread")
+
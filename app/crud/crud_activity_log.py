@@ -30,6 +30,7 @@ def create_activity_log(
     from_value: Optional[dict] = None,
     to_value: Optional[dict] = None
 ) -> ActivityLog:
+    """Add an activity log to the caller's transaction (flushed, not committed)"""
     activity_log = ActivityLog(
         task_id=task_id,
         user_id=user_id,
@@ -40,7 +41,6 @@ def create_activity_log(
         to_value=to_value
     )
     db.add(activity_log)
-    db.commit()
-    db.refresh(activity_log)
+    db.flush()
     return activity_log
 
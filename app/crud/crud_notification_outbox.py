@@ -0,0 +1,131 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, func
+from uuid import UUID
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime, timedelta
+
+from app.models.notification_outbox import NotificationOutbox, NotificationStatus
+
+def enqueue_notifications(
+    db: Session,
+    kind: str,
+    recipients: Dict[str, Optional[str]],
+    payload: dict
+) -> List[NotificationOutbox]:
+    """Add one notification per recipient (user_id -> email, if already known) to the caller's transaction (no commit)"""
+    now = datetime.utcnow()
+    notifications = [
+        NotificationOutbox(
+            kind=kind,
+            recipient_user_id=UUID(str(user_id)),
+            to_email=to_email,
+            payload=payload,
+            status=NotificationStatus.pending,
+            attempts=0,
+            next_attempt_at=now,
+            created_at=now
+        )
+        for user_id, to_email in recipients.items()
+    ]
+    if not notifications:
+        return []
+
+    db.add_all(notifications)
+    db.flush()
+    return notifications
+
+def claim_due_notifications(
+    db: Session,
+    limit: int,
+    stale_lock_seconds: int
+) -> List[NotificationOutbox]:
+    """Claim up to `limit` due notifications for this worker.
+
+    Rows are locked with SKIP LOCKED so concurrent workers (in this or other processes) never
+    claim the same notification. Rows stuck in 'sending' longer than stale_lock_seconds (e.g.
+    the process died mid-send) are claimed again.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=stale_lock_seconds)
+
+    notifications = db.query(NotificationOutbox).filter(
+        or_(
+            and_(
+                NotificationOutbox.status == NotificationStatus.pending,
+                NotificationOutbox.next_attempt_at <= now
+            ),
+            and_(
+                NotificationOutbox.status == NotificationStatus.sending,
+                NotificationOutbox.locked_at < stale_before
+            )
+        )
+    ).order_by(
+        NotificationOutbox.next_attempt_at.asc()
+    ).limit(limit).with_for_update(skip_locked=True).all()
+
+    for notification in notifications:
+        notification.status = NotificationStatus.sending
+        notification.locked_at = now
+        notification.attempts = (notification.attempts or 0) + 1
+    db.commit()
+
+    return notifications
+
+def set_notification_email(
+    db: Session,
+    notification_id: UUID,
+    to_email: str
+) -> None:
+    """Remember a recipient email resolved by the worker"""
+    db.query(NotificationOutbox).filter(
+        NotificationOutbox.id == notification_id
+    ).update({"to_email": to_email}, synchronize_session=False)
+    db.commit()
+
+def mark_notification_sent(db: Session, notification_id: UUID) -> None:
+    """Mark a notification as delivered"""
+    db.query(NotificationOutbox).filter(
+        NotificationOutbox.id == notification_id
+    ).update({
+        "status": NotificationStatus.sent,
+        "sent_at": datetime.utcnow(),
+        "locked_at": None,
+        "last_error": None
+    }, synchronize_session=False)
+    db.commit()
+
+def mark_notification_failed(
+    db: Session,
+    notification_id: UUID,
+    error: str,
+    retry_in_seconds: Optional[float]
+) -> None:
+    """Record a failed attempt. Schedules a retry, or gives up when retry_in_seconds is None."""
+    values = {
+        "locked_at": None,
+        "last_error": (error or "")[:2000]
+    }
+    if retry_in_seconds is None:
+        values["status"] = NotificationStatus.failed
+    else:
+        values["status"] = NotificationStatus.pending
+        values["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=retry_in_seconds)
+
+    db.query(NotificationOutbox).filter(
+        NotificationOutbox.id == notification_id
+    ).update(values, synchronize_session=False)
+    db.commit()
+
+def count_notifications_by_status(
+    db: Session,
+    statuses: Iterable[NotificationStatus] = (NotificationStatus.pending, NotificationStatus.sending)
+) -> Dict[str, int]:
+    """Count queued notifications per status (queue depth)"""
+    rows = db.query(NotificationOutbox.status, func.count(NotificationOutbox.id)).filter(
+        NotificationOutbox.status.in_(list(statuses))
+    ).group_by(NotificationOutbox.status).all()
+
+    counts = {s.value: 0 for s in statuses}
+    for status, count in rows:
+        counts[status.value] = count
+    return counts
@@ -1,19 +1,25 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from uuid import UUID
-from datetime import datetime, date
-from typing import List, Optional
+from sqlalchemy import and_, or_, update, bindparam, func, case, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from uuid import UUID, uuid4
+from datetime import datetime, date, timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import calendar
 
 from app.models.recurring_task import RecurringTask, RecurrenceFrequency
+from app.models.recurring_task_occurrence import RecurringTaskOccurrence
 from app.schemas.recurring_task import RecurringTaskCreate, RecurringTaskUpdate
 
-def create_recurring_task(
+# Upper bound on candidate dates examined when looking for the next occurrence
+_MAX_NEXT_RUN_CANDIDATES = 500
+
+def add_recurring_task(
     db: Session,
     recurring_task: RecurringTaskCreate,
     agency_id: UUID,
     user_id: UUID
 ) -> RecurringTask:
-    """Create a new recurring task template"""
+    """Add a new recurring task template to the session (no commit)"""
     task_data = recurring_task.model_dump(exclude={"document_request"})
     document_request = recurring_task.document_request.model_dump() if recurring_task.document_request else None
     
@@ -23,9 +29,21 @@ def create_recurring_task(
         created_by=user_id,
         document_request=document_request
     )
+    refresh_next_run_date(db_recurring_task)
     db.add(db_recurring_task)
+    db.flush()
+    
+    return db_recurring_task
+
+def create_recurring_task(
+    db: Session,
+    recurring_task: RecurringTaskCreate,
+    agency_id: UUID,
+    user_id: UUID
+) -> RecurringTask:
+    """Create a new recurring task template"""
+    db_recurring_task = add_recurring_task(db, recurring_task, agency_id, user_id)
     db.commit()
-    db.refresh(db_recurring_task)
     
     return db_recurring_task
 
@@ -42,6 +60,15 @@ def get_recurring_task(
         )
     ).first()
 
+def get_recurring_tasks_by_ids(
+    db: Session,
+    recurring_task_ids: List[UUID]
+) -> List[RecurringTask]:
+    """Get recurring tasks by ID"""
+    if not recurring_task_ids:
+        return []
+    return db.query(RecurringTask).filter(RecurringTask.id.in_(recurring_task_ids)).all()
+
 def get_recurring_tasks_by_agency(
     db: Session,
     agency_id: UUID,
@@ -83,6 +110,7 @@ def update_recurring_task(
             setattr(db_recurring_task, key, value)
     
     db_recurring_task.updated_at = datetime.utcnow()
+    refresh_next_run_date(db_recurring_task)
     db.commit()
     db.refresh(db_recurring_task)
     
@@ -106,35 +134,72 @@ def get_active_recurring_tasks_due(
     db: Session,
     check_date: date
 ) -> List[RecurringTask]:
-    """Get all active recurring tasks that should create tasks on the given date"""
-    from datetime import timedelta
+    """Get all active recurring tasks that should create tasks on the given date.
     
-    active_tasks = db.query(RecurringTask).filter(
+    Only templates whose next_run_date is on or before check_date are loaded (index range scan).
+    Candidates that turn out not to be due (missed run, already ran today) are moved
+    forward to their next occurrence, unless check_date is in the future: advancing from a
+    future date would skip every occurrence between today and that date.
+    """
+    candidates = db.query(RecurringTask).filter(
         RecurringTask.is_active == True,
-        RecurringTask.start_date <= check_date,
-        or_(
-            RecurringTask.end_date.is_(None),
-            RecurringTask.end_date >= check_date
-        )
+        RecurringTask.next_run_date.isnot(None),
+        RecurringTask.next_run_date <= check_date
     ).all()
     
     due_tasks = []
-    for task in active_tasks:
+    advanced = False
+    can_advance = check_date <= date.today()
+    for task in candidates:
         if should_create_task_today(task, check_date):
             due_tasks.append(task)
+        elif can_advance:
+            task.next_run_date = compute_next_run_date(task, check_date + timedelta(days=1))
+            advanced = True
+    
+    if advanced:
+        db.commit()
     
     return due_tasks
 
+def get_active_recurring_tasks_between(
+    db: Session,
+    from_date: date,
+    to_date: date
+) -> List[RecurringTask]:
+    """Get active recurring tasks whose start/end window overlaps the given date range"""
+    return db.query(RecurringTask).filter(
+        RecurringTask.is_active == True,
+        RecurringTask.start_date <= to_date,
+        or_(
+            RecurringTask.end_date.is_(None),
+            RecurringTask.end_date >= from_date
+        )
+    ).all()
+
+def get_active_recurring_tasks_scheduled_through(
+    db: Session,
+    check_date: date
+) -> List[RecurringTask]:
+    """Get active recurring tasks with a scheduled run on or before the given date (including missed runs)"""
+    return db.query(RecurringTask).filter(
+        RecurringTask.is_active == True,
+        RecurringTask.next_run_date.isnot(None),
+        RecurringTask.next_run_date <= check_date
+    ).all()
+
 def should_create_task_today(recurring_task: RecurringTask, check_date: date) -> bool:
     """Determine if a task should be created on the given date based on recurrence pattern"""
-    from datetime import timedelta
-    
     # Check if we've already created a task today
     if recurring_task.last_created_at:
         last_created = recurring_task.last_created_at.date()
         if last_created == check_date:
             return False
     
+    return matches_recurrence_pattern(recurring_task, check_date)
+
+def matches_recurrence_pattern(recurring_task: RecurringTask, check_date: date) -> bool:
+    """Check whether the given date is an occurrence of the template's recurrence pattern"""
     # Check if start_date has passed
     if check_date < recurring_task.start_date:
         return False
@@ -184,16 +249,173 @@ def should_create_task_today(recurring_task: RecurringTask, check_date: date) ->
     
     return False
 
+def _candidate_dates(recurring_task: RecurringTask, from_date: date) -> Iterator[date]:
+    """Yield increasing dates >= from_date that may match the pattern, stepping by the interval"""
+    start = recurring_task.start_date
+    interval = recurring_task.interval or 1
+    
+    if recurring_task.frequency in (RecurrenceFrequency.daily, RecurrenceFrequency.weekly):
+        step = interval if recurring_task.frequency == RecurrenceFrequency.daily else interval * 7
+        steps = -(-(from_date - start).days // step)  # Ceiling division
+        candidate = start + timedelta(days=steps * step)
+        while True:
+            yield candidate
+            candidate += timedelta(days=step)
+    
+    elif recurring_task.frequency == RecurrenceFrequency.monthly:
+        months = (from_date.year - start.year) * 12 + (from_date.month - start.month)
+        months += -months % interval  # Round up to the next month in the interval
+        while True:
+            year, month = start.year + (start.month - 1 + months) // 12, (start.month - 1 + months) % 12 + 1
+            first_day = date(year, month, 1)
+            if recurring_task.day_of_month is not None:
+                if recurring_task.day_of_month <= calendar.monthrange(year, month)[1]:
+                    yield date(year, month, recurring_task.day_of_month)
+            elif recurring_task.week_of_month is not None and recurring_task.day_of_week is not None:
+                offset = (recurring_task.day_of_week - first_day.weekday()) % 7
+                yield first_day + timedelta(days=offset + 7 * (recurring_task.week_of_month - 1))
+            else:
+                # No day constraint: every day of a matching month is an occurrence
+                day = max(first_day, from_date)
+                while day.month == month:
+                    yield day
+                    day += timedelta(days=1)
+            months += interval
+    
+    elif recurring_task.frequency == RecurrenceFrequency.yearly:
+        years = from_date.year - start.year
+        years += -years % interval
+        while True:
+            year = start.year + years
+            if start.month != 2 or start.day != 29 or calendar.isleap(year):
+                yield date(year, start.month, start.day)
+            years += interval
+
+def compute_next_run_date(recurring_task: RecurringTask, from_date: date) -> Optional[date]:
+    """Get the first occurrence on or after from_date, or None if the template has no more occurrences"""
+    if not recurring_task.is_active:
+        return None
+    
+    from_date = max(from_date, recurring_task.start_date)
+    for attempt, candidate in enumerate(_candidate_dates(recurring_task, from_date)):
+        if recurring_task.end_date and candidate > recurring_task.end_date:
+            return None
+        if candidate >= from_date and matches_recurrence_pattern(recurring_task, candidate):
+            return candidate
+        if attempt >= _MAX_NEXT_RUN_CANDIDATES:
+            # Pattern that can never match (e.g. weekly on a weekday other than the start date's)
+            return None
+    return None
+
+def get_occurrence_dates(recurring_task: RecurringTask, from_date: date, to_date: date) -> List[date]:
+    """Expand the template's occurrences within [from_date, to_date] by stepping through its interval.
+    
+    Dates before occurrences_tracked_from are left out: the scheduler may already have created
+    tasks for them before occurrences were recorded, and nothing would stop a duplicate.
+    """
+    occurrences = []
+    from_date = max(from_date, recurring_task.start_date, recurring_task.occurrences_tracked_from or from_date)
+    if recurring_task.end_date:
+        to_date = min(to_date, recurring_task.end_date)
+    if from_date > to_date:
+        return occurrences
+    
+    # Candidates increase monotonically, so the loop always ends past to_date
+    for candidate in _candidate_dates(recurring_task, from_date):
+        if candidate > to_date:
+            break
+        if candidate >= from_date and matches_recurrence_pattern(recurring_task, candidate):
+            occurrences.append(candidate)
+    return occurrences
+
+def refresh_next_run_date(recurring_task: RecurringTask, today: Optional[date] = None) -> None:
+    """Recompute next_run_date after the template was created or changed"""
+    today = today or date.today()
+    if recurring_task.last_created_at and recurring_task.last_created_at.date() >= today:
+        # Already ran today
+        today = recurring_task.last_created_at.date() + timedelta(days=1)
+    recurring_task.next_run_date = compute_next_run_date(recurring_task, today)
+
 def update_last_created_at(
     db: Session,
     recurring_task_id: UUID,
-    created_at: datetime
+    created_at: datetime,
+    run_date: Optional[date] = None
 ) -> None:
-    """Update the last_created_at timestamp for a recurring task"""
+    """Update the last_created_at timestamp for a recurring task and schedule its next run"""
     db_recurring_task = db.query(RecurringTask).filter(
         RecurringTask.id == recurring_task_id
     ).first()
     if db_recurring_task:
         db_recurring_task.last_created_at = created_at
+        run_date = run_date or created_at.date()
+        db_recurring_task.next_run_date = compute_next_run_date(db_recurring_task, run_date + timedelta(days=1))
         db.commit()
 
+def bulk_mark_recurring_tasks_run(
+    db: Session,
+    recurring_tasks: List[RecurringTask],
+    run_dates: Dict[UUID, date],
+    created_at: datetime
+) -> None:
+    """Record runs for many templates with one executemany UPDATE (no commit).
+    
+    run_dates maps template id -> latest occurrence date created for it. Neither
+    last_created_at nor next_run_date ever moves backwards, so backfilling past
+    dates leaves the regular schedule untouched. A template with no occurrence left
+    (ended) gets next_run_date NULL.
+    """
+    if not recurring_tasks:
+        return
+    
+    rows = [
+        {
+            "b_id": recurring_task.id,
+            "b_last_created_at": created_at,
+            "b_next_run_date": compute_next_run_date(recurring_task, run_dates[recurring_task.id] + timedelta(days=1)),
+        }
+        for recurring_task in recurring_tasks
+    ]
+    table = RecurringTask.__table__
+    next_run_date = bindparam("b_next_run_date", type_=Date)
+    stmt = update(table).where(
+        table.c.id == bindparam("b_id")
+    ).values(
+        last_created_at=func.greatest(table.c.last_created_at, bindparam("b_last_created_at")),
+        # greatest() ignores NULL, so an ended template is cleared explicitly
+        next_run_date=case(
+            (next_run_date.is_(None), None),
+            else_=func.greatest(table.c.next_run_date, next_run_date)
+        )
+    )
+    db.connection().execute(stmt, rows)
+
+def claim_occurrences(
+    db: Session,
+    occurrences: List[Tuple[UUID, date, UUID]]
+) -> Set[Tuple[UUID, date]]:
+    """Record (template id, occurrence date, task id) rows, skipping ones that already exist.
+    
+    Returns the (template id, occurrence date) pairs inserted by this call; only those
+    should get a task. Nothing is committed.
+    """
+    if not occurrences:
+        return set()
+    
+    now = datetime.utcnow()
+    stmt = pg_insert(RecurringTaskOccurrence.__table__).values([
+        {
+            "id": uuid4(),
+            "recurring_task_id": recurring_task_id,
+            "occurrence_date": occurrence_date,
+            "task_id": task_id,
+            "created_at": now,
+        }
+        for recurring_task_id, occurrence_date, task_id in occurrences
+    ]).on_conflict_do_nothing(
+        constraint="uq_recurring_task_occurrence"
+    ).returning(
+        RecurringTaskOccurrence.__table__.c.recurring_task_id,
+        RecurringTaskOccurrence.__table__.c.occurrence_date
+    )
+    return {(row[0], row[1]) for row in db.execute(stmt)}
@@ -1,13 +1,19 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func
-from uuid import UUID
+from sqlalchemy.orm import Session, joinedload, selectinload
+import base64
+import binascii
+import json
+from sqlalchemy import and_, or_, func, update, select, literal, insert, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from uuid import UUID, uuid4
 from datetime import datetime
-from typing import List, Optional, Any, Dict
+from typing import List, Optional, Any, Dict, Tuple
 
 from app.models.task import Task, TaskStatus
+from app.models.task_number_counter import TaskNumberCounter
 from app.models.activity_log import ActivityLog
 from app.schemas.task import TaskCreate, TaskUpdate
 from app.schemas.activity_log import ActivityLogBase
+from app.crud import crud_time_bucket
 
 def convert_uuid_to_str(obj: Any) -> Any:
     """Recursively convert UUID objects to strings for JSON serialization"""
@@ -19,41 +25,86 @@ def convert_uuid_to_str(obj: Any) -> Any:
         return [convert_uuid_to_str(item) for item in obj]
     return obj
 
-def get_next_task_number(db: Session, agency_id: UUID) -> int:
-    """Get the next sequential task number for an agency"""
-    max_task_number = db.query(func.max(Task.task_number)).filter(
-        Task.agency_id == agency_id
+def reserve_task_numbers(db: Session, agency_id: UUID, count: int = 1) -> List[int]:
+    """Atomically reserve `count` consecutive task numbers for an agency in one round trip.
+    
+    The counter row stays locked until the caller's transaction ends, so concurrent creates
+    in the same agency are serialized on it and never receive the same number.
+    """
+    if count < 1:
+        return []
+    
+    C = TaskNumberCounter
+    last_number = db.execute(
+        update(C.__table__)
+        .where(C.agency_id == agency_id)
+        .values(last_number=C.last_number + count, updated_at=func.now())
+        .returning(C.last_number)
     ).scalar()
-    if max_task_number is None:
-        return 1
-    return max_task_number + 1
+    
+    if last_number is None:
+        # First allocation for this agency: seed the counter from existing tasks.
+        # ON CONFLICT covers a concurrent first allocation that created the row in the meantime.
+        seeded = select(
+            literal(agency_id, type_=C.agency_id.type),
+            func.coalesce(func.max(Task.task_number), 0) + count,
+            func.now()
+        ).where(Task.agency_id == agency_id)
+        stmt = pg_insert(C.__table__).from_select(["agency_id", "last_number", "updated_at"], seeded)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[C.agency_id],
+            set_={"last_number": C.last_number + count, "updated_at": func.now()}
+        ).returning(C.last_number)
+        last_number = db.execute(stmt).scalar()
+    
+    return list(range(last_number - count + 1, last_number + 1))
+
+def get_next_task_number(db: Session, agency_id: UUID) -> int:
+    """Allocate the next sequential task number for an agency"""
+    return reserve_task_numbers(db, agency_id, 1)[0]
 
 
-def create_task(db: Session, task: TaskCreate, agency_id: UUID, user_id: UUID) -> Task:
+def _prepare_task_data(task: TaskCreate) -> Dict[str, Any]:
+    """Column values from a TaskCreate, with the JSON fields made serializable"""
     # Only exclude JSON fields that need special handling
     task_data = task.model_dump(exclude={
         "document_request", 
         "checklist"
     })
-    document_request = convert_uuid_to_str(task.document_request.model_dump()) if task.document_request else None
-    checklist = convert_uuid_to_str(task.checklist.model_dump()) if task.checklist else None
+    task_data["document_request"] = convert_uuid_to_str(task.document_request.model_dump()) if task.document_request else None
+    task_data["checklist"] = convert_uuid_to_str(task.checklist.model_dump()) if task.checklist else None
+    return task_data
+
+def add_task(
+    db: Session,
+    task: TaskCreate,
+    agency_id: UUID,
+    user_id: UUID,
+    task_number: Optional[int] = None,
+    created_by_name: Optional[str] = None,
+    created_by_role: Optional[str] = None
+) -> Task:
+    """Add a task and its creation activity log to the session and flush them (no commit).
+    
+    Pass task_number when it was already taken from reserve_task_numbers.
+    """
+    task_data = _prepare_task_data(task)
     
     # Get next task number
-    task_number = get_next_task_number(db, agency_id)
+    if task_number is None:
+        task_number = get_next_task_number(db, agency_id)
     
     db_task = Task(
         **task_data,
         agency_id=agency_id,
         task_number=task_number,
         created_by=user_id,
-        created_by_name=None,  # Will be set by router with user context
-        document_request=document_request,
-        checklist=checklist,
+        created_by_name=created_by_name,
+        created_by_role=created_by_role,
         status=TaskStatus.pending
     )
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    db.flush()
     
     # Create activity log
     activity_log = ActivityLog(
@@ -65,20 +116,103 @@ def create_task(db: Session, task: TaskCreate, agency_id: UUID, user_id: UUID) -
         to_value={"title": db_task.title, "status": db_task.status.value}
     )
     db.add(activity_log)
-    db.commit()
+    db.flush()
     
     return db_task
 
+def create_task(db: Session, task: TaskCreate, agency_id: UUID, user_id: UUID, task_number: Optional[int] = None) -> Task:
+    """Create a task and its activity log in one commit"""
+    db_task = add_task(db, task, agency_id, user_id, task_number)
+    db.commit()
+    return db_task
+
+def build_task_rows(
+    task: TaskCreate,
+    agency_id: UUID,
+    user_id: UUID,
+    task_number: int,
+    created_at: datetime,
+    task_id: Optional[UUID] = None
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Build the tasks and task_activity_logs row values for a new task, for bulk_insert_tasks"""
+    task_id = task_id or uuid4()
+    task_row = _prepare_task_data(task)
+    task_row.update({
+        "id": task_id,
+        "agency_id": agency_id,
+        "task_number": task_number,
+        "created_by": user_id,
+        "created_by_name": None,
+        "status": TaskStatus.pending,
+        "created_at": created_at,
+        "updated_at": created_at,
+    })
+    activity_row = {
+        "id": uuid4(),
+        "task_id": task_id,
+        "user_id": user_id,
+        "action": f"Task created: {task.title}",
+        "details": f"Task '{task.title}' was created",
+        "event_type": "task_created",
+        "from_value": None,
+        "to_value": {"title": task.title, "status": TaskStatus.pending.value},
+        "created_at": created_at,
+    }
+    return task_row, activity_row
+
+def bulk_insert_tasks(
+    db: Session,
+    task_rows: List[Dict[str, Any]],
+    activity_rows: List[Dict[str, Any]]
+) -> None:
+    """Insert many tasks and their activity logs with one executemany each (no commit)"""
+    if task_rows:
+        db.execute(insert(Task.__table__), task_rows)
+    if activity_rows:
+        db.execute(insert(ActivityLog.__table__), activity_rows)
+
+def task_exists(db: Session, task_id: UUID, agency_id: UUID) -> bool:
+    """Whether the task belongs to the agency, without loading the row (SELECT 1)"""
+    return db.query(
+        select(literal(1)).where(and_(Task.id == task_id, Task.agency_id == agency_id)).exists()
+    ).scalar()
+
 def get_task(db: Session, task_id: UUID, agency_id: UUID) -> Optional[Task]:
-    return db.query(Task).options(
-        joinedload(Task.subtasks),
-        joinedload(Task.timers),
-        joinedload(Task.activity_logs),
-        joinedload(Task.stage)  # Load stage relationship
-    ).filter(
+    """The task row only; its relationships stay lazy"""
+    return db.query(Task).filter(
         and_(Task.id == task_id, Task.agency_id == agency_id)
     ).first()
 
+def get_task_detail(
+    db: Session,
+    task_id: UUID,
+    agency_id: UUID,
+    include_timers: bool = False,
+    include_activity_logs: bool = False
+) -> Optional[Task]:
+    """The task with the subtasks and stage rendered on its detail; timers and activity logs only if asked for"""
+    options = [selectinload(Task.subtasks), joinedload(Task.stage)]
+    if include_timers:
+        options.append(selectinload(Task.timers))
+    if include_activity_logs:
+        options.append(selectinload(Task.activity_logs))
+    return db.query(Task).options(*options).filter(
+        and_(Task.id == task_id, Task.agency_id == agency_id)
+    ).first()
+
+def encode_task_cursor(task: Task) -> str:
+    """Opaque keyset cursor pointing just after the given task in the task list order"""
+    payload = json.dumps({"c": task.created_at.isoformat(), "i": str(task.id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_task_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Decode a cursor from encode_task_cursor. Raises ValueError if it is malformed."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(payload["c"]), UUID(payload["i"])
+    except (TypeError, KeyError, binascii.Error, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
 def get_tasks_by_agency(
     db: Session,
     agency_id: UUID,
@@ -87,7 +221,8 @@ def get_tasks_by_agency(
     status: Optional[TaskStatus] = None,
     skip: int = 0,
     limit: int = 100,
-    user_id: Optional[UUID] = None  # Include tasks where user is a collaborator
+    user_id: Optional[UUID] = None,  # Include tasks where user is a collaborator
+    cursor: Optional[Tuple[datetime, UUID]] = None  # Keyset position from decode_task_cursor (skip is ignored)
 ) -> List[Task]:
     from app.models.task_collaborator import TaskCollaborator
     from sqlalchemy import or_
@@ -118,21 +253,32 @@ def get_tasks_by_agency(
         # For now, show all tasks - collaborators will see tasks they're added to via access control
         pass  # Removed filter to show all tasks
     
-    results = query.order_by(Task.created_at.desc()).offset(skip).limit(limit).all()
+    # (created_at, id) gives a stable total order; served by ix_tasks_agency_created_at_id
+    query = query.order_by(Task.created_at.desc(), Task.id.desc())
+    if cursor:
+        query = query.filter(tuple_(Task.created_at, Task.id) < tuple_(literal(cursor[0]), literal(cursor[1])))
+    else:
+        query = query.offset(skip)
+    
+    results = query.limit(limit).all()
     logger.info(f"Query returned {len(results)} tasks")
     
     return results
 
-def update_task(
+def apply_task_update(
     db: Session,
     task_id: UUID,
     task_update: TaskUpdate,
     agency_id: UUID,
-    user_id: UUID
+    user_id: UUID,
+    updated_by_name: Optional[str] = None,
+    updated_by_role: Optional[str] = None
 ) -> Optional[Task]:
-    db_task = get_task(db, task_id, agency_id)
+    """Apply an update and its activity logs to the session and flush them (no commit)"""
+    db_task = get_task_detail(db, task_id, agency_id)
     if not db_task:
         return None
+    old_client_id = db_task.client_id
     
     # Track changes for activity log
     changes = []
@@ -214,10 +360,10 @@ def update_task(
     
     # Set updated_by and updated_at
     db_task.updated_by = user_id
-    db_task.updated_by_name = None  # Will be set by router with user context
+    db_task.updated_by_name = updated_by_name
+    if updated_by_role is not None:
+        db_task.updated_by_role = updated_by_role
     db_task.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_task)
     
     # Create activity log for changes
     if changes:
@@ -232,8 +378,25 @@ def update_task(
             to_value={c["field"]: c["to"] for c in changes}
         )
         db.add(activity_log)
-        db.commit()
     
+    # The timesheet groups and filters by the client stored on the buckets
+    if db_task.client_id != old_client_id:
+        crud_time_bucket.set_task_client(db, db_task.id, db_task.client_id)
+    db.flush()
+    
+    return db_task
+
+def update_task(
+    db: Session,
+    task_id: UUID,
+    task_update: TaskUpdate,
+    agency_id: UUID,
+    user_id: UUID
+) -> Optional[Task]:
+    """Update a task and log the changes in one commit"""
+    db_task = apply_task_update(db, task_id, task_update, agency_id, user_id)
+    if db_task:
+        db.commit()
     return db_task
 
 def delete_task(db: Session, task_id: UUID, agency_id: UUID, user_id: UUID) -> bool:
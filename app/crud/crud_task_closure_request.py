@@ -12,7 +12,7 @@ def create_closure_request(
     closure_request: TaskClosureRequestCreate,
     requested_by: UUID
 ) -> TaskClosureRequest:
-    """Create a new task closure request"""
+    """Add a new task closure request to the caller's transaction (flushed, not committed)"""
     # Check if there's already a pending request for this task
     existing = db.query(TaskClosureRequest).filter(
         and_(
@@ -31,8 +31,7 @@ def create_closure_request(
         status=ClosureRequestStatus.pending
     )
     db.add(db_request)
-    db.commit()
-    db.refresh(db_request)
+    db.flush()
     return db_request
 
 def get_closure_request(
@@ -67,7 +66,7 @@ def update_closure_request(
     closure_request_update: TaskClosureRequestUpdate,
     reviewed_by: UUID
 ) -> Optional[TaskClosureRequest]:
-    """Update a closure request (approve/reject)"""
+    """Approve or reject a closure request in the caller's transaction (flushed, not committed)"""
     db_request = get_closure_request(db, request_id, task_id)
     if not db_request:
         return None
@@ -78,8 +77,7 @@ def update_closure_request(
     if closure_request_update.reason:
         db_request.reason = closure_request_update.reason
     
-    db.commit()
-    db.refresh(db_request)
+    db.flush()
     return db_request
 
 def get_closure_requests_by_task(
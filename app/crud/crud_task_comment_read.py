@@ -1,47 +1,74 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from uuid import UUID
-from typing import List, Optional
+from sqlalchemy import and_, or_, case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from uuid import UUID, uuid4
+from typing import List, Optional, Set
 from datetime import datetime
 
-from app.models.task_comment_read import TaskCommentRead
+from app.models.task_comment_read_watermark import TaskCommentReadWatermark
 from app.models.task_comment import TaskComment
-from app.schemas.task_comment_read import TaskCommentReadCreate
+
+def get_read_watermark(
+    db: Session,
+    task_id: UUID,
+    user_id: UUID
+) -> Optional[TaskCommentReadWatermark]:
+    """Get the user's read position in a task's chat"""
+    return db.query(TaskCommentReadWatermark).filter(
+        and_(
+            TaskCommentReadWatermark.task_id == task_id,
+            TaskCommentReadWatermark.user_id == user_id
+        )
+    ).first()
+
+def _advance_read_watermark(
+    db: Session,
+    task_id: UUID,
+    user_id: UUID,
+    comment_id: UUID,
+    comment_created_at: datetime,
+    user_name: Optional[str] = None
+) -> None:
+    """Move the watermark forward to the given comment (never backwards) in one upsert"""
+    W = TaskCommentReadWatermark
+    stmt = pg_insert(W).values(
+        id=uuid4(),
+        task_id=task_id,
+        user_id=user_id,
+        user_name=user_name,
+        last_read_comment_id=comment_id,
+        last_read_comment_at=comment_created_at,
+        read_at=datetime.utcnow()
+    )
+    is_newer = stmt.excluded.last_read_comment_at > W.last_read_comment_at
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_task_comment_read_watermark",
+        set_={
+            "last_read_comment_id": case((is_newer, stmt.excluded.last_read_comment_id), else_=W.last_read_comment_id),
+            "last_read_comment_at": func.greatest(W.last_read_comment_at, stmt.excluded.last_read_comment_at),
+            "read_at": case((is_newer, stmt.excluded.read_at), else_=W.read_at),
+            "user_name": func.coalesce(W.user_name, stmt.excluded.user_name),
+        }
+    )
+    db.execute(stmt)
 
 def mark_comment_as_read(
     db: Session,
     comment_id: UUID,
     user_id: UUID,
     user_name: Optional[str] = None
-) -> TaskCommentRead:
-    """Mark a comment as read by a user"""
-    # Check if already read
-    existing_read = db.query(TaskCommentRead).filter(
-        and_(
-            TaskCommentRead.comment_id == comment_id,
-            TaskCommentRead.user_id == user_id
-        )
+) -> Optional[TaskCommentReadWatermark]:
+    """Mark a comment (and everything before it in the chat) as read by a user"""
+    comment = db.query(TaskComment.task_id, TaskComment.created_at).filter(
+        TaskComment.id == comment_id
     ).first()
+    if not comment:
+        return None
     
-    if existing_read:
-        # Update user_name if provided and not already set
-        if user_name and not existing_read.user_name:
-            existing_read.user_name = user_name
-            db.commit()
-            db.refresh(existing_read)
-        return existing_read
-    
-    # Create new read record
-    db_read = TaskCommentRead(
-        comment_id=comment_id,
-        user_id=user_id,
-        user_name=user_name
-    )
-    db.add(db_read)
+    _advance_read_watermark(db, comment.task_id, user_id, comment_id, comment.created_at, user_name)
     db.commit()
-    db.refresh(db_read)
     
-    return db_read
+    return get_read_watermark(db, comment.task_id, user_id)
 
 def mark_all_comments_as_read(
     db: Session,
@@ -49,50 +76,55 @@ def mark_all_comments_as_read(
     user_id: UUID,
     user_name: Optional[str] = None
 ) -> int:
-    """Mark all comments for a task as read by a user"""
-    # Get all comment IDs for this task
-    comment_ids = db.query(TaskComment.id).filter(
+    """Mark all comments for a task as read by a user. Returns the number of newly read comments."""
+    latest_comment = db.query(TaskComment.id, TaskComment.created_at).filter(
         TaskComment.task_id == task_id
-    ).all()
+    ).order_by(TaskComment.created_at.desc()).first()
     
-    if not comment_ids:
+    if not latest_comment:
         return 0
     
-    comment_id_list = [c[0] for c in comment_ids]
+    newly_read_count = get_unread_comment_count(db, task_id, user_id)
+    if newly_read_count == 0:
+        # Nothing to advance; only backfill the display name if it is missing
+        if user_name:
+            watermark = get_read_watermark(db, task_id, user_id)
+            if watermark and not watermark.user_name:
+                watermark.user_name = user_name
+                db.commit()
+        return 0
     
-    # Get already read comments
-    already_read = db.query(TaskCommentRead).filter(
+    _advance_read_watermark(db, task_id, user_id, latest_comment.id, latest_comment.created_at, user_name)
+    db.commit()
+    
+    return newly_read_count
+
+def _unread_comments_query(db: Session, task_id: UUID, user_id: UUID, *columns):
+    """Comments of a task positioned after the user's read watermark"""
+    return db.query(*columns).outerjoin(
+        TaskCommentReadWatermark,
         and_(
-            TaskCommentRead.comment_id.in_(comment_id_list),
-            TaskCommentRead.user_id == user_id
+            TaskCommentReadWatermark.task_id == TaskComment.task_id,
+            TaskCommentReadWatermark.user_id == user_id
         )
+    ).filter(
+        TaskComment.task_id == task_id,
+        or_(
+            TaskCommentReadWatermark.id.is_(None),
+            TaskComment.created_at > TaskCommentReadWatermark.last_read_comment_at
+        )
+    )
+
+def get_unread_comment_ids(
+    db: Session,
+    task_id: UUID,
+    user_id: UUID
+) -> List[UUID]:
+    """Get IDs of the comments the user has not read yet, oldest first"""
+    rows = _unread_comments_query(db, task_id, user_id, TaskComment.id).order_by(
+        TaskComment.created_at.asc()
     ).all()
-    
-    already_read_ids = {r.comment_id for r in already_read}
-    
-    # Update user_name for existing reads if provided and not already set
-    if user_name:
-        for read_record in already_read:
-            if not read_record.user_name:
-                read_record.user_name = user_name
-        if already_read:
-            db.commit()
-    
-    # Create read records for unread comments
-    new_reads = []
-    for comment_id in comment_id_list:
-        if comment_id not in already_read_ids:
-            new_reads.append(TaskCommentRead(
-                comment_id=comment_id,
-                user_id=user_id,
-                user_name=user_name
-            ))
-    
-    if new_reads:
-        db.add_all(new_reads)
-        db.commit()
-    
-    return len(new_reads)
+    return [r[0] for r in rows]
 
 def get_unread_comment_count(
     db: Session,
@@ -100,30 +132,7 @@ def get_unread_comment_count(
     user_id: UUID
 ) -> int:
     """Get count of unread comments for a task by a user"""
-    # Get all comments for this task
-    all_comments = db.query(TaskComment.id).filter(
-        TaskComment.task_id == task_id
-    ).all()
-    
-    if not all_comments:
-        return 0
-    
-    comment_ids = [c[0] for c in all_comments]
-    
-    # Get read comments
-    read_comments = db.query(TaskCommentRead.comment_id).filter(
-        and_(
-            TaskCommentRead.comment_id.in_(comment_ids),
-            TaskCommentRead.user_id == user_id
-        )
-    ).all()
-    
-    read_comment_ids = {r[0] for r in read_comments}
-    
-    # Count unread (comments not in read list)
-    unread_count = len(comment_ids) - len(read_comment_ids)
-    
-    return unread_count
+    return _unread_comments_query(db, task_id, user_id, func.count(TaskComment.id)).scalar() or 0
 
 def has_unread_comments(
     db: Session,
@@ -131,5 +140,47 @@ def has_unread_comments(
     user_id: UUID
 ) -> bool:
     """Check if user has unread comments for a task"""
-    return get_unread_comment_count(db, task_id, user_id) > 0
+    return _unread_comments_query(db, task_id, user_id, TaskComment.id).first() is not None
 
+def get_task_ids_with_unread_comments(
+    db: Session,
+    task_ids: List[UUID],
+    user_id: UUID
+) -> Set[UUID]:
+    """Return the subset of task_ids that have at least one comment unread by the user.
+    
+    Resolves a whole page of tasks in one grouped query instead of two queries per task.
+    """
+    if not task_ids:
+        return set()
+    
+    rows = db.query(TaskComment.task_id).outerjoin(
+        TaskCommentReadWatermark,
+        and_(
+            TaskCommentReadWatermark.task_id == TaskComment.task_id,
+            TaskCommentReadWatermark.user_id == user_id
+        )
+    ).filter(
+        TaskComment.task_id.in_(task_ids),
+        or_(
+            TaskCommentReadWatermark.id.is_(None),
+            TaskComment.created_at > TaskCommentReadWatermark.last_read_comment_at
+        )
+    ).group_by(TaskComment.task_id).all()
+    
+    return {r[0] for r in rows}
+
+def get_comment_readers(
+    db: Session,
+    comment: TaskComment
+) -> List[TaskCommentReadWatermark]:
+    """Get the watermarks of every user who has read the given comment, most recent first.
+    
+    A user has read a comment when their watermark for the task is at or past it.
+    """
+    return db.query(TaskCommentReadWatermark).filter(
+        and_(
+            TaskCommentReadWatermark.task_id == comment.task_id,
+            TaskCommentReadWatermark.last_read_comment_at >= comment.created_at
+        )
+    ).order_by(TaskCommentReadWatermark.read_at.desc()).all()
@@ -0,0 +1,152 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, select, cast, text, literal, BigInteger, extract
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from uuid import UUID
+from typing import Dict, List, Optional
+from datetime import datetime
+
+from app.models.task_timer import TaskTimer
+from app.models.task_time_rollup import TaskTimeRollup
+from app.models.task_user_time_rollup import TaskUserTimeRollup
+
+def add_logged_time(
+    db: Session,
+    task_id: UUID,
+    user_id: UUID,
+    seconds: int
+) -> None:
+    """Add a finished timer entry to the task and (task, user) rollups (no commit)"""
+    now = datetime.utcnow()
+    for model, values, key in (
+        (TaskTimeRollup, {"task_id": task_id}, ["task_id"]),
+        (TaskUserTimeRollup, {"task_id": task_id, "user_id": user_id}, ["task_id", "user_id"]),
+    ):
+        stmt = pg_insert(model.__table__).values(
+            **values,
+            total_seconds=seconds,
+            entry_count=1,
+            updated_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key,
+            set_={
+                "total_seconds": model.total_seconds + stmt.excluded.total_seconds,
+                "entry_count": model.entry_count + 1,
+                "updated_at": stmt.excluded.updated_at,
+            }
+        )
+        db.execute(stmt)
+
+def active_elapsed_seconds():
+    """SQL expression for the live elapsed seconds of a running timer"""
+    return cast(func.floor(extract("epoch", func.now() - TaskTimer.start_time)), BigInteger)
+
+def get_task_logged_totals(db: Session, task_ids: List[UUID]) -> Dict[UUID, int]:
+    """Total logged seconds (rollup plus running timers) for many tasks, e.g. a list page"""
+    if not task_ids:
+        return {}
+
+    totals = {
+        task_id: int(total_seconds)
+        for task_id, total_seconds in db.query(TaskTimeRollup.task_id, TaskTimeRollup.total_seconds).filter(
+            TaskTimeRollup.task_id.in_(task_ids)
+        )
+    }
+
+    running = db.query(TaskTimer.task_id, func.sum(active_elapsed_seconds())).filter(
+        TaskTimer.task_id.in_(task_ids),
+        TaskTimer.is_active == True
+    ).group_by(TaskTimer.task_id)
+    for task_id, elapsed in running:
+        totals[task_id] = totals.get(task_id, 0) + int(elapsed or 0)
+
+    return totals
+
+def _computed_task_totals(task_ids: Optional[List[UUID]] = None):
+    """Task rollups recomputed from raw finished timers"""
+    query = select(
+        TaskTimer.task_id,
+        func.sum(func.coalesce(TaskTimer.duration_seconds, 0)).label("total_seconds"),
+        func.count(TaskTimer.id).label("entry_count")
+    ).where(TaskTimer.is_active == False).group_by(TaskTimer.task_id)
+    if task_ids is not None:
+        query = query.where(TaskTimer.task_id.in_(task_ids))
+    return query
+
+def _computed_user_totals(task_ids: Optional[List[UUID]] = None):
+    """(task, user) rollups recomputed from raw finished timers"""
+    query = select(
+        TaskTimer.task_id,
+        TaskTimer.user_id,
+        func.sum(func.coalesce(TaskTimer.duration_seconds, 0)).label("total_seconds"),
+        func.count(TaskTimer.id).label("entry_count")
+    ).where(TaskTimer.is_active == False).group_by(TaskTimer.task_id, TaskTimer.user_id)
+    if task_ids is not None:
+        query = query.where(TaskTimer.task_id.in_(task_ids))
+    return query
+
+def verify_rollups(db: Session, task_ids: Optional[List[UUID]] = None) -> List[dict]:
+    """Compare the rollups with totals recomputed from raw timers. Returns the rows that drifted."""
+    drift = []
+
+    computed = _computed_task_totals(task_ids).subquery()
+    stored = db.query(TaskTimeRollup)
+    if task_ids is not None:
+        stored = stored.filter(TaskTimeRollup.task_id.in_(task_ids))
+    stored = stored.subquery()
+    rows = db.query(
+        func.coalesce(computed.c.task_id, stored.c.task_id),
+        func.coalesce(computed.c.total_seconds, 0),
+        func.coalesce(stored.c.total_seconds, 0)
+    ).select_from(computed).outerjoin(
+        stored, computed.c.task_id == stored.c.task_id, full=True
+    ).filter(
+        func.coalesce(computed.c.total_seconds, 0) != func.coalesce(stored.c.total_seconds, 0)
+    ).all()
+    for task_id, expected, actual in rows:
+        drift.append({"task_id": task_id, "user_id": None, "expected_seconds": int(expected), "stored_seconds": int(actual)})
+
+    computed = _computed_user_totals(task_ids).subquery()
+    stored = db.query(TaskUserTimeRollup)
+    if task_ids is not None:
+        stored = stored.filter(TaskUserTimeRollup.task_id.in_(task_ids))
+    stored = stored.subquery()
+    rows = db.query(
+        func.coalesce(computed.c.task_id, stored.c.task_id),
+        func.coalesce(computed.c.user_id, stored.c.user_id),
+        func.coalesce(computed.c.total_seconds, 0),
+        func.coalesce(stored.c.total_seconds, 0)
+    ).select_from(computed).outerjoin(
+        stored,
+        and_(computed.c.task_id == stored.c.task_id, computed.c.user_id == stored.c.user_id),
+        full=True
+    ).filter(
+        func.coalesce(computed.c.total_seconds, 0) != func.coalesce(stored.c.total_seconds, 0)
+    ).all()
+    for task_id, user_id, expected, actual in rows:
+        drift.append({"task_id": task_id, "user_id": user_id, "expected_seconds": int(expected), "stored_seconds": int(actual)})
+
+    return drift
+
+def rebuild_rollups(db: Session, task_ids: Optional[List[UUID]] = None) -> None:
+    """Recompute the rollups from raw timers (all tasks, or only task_ids) and commit.
+
+    The rollup tables are locked against concurrent timer events for the duration of the
+    rebuild; those events wait and are applied on top of the rebuilt totals.
+    """
+    db.execute(text("LOCK TABLE task_time_rollups, task_user_time_rollups IN SHARE ROW EXCLUSIVE MODE"))
+    now = datetime.utcnow()
+
+    for model, computed, columns in (
+        (TaskTimeRollup, _computed_task_totals(task_ids), ["task_id", "total_seconds", "entry_count", "updated_at"]),
+        (TaskUserTimeRollup, _computed_user_totals(task_ids), ["task_id", "user_id", "total_seconds", "entry_count", "updated_at"]),
+    ):
+        delete = model.__table__.delete()
+        if task_ids is not None:
+            delete = delete.where(model.__table__.c.task_id.in_(task_ids))
+        db.execute(delete)
+
+        computed = computed.add_columns(literal(now).label("updated_at"))
+        db.execute(pg_insert(model.__table__).from_select(columns, computed))
+
+    db.commit()
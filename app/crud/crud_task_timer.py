@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, desc
+from sqlalchemy import and_, desc, func, select, false
 from uuid import UUID
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional
@@ -7,6 +7,8 @@ from typing import List, Optional
 from app.models.task_timer import TaskTimer
 from app.models.task import Task
 from app.models.activity_log import ActivityLog
+from app.models.task_time_rollup import TaskTimeRollup
+from app.crud import crud_task_time_rollup, crud_time_bucket
 from app.schemas.task_timer import TaskTimerCreate, ManualTimeEntry
 
 def start_timer(
@@ -72,14 +74,14 @@ def stop_timer(
     if not task:
         return None
     
-    # Find active timer for this user and task
+    # Find active timer for this user and task (locked so a concurrent stop cannot count it twice)
     db_timer = db.query(TaskTimer).filter(
         and_(
             TaskTimer.task_id == task_id,
             TaskTimer.user_id == user_id,
             TaskTimer.is_active == True
         )
-    ).first()
+    ).with_for_update().first()
     
     if not db_timer:
         return None
@@ -91,8 +93,10 @@ def stop_timer(
     db_timer.end_time = end_time
     db_timer.duration_seconds = duration
     db_timer.is_active = False
-    db.commit()
-    db.refresh(db_timer)
+    
+    # Update the logged-time rollups and daily buckets in the same transaction as the timer
+    crud_task_time_rollup.add_logged_time(db, task_id, user_id, duration)
+    crud_time_bucket.add_time_to_buckets(db, task, user_id, db_timer.start_time, end_time, duration)
     
     # Create activity log
     activity_log = ActivityLog(
@@ -105,6 +109,7 @@ def stop_timer(
     )
     db.add(activity_log)
     db.commit()
+    db.refresh(db_timer)
     
     return db_timer
 
@@ -134,8 +139,10 @@ def add_manual_time(
         notes=time_entry.notes
     )
     db.add(db_timer)
-    db.commit()
-    db.refresh(db_timer)
+    
+    # Update the logged-time rollups and daily buckets in the same transaction as the timer
+    crud_task_time_rollup.add_logged_time(db, task_id, user_id, time_entry.duration_seconds)
+    crud_time_bucket.add_time_to_buckets(db, task, user_id, db_timer.start_time, db_timer.end_time, time_entry.duration_seconds)
     
     # Create activity log
     activity_log = ActivityLog(
@@ -148,6 +155,7 @@ def add_manual_time(
     )
     db.add(activity_log)
     db.commit()
+    db.refresh(db_timer)
     
     return db_timer
 
@@ -168,3 +176,26 @@ def get_active_timer(db: Session, task_id: UUID, user_id: UUID) -> Optional[Task
         )
     ).first()
 
+def get_logged_time_summary(db: Session, task_id: UUID, user_id: Optional[UUID] = None) -> dict:
+    """Total logged seconds for a task (rollup of finished entries plus live elapsed time of
+    active timers) and whether the given user has a running timer, in one query.
+    
+    Only the task's active timers are scanned; finished entries come from task_time_rollups.
+    """
+    stored_seconds = select(TaskTimeRollup.total_seconds).where(
+        TaskTimeRollup.task_id == task_id
+    ).scalar_subquery()
+    running_for_user = (TaskTimer.user_id == user_id) if user_id else false()
+    
+    total_seconds, is_timer_running_for_me = db.query(
+        func.coalesce(stored_seconds, 0) + func.coalesce(func.sum(crud_task_time_rollup.active_elapsed_seconds()), 0),
+        func.coalesce(func.bool_or(running_for_user), False)
+    ).filter(
+        TaskTimer.task_id == task_id,
+        TaskTimer.is_active == True
+    ).one()
+    
+    return {
+        "total_logged_seconds": int(total_seconds),
+        "is_timer_running_for_me": bool(is_timer_running_for_me)
+    }
@@ -0,0 +1,192 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from uuid import UUID
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, date, timedelta, timezone
+
+from app.models.task import Task
+from app.models.task_timer import TaskTimer
+from app.models.time_bucket_daily import TimeBucketDaily
+
+# Report dimensions accepted by get_timesheet -> bucket column
+TIMESHEET_GROUP_BY = {
+    "user": TimeBucketDaily.user_id,
+    "client": TimeBucketDaily.client_id,
+    "task": TimeBucketDaily.task_id,
+    "date": TimeBucketDaily.bucket_date,
+}
+
+def _as_utc(value: datetime) -> datetime:
+    """Treat naive datetimes as UTC"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def split_seconds_by_day(start_time: datetime, end_time: Optional[datetime], total_seconds: int) -> List[Tuple[date, int]]:
+    """Split a timer entry's seconds across the UTC days it spans.
+
+    Each day gets its share of the wall-clock span; the split always sums to total_seconds.
+    """
+    start = _as_utc(start_time)
+    end = _as_utc(end_time) if end_time else start
+    if end <= start or start.date() == end.date():
+        return [(start.date(), total_seconds)]
+
+    span = (end - start).total_seconds()
+    parts = []
+    day_start = start
+    while day_start < end:
+        next_day = datetime.combine(day_start.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+        day_end = min(next_day, end)
+        parts.append((day_start.date(), int(total_seconds * (day_end - day_start).total_seconds() / span)))
+        day_start = day_end
+
+    # Give the rounding remainder to the last day
+    assigned = sum(seconds for _, seconds in parts)
+    last_date, last_seconds = parts[-1]
+    parts[-1] = (last_date, last_seconds + total_seconds - assigned)
+    return parts
+
+def _bucket_rows(task: Task, user_id: UUID, start_time: datetime, end_time: Optional[datetime], seconds: int) -> List[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "task_id": task.id,
+            "user_id": user_id,
+            "bucket_date": bucket_date,
+            "agency_id": task.agency_id,
+            "client_id": task.client_id,
+            "total_seconds": day_seconds,
+            "entry_count": 1,
+            "updated_at": now,
+        }
+        for bucket_date, day_seconds in split_seconds_by_day(start_time, end_time, seconds)
+    ]
+
+def _upsert_buckets(db: Session, rows: List[dict]) -> None:
+    if not rows:
+        return
+    stmt = pg_insert(TimeBucketDaily.__table__).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["task_id", "user_id", "bucket_date"],
+        set_={
+            "total_seconds": TimeBucketDaily.total_seconds + stmt.excluded.total_seconds,
+            "entry_count": TimeBucketDaily.entry_count + stmt.excluded.entry_count,
+            "client_id": stmt.excluded.client_id,
+            "updated_at": stmt.excluded.updated_at,
+        }
+    )
+    db.execute(stmt)
+
+def add_time_to_buckets(
+    db: Session,
+    task: Task,
+    user_id: UUID,
+    start_time: datetime,
+    end_time: Optional[datetime],
+    seconds: int
+) -> None:
+    """Add a finished timer entry to the daily buckets (no commit)"""
+    _upsert_buckets(db, _bucket_rows(task, user_id, start_time, end_time, seconds))
+
+def set_task_client(db: Session, task_id: UUID, client_id: Optional[UUID]) -> None:
+    """Move a task's buckets to its new client (no commit)"""
+    db.query(TimeBucketDaily).filter(TimeBucketDaily.task_id == task_id).update(
+        {TimeBucketDaily.client_id: client_id}, synchronize_session=False
+    )
+
+def rebuild_buckets_for_tasks(db: Session, task_ids: List[UUID]) -> int:
+    """Recompute the buckets of the given tasks from their finished timers and commit.
+
+    The bucket table is locked against concurrent timer events while the tasks are rebuilt;
+    those events wait and are applied on top. Returns the number of timers processed.
+    """
+    if not task_ids:
+        return 0
+
+    db.execute(text("LOCK TABLE time_buckets_daily IN SHARE ROW EXCLUSIVE MODE"))
+    db.query(TimeBucketDaily).filter(TimeBucketDaily.task_id.in_(task_ids)).delete(synchronize_session=False)
+
+    tasks = {task.id: task for task in db.query(Task).filter(Task.id.in_(task_ids))}
+    timers = db.query(
+        TaskTimer.task_id, TaskTimer.user_id, TaskTimer.start_time, TaskTimer.end_time, TaskTimer.duration_seconds
+    ).filter(
+        TaskTimer.task_id.in_(task_ids),
+        TaskTimer.is_active == False
+    ).all()
+
+    buckets: Dict[Tuple[UUID, UUID, date], dict] = {}
+    for timer in timers:
+        for row in _bucket_rows(tasks[timer.task_id], timer.user_id, timer.start_time, timer.end_time, timer.duration_seconds or 0):
+            key = (row["task_id"], row["user_id"], row["bucket_date"])
+            if key in buckets:
+                buckets[key]["total_seconds"] += row["total_seconds"]
+                buckets[key]["entry_count"] += 1
+            else:
+                buckets[key] = row
+
+    rows = list(buckets.values())
+    for start in range(0, len(rows), 1000):
+        db.execute(pg_insert(TimeBucketDaily.__table__), rows[start:start + 1000])
+    db.commit()
+
+    return len(timers)
+
+def get_task_ids_with_timers(
+    db: Session,
+    agency_id: Optional[UUID] = None,
+    after_task_id: Optional[UUID] = None,
+    limit: int = 500
+) -> List[UUID]:
+    """Page through the IDs of tasks that have timers (ordered by ID), for backfills"""
+    query = db.query(Task.id).filter(
+        db.query(TaskTimer.id).filter(TaskTimer.task_id == Task.id).exists()
+    )
+    if agency_id:
+        query = query.filter(Task.agency_id == agency_id)
+    if after_task_id:
+        query = query.filter(Task.id > after_task_id)
+    return [row[0] for row in query.order_by(Task.id).limit(limit)]
+
+def get_timesheet(
+    db: Session,
+    agency_id: UUID,
+    from_date: date,
+    to_date: date,
+    group_by: List[str],
+    user_id: Optional[UUID] = None,
+    client_id: Optional[UUID] = None,
+    task_id: Optional[UUID] = None
+) -> List[dict]:
+    """Logged seconds between from_date and to_date (inclusive), grouped by the given dimensions"""
+    columns = [TIMESHEET_GROUP_BY[key].label(key) for key in group_by]
+    query = db.query(
+        *columns,
+        func.sum(TimeBucketDaily.total_seconds).label("total_seconds"),
+        func.sum(TimeBucketDaily.entry_count).label("entry_count")
+    ).filter(
+        TimeBucketDaily.agency_id == agency_id,
+        TimeBucketDaily.bucket_date >= from_date,
+        TimeBucketDaily.bucket_date <= to_date
+    )
+
+    if user_id:
+        query = query.filter(TimeBucketDaily.user_id == user_id)
+    if client_id:
+        query = query.filter(TimeBucketDaily.client_id == client_id)
+    if task_id:
+        query = query.filter(TimeBucketDaily.task_id == task_id)
+
+    if columns:
+        query = query.group_by(*columns).order_by(*columns)
+
+    return [
+        {
+            **{key: getattr(row, key) for key in group_by},
+            "total_seconds": int(row.total_seconds or 0),
+            "entry_count": int(row.entry_count or 0),
+        }
+        for row in query.all()
+        if row.total_seconds is not None
+    ]
@@ -1,11 +1,90 @@
+import time
+
+from fastapi import Request, Response
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from . import config
 
-engine = create_engine(config.DATABASE_URL, pool_pre_ping=True)
+# Reads of a client that wrote recently (cookie value: epoch seconds) go to the primary
+READ_PRIMARY_COOKIE = "read_primary_until"
+# Request header forcing reads from the primary ("X-Read-Consistency: primary")
+READ_CONSISTENCY_HEADER = "x-read-consistency"
+
+def _pool_options(pool_size: int, max_overflow: int) -> dict:
+    return {
+        "pool_pre_ping": True,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+    }
+
+def _server_settings() -> dict:
+    return {
+        "statement_timeout": str(config.DB_STATEMENT_TIMEOUT_MS),
+        "idle_in_transaction_session_timeout": str(config.DB_IDLE_IN_TRANSACTION_TIMEOUT_MS),
+    }
+
+def _create_engine(
+    url: str,
+    timeouts: bool = True,
+    pool_size: int = config.DB_POOL_SIZE,
+    max_overflow: int = config.DB_MAX_OVERFLOW
+):
+    connect_args = {}
+    if timeouts:
+        connect_args["options"] = " ".join(f"-c {name}={value}" for name, value in _server_settings().items())
+    return create_engine(url, connect_args=connect_args, **_pool_options(pool_size, max_overflow))
+
+def _create_async_engine(
+    url: str,
+    pool_size: int = config.DB_POOL_SIZE,
+    max_overflow: int = config.DB_MAX_OVERFLOW
+):
+    return create_async_engine(
+        url, connect_args={"server_settings": _server_settings()}, **_pool_options(pool_size, max_overflow)
+    )
+
+# Each engine has its own pool in every process (uvicorn worker). Per worker, at most
+# 2 x (DB_POOL_SIZE + DB_MAX_OVERFLOW) + DB_BATCH_POOL_SIZE + DB_BATCH_MAX_OVERFLOW connections
+# go to the primary, and 2 x (DB_REPLICA_POOL_SIZE + DB_REPLICA_MAX_OVERFLOW) to the replica.
+engine = _create_engine(config.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine for migrations, maintenance rebuilds and scheduler runs: no statement or idle-in-transaction
+# timeouts, since full re-aggregations and catch-up runs outlast any request
+batch_engine = _create_engine(
+    config.DATABASE_URL,
+    timeouts=False,
+    pool_size=config.DB_BATCH_POOL_SIZE,
+    max_overflow=config.DB_BATCH_MAX_OVERFLOW
+)
+BatchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=batch_engine)
+
+# Async engine for the hot endpoints. Objects stay loaded after commit so they can be
+# serialized outside the session; crud functions run on it through AsyncSession.run_sync.
+async_engine = _create_async_engine(config.ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# Read replica (falls back to the primary when DATABASE_REPLICA_URL is not set)
+replica_engine = _create_engine(
+    config.DATABASE_REPLICA_URL,
+    pool_size=config.DB_REPLICA_POOL_SIZE,
+    max_overflow=config.DB_REPLICA_MAX_OVERFLOW
+) if config.DATABASE_REPLICA_URL else None
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else SessionLocal
+async_replica_engine = _create_async_engine(
+    config.ASYNC_DATABASE_REPLICA_URL,
+    pool_size=config.DB_REPLICA_POOL_SIZE,
+    max_overflow=config.DB_REPLICA_MAX_OVERFLOW
+) if config.ASYNC_DATABASE_REPLICA_URL else None
+AsyncReadSessionLocal = (
+    async_sessionmaker(bind=async_replica_engine, autoflush=False, expire_on_commit=False)
+    if async_replica_engine else AsyncSessionLocal
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -15,9 +94,48 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Async session for the request; connects only when first used"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def reads_from_primary(request: Request) -> bool:
+    """Whether the request must read from the primary: asked for explicitly, or the client wrote recently"""
+    if request.headers.get(READ_CONSISTENCY_HEADER, "").lower() == "primary":
+        return True
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def mark_recent_write(response: Response) -> None:
+    """Route the client's reads to the primary for READ_YOUR_WRITES_SECONDS"""
+    if replica_engine is None and async_replica_engine is None:
+        return
+    response.set_cookie(
+        READ_PRIMARY_COOKIE,
+        str(time.time() + config.READ_YOUR_WRITES_SECONDS),
+        max_age=config.READ_YOUR_WRITES_SECONDS,
+        httponly=True,
+        samesite="lax"
+    )
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints: the replica, or the primary right after a write"""
+    db = SessionLocal() if reads_from_primary(request) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    """Async session for read-only endpoints: the replica, or the primary right after a write"""
+    factory = AsyncSessionLocal if reads_from_primary(request) else AsyncReadSessionLocal
+    async with factory() as db:
+        yield db
+
 # Import models to register them with Base
 from app.models import task, todo, task_subtask, task_timer, activity_log, task_stage, task_comment
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Tables are created and migrated at deploy time by app.services.migrate, not on import
 
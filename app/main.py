@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from socketio import ASGIApp
@@ -16,9 +16,11 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-from app.database import get_db
-from app.routers import tasks, todos, recurring_tasks, scheduler, task_stages, task_comments
-from app.socketio_manager import init_socketio
+from app.database import async_engine, async_replica_engine, mark_recent_write
+from app.routers import tasks, todos, recurring_tasks, scheduler, task_stages, task_comments, reports
+from app.socketio_manager import init_socketio, emit_bridge
+from app.dependencies import require_role
+from app.services.notification_worker import start_notification_workers, stop_notification_workers, get_notification_metrics
 
 fastapi_app = FastAPI(title="Task Management API", version="1.0.0")
 logger.info("Task Management API starting up...")
@@ -44,16 +46,15 @@ fastapi_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @fastapi_app.middleware("http")
-async def db_session_middleware(request: Request, call_next):
-    from app.database import SessionLocal
-    request.state.db = SessionLocal()
-    try:
-        response = await call_next(request)
-    finally:
-        request.state.db.close()
+async def read_your_writes_middleware(request: Request, call_next):
+    """After a successful write, send the client's reads to the primary for a short while"""
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        mark_recent_write(response)
     return response
 
 # Include routers
@@ -63,6 +64,7 @@ fastapi_app.include_router(task_comments.router, tags=["task-comments"])
 fastapi_app.include_router(todos.router, prefix="/todos", tags=["todos"])
 fastapi_app.include_router(recurring_tasks.router, tags=["recurring-tasks"])
 fastapi_app.include_router(scheduler.router, tags=["scheduler"])
+fastapi_app.include_router(reports.router, tags=["reports"])
 
 @fastapi_app.get("/")
 def read_root():
@@ -72,14 +74,54 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@fastapi_app.get("/metrics/notifications", dependencies=[Depends(require_role(["CA_ACCOUNTANT", "CA_TEAM"]))])
+def notification_metrics():
+    """Notification outbox queue depth and send latency"""
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        return get_notification_metrics(db)
+    finally:
+        db.close()
+
+@fastapi_app.get("/metrics/realtime", dependencies=[Depends(require_role(["CA_ACCOUNTANT", "CA_TEAM"]))])
+def realtime_metrics():
+    """Socket.IO emits queued by sync endpoints: sent, failed and dropped counts"""
+    return emit_bridge.metrics()
+
+@fastapi_app.on_event("startup")
+def start_background_workers():
+    start_notification_workers()
+
+@fastapi_app.on_event("startup")
+async def start_emit_bridge():
+    emit_bridge.start()
+
+@fastapi_app.on_event("shutdown")
+def stop_background_workers():
+    stop_notification_workers()
+
+@fastapi_app.on_event("shutdown")
+async def flush_socketio_events():
+    from app.socketio_manager import flush_coalesced_events
+    await emit_bridge.stop()
+    await flush_coalesced_events()
+
+@fastapi_app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+
 # Socket.IO event handlers
 @socketio_server.on('connect')
 async def handle_connect(sid, environ, auth):
     """Handle client connection"""
     if auth and 'user_id' in auth:
         user_id = auth['user_id']
-        from app.socketio_manager import register_user_connection
+        from app.socketio_manager import register_user_connection, user_room
         await register_user_connection(user_id, sid)
+        await socketio_server.enter_room(sid, user_room(user_id))
         await socketio_server.emit('connected', {'status': 'ok'}, room=sid)
         return True
     return False
@@ -87,28 +129,24 @@ async def handle_connect(sid, environ, auth):
 @socketio_server.on('disconnect')
 async def handle_disconnect(sid):
     """Handle client disconnection"""
-    from app.socketio_manager import unregister_user_connection, user_connections
-    # Find user_id for this socket
-    for user_id, sockets in user_connections.items():
-        if sid in sockets:
-            await unregister_user_connection(user_id, sid)
-            break
+    from app.socketio_manager import disconnect_socket
+    await disconnect_socket(sid)
 
 @socketio_server.on('join_task')
 async def handle_join_task(sid, data):
     """Handle user joining a task room"""
     if 'task_id' in data and 'user_id' in data:
-        from app.socketio_manager import join_task_room
-        await join_task_room(data['task_id'], data['user_id'])
-        await socketio_server.enter_room(sid, f"task_{data['task_id']}")
+        from app.socketio_manager import join_task_room, task_room
+        await join_task_room(data['task_id'], data['user_id'], sid)
+        await socketio_server.enter_room(sid, task_room(data['task_id']))
 
 @socketio_server.on('leave_task')
 async def handle_leave_task(sid, data):
     """Handle user leaving a task room"""
     if 'task_id' in data and 'user_id' in data:
-        from app.socketio_manager import leave_task_room
-        await leave_task_room(data['task_id'], data['user_id'])
-        await socketio_server.leave_room(sid, f"task_{data['task_id']}")
+        from app.socketio_manager import leave_task_room, task_room
+        await leave_task_room(data['task_id'], data['user_id'], sid)
+        await socketio_server.leave_room(sid, task_room(data['task_id']))
 
 # Wrap FastAPI app with Socket.IO
 app = ASGIApp(socketio_server, fastapi_app)
@@ -8,6 +8,13 @@ from .task_stage import TaskStage
 from .task_comment import TaskComment
 from .task_collaborator import TaskCollaborator
 from .task_comment_read import TaskCommentRead
+from .task_comment_read_watermark import TaskCommentReadWatermark
+from .notification_outbox import NotificationOutbox
+from .task_number_counter import TaskNumberCounter
+from .recurring_task_occurrence import RecurringTaskOccurrence
+from .task_time_rollup import TaskTimeRollup
+from .task_user_time_rollup import TaskUserTimeRollup
+from .time_bucket_daily import TimeBucketDaily
 
-__all__ = ["Task", "Todo", "TaskSubtask", "TaskTimer", "ActivityLog", "RecurringTask", "TaskStage", "TaskComment", "TaskCollaborator", "TaskCommentRead"]
+__all__ = ["Task", "Todo", "TaskSubtask", "TaskTimer", "ActivityLog", "RecurringTask", "TaskStage", "TaskComment", "TaskCollaborator", "TaskCommentRead", "TaskCommentReadWatermark", "NotificationOutbox", "TaskNumberCounter", "RecurringTaskOccurrence", "TaskTimeRollup", "TaskUserTimeRollup", "TimeBucketDaily"]
 
@@ -0,0 +1,33 @@
+import uuid
+from datetime import datetime
+from enum import Enum as PyEnum
+from sqlalchemy import Column, String, DateTime, Integer, JSON, Text, Enum, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.database import Base
+
+class NotificationStatus(PyEnum):
+    pending = "pending"
+    sending = "sending"
+    sent = "sent"
+    failed = "failed"
+
+class NotificationOutbox(Base):
+    """Durable queue of outgoing notifications, drained by the notification worker pool"""
+    __tablename__ = "notification_outbox"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind = Column(String, nullable=False)  # e.g., "task_created", "task_comment"
+    recipient_user_id = Column(UUID(as_uuid=True), nullable=True)
+    to_email = Column(String, nullable=True)  # Resolved by the worker when not known at enqueue time
+    payload = Column(JSON, nullable=False)  # Keyword arguments for the email template
+    status = Column(Enum(NotificationStatus), default=NotificationStatus.pending, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    locked_at = Column(DateTime(timezone=True), nullable=True)  # When a worker claimed it
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_notification_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime, date
 from enum import Enum as PyEnum
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, JSON, Enum, Date, Text, Integer
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, JSON, Enum, Date, Text, Integer, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -51,6 +51,12 @@ class RecurringTask(Base):
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
     last_created_at = Column(DateTime(timezone=True), nullable=True)  # Last time a task was created from this template
+    next_run_date = Column(Date, nullable=True)  # Next date a task is due to be created (None when inactive or finished)
+    occurrences_tracked_from = Column(Date, nullable=True)  # Earlier occurrences predate the occurrence log and are never backfilled (None: full history)
+    
+    __table_args__ = (
+        Index("ix_recurring_tasks_next_run_date_active", "next_run_date", postgresql_where=(is_active == True)),
+    )
     
     # Relationship to track created tasks (optional, for reference)
     # Note: We don't store a direct relationship since tasks are independent entities
@@ -0,0 +1,24 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, Date, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from app.database import Base
+
+class RecurringTaskOccurrence(Base):
+    """One row per (template, occurrence date) that has been materialized into a task.
+
+    The unique key makes scheduler runs idempotent: an occurrence is claimed with
+    INSERT ... ON CONFLICT DO NOTHING before its task is created, so reruns and
+    overlapping backfills never create the same task twice.
+    """
+    __tablename__ = "recurring_task_occurrences"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    recurring_task_id = Column(UUID(as_uuid=True), ForeignKey("recurring_tasks.id", ondelete="CASCADE"), nullable=False)
+    occurrence_date = Column(Date, nullable=False)
+    task_id = Column(UUID(as_uuid=True), nullable=True)  # Task created for this occurrence (not a FK: tasks may be deleted)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('recurring_task_id', 'occurrence_date', name='uq_recurring_task_occurrence'),
+    )
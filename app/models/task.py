@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 from enum import Enum as PyEnum
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, JSON, Enum, Date, Text, Integer
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, JSON, Enum, Date, Text, Integer, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -22,7 +22,7 @@ class Task(Base):
     __tablename__ = "tasks"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    task_number = Column(Integer, nullable=True, unique=True, index=True)  # Sequential task number (T.ID)
+    task_number = Column(Integer, nullable=True)  # Sequential task number (T.ID), unique per agency
     agency_id = Column(UUID(as_uuid=True), nullable=False, index=True)
     client_id = Column(UUID(as_uuid=True), nullable=True, index=True)  # Null for todos
     service_id = Column(UUID(as_uuid=True), nullable=True, index=True)  # Null for todos
@@ -54,7 +54,7 @@ class Task(Base):
     updated_by = Column(UUID(as_uuid=True), nullable=True)  # Track who last updated the task
     updated_by_name = Column(String, nullable=True)  # Store updater's name
     updated_by_role = Column(String, nullable=True)  # Store updater's role
-    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)  # Part of the list order and keyset cursor
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
@@ -66,3 +66,12 @@ class Task(Base):
     collaborators = relationship("TaskCollaborator", back_populates="task", cascade="all, delete-orphan")
     closure_requests = relationship("TaskClosureRequest", back_populates="task", cascade="all, delete-orphan", order_by="TaskClosureRequest.created_at.desc()")
 
+    __table_args__ = (
+        UniqueConstraint('agency_id', 'task_number', name='uq_tasks_agency_task_number'),
+        # Task list order and keyset pagination
+        Index('ix_tasks_agency_created_at_id', agency_id, created_at.desc(), id.desc()),
+        # Task list filtered by client / by assignee (and status), in list order
+        Index('ix_tasks_agency_client_created_at_id', agency_id, client_id, created_at.desc(), id.desc()),
+        Index('ix_tasks_agency_assignee_status', agency_id, assigned_to, status, created_at.desc(), id.desc()),
+    )
+
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -21,3 +21,8 @@ class TaskComment(Base):
     # Relationships
     task = relationship("Task", back_populates="comments")
 
+    __table_args__ = (
+        # Comments of a task in thread order, and unread comments after a read watermark
+        Index("ix_task_comments_task_created_at", "task_id", "created_at"),
+    )
+
@@ -6,6 +6,10 @@ from sqlalchemy.orm import relationship
 from app.database import Base
 
 class TaskCommentRead(Base):
+    """Legacy per-(comment, user) read rows, superseded by TaskCommentReadWatermark.
+
+    No longer written; kept so existing rows stay mapped until the table is dropped.
+    """
     __tablename__ = "task_comment_reads"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -0,0 +1,25 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, DateTime, ForeignKey, String, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from app.database import Base
+
+class TaskCommentReadWatermark(Base):
+    """Per-(task, user) read position in a task's chat.
+
+    Every comment created at or before last_read_comment_at counts as read by the user,
+    so marking a chat as read is a single upsert instead of one row per comment.
+    """
+    __tablename__ = "task_comment_read_watermarks"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    task_id = Column(UUID(as_uuid=True), ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    user_name = Column(String(255), nullable=True)
+    last_read_comment_id = Column(UUID(as_uuid=True), ForeignKey("task_comments.id", ondelete="SET NULL"), nullable=True)
+    last_read_comment_at = Column(DateTime(timezone=True), nullable=False)  # created_at of the last read comment
+    read_at = Column(DateTime(timezone=True), default=datetime.utcnow)  # When the user last advanced the watermark
+
+    __table_args__ = (
+        UniqueConstraint('task_id', 'user_id', name='uq_task_comment_read_watermark'),
+    )
@@ -0,0 +1,16 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer
+from sqlalchemy.dialects.postgresql import UUID
+from app.database import Base
+
+class TaskNumberCounter(Base):
+    """Last task number handed out per agency.
+
+    Numbers are allocated with a single UPDATE ... RETURNING on this row, so concurrent
+    creates in the same agency never receive the same number.
+    """
+    __tablename__ = "task_number_counters"
+
+    agency_id = Column(UUID(as_uuid=True), primary_key=True)
+    last_number = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, Boolean, String
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, Boolean, String, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -21,3 +21,8 @@ class TaskTimer(Base):
     # Relationships
     task = relationship("Task", back_populates="timers")
 
+    __table_args__ = (
+        # Running timers of a task / of a (task, user): logged-time summary and get_active_timer
+        Index("ix_task_timers_task_user_active", "task_id", "user_id", postgresql_where=(is_active == True)),
+    )
+
@@ -0,0 +1,14 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, BigInteger
+from sqlalchemy.dialects.postgresql import UUID
+from app.database import Base
+
+class TaskUserTimeRollup(Base):
+    """Total logged time of stopped and manual timer entries per (task, user)"""
+    __tablename__ = "task_user_time_rollups"
+
+    task_id = Column(UUID(as_uuid=True), ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), primary_key=True, index=True)
+    total_seconds = Column(BigInteger, nullable=False, default=0)
+    entry_count = Column(Integer, nullable=False, default=0)  # Number of timer entries counted
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,27 @@
+from datetime import datetime
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, BigInteger, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.database import Base
+
+class TimeBucketDaily(Base):
+    """Logged seconds per (task, user, UTC day), for timesheet and utilization reports.
+
+    Fed by timer stops and manual entries (split across UTC days when an entry spans
+    midnight). agency_id and client_id are copied from the task when the time is logged;
+    client_id is re-keyed when the task moves to another client.
+    """
+    __tablename__ = "time_buckets_daily"
+
+    task_id = Column(UUID(as_uuid=True), ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+    bucket_date = Column(Date, primary_key=True)
+    agency_id = Column(UUID(as_uuid=True), nullable=False)
+    client_id = Column(UUID(as_uuid=True), nullable=True)
+    total_seconds = Column(BigInteger, nullable=False, default=0)
+    entry_count = Column(Integer, nullable=False, default=0)  # Timer entries with time on this day
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_time_buckets_daily_agency_date", "agency_id", "bucket_date"),
+        Index("ix_time_buckets_daily_agency_user_date", "agency_id", "user_id", "bucket_date"),
+    )
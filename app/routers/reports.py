@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from uuid import UUID
+from datetime import date
+from typing import Optional
+
+from app.database import get_db
+from app.dependencies import get_current_user, get_current_agency, require_role
+from app.schemas.report import Timesheet
+from app.crud import crud_time_bucket
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+# Longest date range accepted by a single timesheet query
+MAX_REPORT_DAYS = 366
+
+# Response keys for the group_by dimensions
+GROUP_BY_KEYS = {"user": "user_id", "client": "client_id", "task": "task_id", "date": "date"}
+
+@router.get("/timesheet", response_model=Timesheet)
+def get_timesheet(
+    from_date: date,
+    to_date: date,
+    group_by: str = Query("user,date", description="Comma-separated: user, client, task, date"),
+    user_id: Optional[UUID] = Query(None),
+    client_id: Optional[UUID] = Query(None),
+    task_id: Optional[UUID] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    current_agency: dict = Depends(get_current_agency),
+    _: dict = Depends(require_role(["CA_ACCOUNTANT", "CA_TEAM"])),
+):
+    """
+    Logged time per user/client/task/day for a date range (UTC days, inclusive),
+    answered from the pre-aggregated daily time buckets.
+    """
+    if to_date < from_date:
+        raise HTTPException(status_code=400, detail="to_date must be on or after from_date")
+    if (to_date - from_date).days >= MAX_REPORT_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range cannot exceed {MAX_REPORT_DAYS} days")
+    
+    dimensions = [key.strip() for key in group_by.split(",") if key.strip()]
+    invalid = [key for key in dimensions if key not in crud_time_bucket.TIMESHEET_GROUP_BY]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid group_by: {', '.join(invalid)}")
+    dimensions = list(dict.fromkeys(dimensions))
+    
+    rows = crud_time_bucket.get_timesheet(
+        db=db,
+        agency_id=current_agency["id"],
+        from_date=from_date,
+        to_date=to_date,
+        group_by=dimensions,
+        user_id=user_id,
+        client_id=client_id,
+        task_id=task_id
+    )
+    
+    return {
+        "from_date": from_date,
+        "to_date": to_date,
+        "group_by": dimensions,
+        "total_seconds": sum(row["total_seconds"] for row in rows),
+        "rows": [
+            {
+                **{GROUP_BY_KEYS[key]: row[key] for key in dimensions},
+                "total_seconds": row["total_seconds"],
+                "entry_count": row["entry_count"],
+            }
+            for row in rows
+        ]
+    }
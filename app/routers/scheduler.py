@@ -9,13 +9,19 @@ from typing import Optional
 
 from app.database import get_db
 from app.dependencies import get_current_user, get_current_agency, require_role
-from app.services.recurring_task_scheduler import create_tasks_from_recurring_templates
+from app.services.recurring_task_scheduler import materialize_recurring_tasks, materialize_recurring_tasks_range
 
 router = APIRouter(prefix="/scheduler", tags=["scheduler"])
 
+# Longest date range accepted by a single backfill call
+MAX_BACKFILL_DAYS = 366
+
 @router.post("/create-recurring-tasks")
 def trigger_recurring_task_creation(
     check_date: Optional[str] = None,  # YYYY-MM-DD format
+    from_date: Optional[str] = None,  # YYYY-MM-DD format, backfill range start
+    to_date: Optional[str] = None,  # YYYY-MM-DD format, backfill range end (inclusive)
+    catch_up: bool = False,  # Also create occurrences missed since each template's last run
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
     current_agency: dict = Depends(get_current_agency),
@@ -24,21 +30,52 @@ def trigger_recurring_task_creation(
     """
     Manually trigger creation of tasks from recurring templates.
     If check_date is not provided, uses today's date.
+    With from_date and to_date, creates every occurrence in that range instead (backfill).
+    Occurrences that were already created are skipped, so the endpoint is safe to rerun.
     This endpoint should typically be called by a cron job or scheduler.
     """
     try:
+        if from_date or to_date:
+            if not (from_date and to_date):
+                raise HTTPException(status_code=400, detail="Both from_date and to_date are required for a range run")
+            from_date_obj = date.fromisoformat(from_date)
+            to_date_obj = date.fromisoformat(to_date)
+            if to_date_obj < from_date_obj:
+                raise HTTPException(status_code=400, detail="to_date must be on or after from_date")
+            if to_date_obj > date.today():
+                raise HTTPException(status_code=400, detail="to_date cannot be in the future")
+            if (to_date_obj - from_date_obj).days >= MAX_BACKFILL_DAYS:
+                raise HTTPException(status_code=400, detail=f"Range cannot exceed {MAX_BACKFILL_DAYS} days")
+            
+            report = materialize_recurring_tasks_range(from_date_obj, to_date_obj)
+            
+            return {
+                "message": f"Recurring task backfill completed",
+                "from_date": str(from_date_obj),
+                "to_date": str(to_date_obj),
+                "tasks_created": report["tasks_created"],
+                "occurrences_skipped": report["occurrences_skipped"],
+                "failures": report["failures"],
+                "agencies": report["agencies"]
+            }
+        
         if check_date:
             check_date_obj = date.fromisoformat(check_date)
         else:
             check_date_obj = date.today()
         
-        tasks_created = create_tasks_from_recurring_templates(check_date_obj)
+        report = materialize_recurring_tasks(check_date_obj, catch_up=catch_up)
         
         return {
             "message": f"Recurring task scheduler completed",
             "check_date": str(check_date_obj),
-            "tasks_created": tasks_created
+            "tasks_created": report["tasks_created"],
+            "occurrences_skipped": report["occurrences_skipped"],
+            "failures": report["failures"],
+            "agencies": report["agencies"]
         }
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid date format: {str(e)}")
     except Exception as e:
@@ -5,9 +5,11 @@ from uuid import UUID
 from typing import List, Optional
 import os
 import logging
-import threading
 
-from app.database import get_db
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db, get_async_db
 from app.dependencies import get_current_user, get_current_agency
 from app.schemas.task_comment import TaskComment, TaskCommentCreate, TaskCommentUpdate
 from app import crud
@@ -19,33 +21,80 @@ http_bearer = HTTPBearer()
 
 router = APIRouter(prefix="/tasks/{task_id}/comments", tags=["task-comments"])
 
+def _task_participant_ids(db: Session, task) -> set:
+    """User IDs (as strings) of the task's assignee, creator and collaborators"""
+    from app.crud import crud_task_collaborator
+    user_ids = set()
+    if task.assigned_to:
+        user_ids.add(str(task.assigned_to))
+    if task.created_by:
+        user_ids.add(str(task.created_by))
+    for collab in crud_task_collaborator.get_task_collaborators(db, task.id):
+        user_ids.add(str(collab.user_id))
+    return user_ids
+
+def _attachment_response_url(file_key: str) -> str:
+    """URL to return for a stored attachment key: a 7-day presigned URL, else the S3 public URL"""
+    s3_bucket = os.getenv('S3_BUCKET_NAME', '')
+    try:
+        presigned_url = get_attachment_url(file_key, expiration=3600 * 24 * 7)  # 7 days
+        if presigned_url:
+            return presigned_url
+    except Exception:
+        # Fallback to S3 public URL if presigned URL generation fails
+        pass
+    if s3_bucket:
+        return f"https://{s3_bucket}.s3.amazonaws.com/{file_key}"
+    return file_key
+
+def _comment_response(comment) -> TaskComment:
+    """Response for a comment with its attachment URL resolved.
+
+    Built on a copy: the ORM object keeps the stored S3 key, so a later commit never writes the
+    temporary URL over it.
+    """
+    response = TaskComment.model_validate(comment)
+    if response.attachment_url:
+        response.attachment_url = _attachment_response_url(response.attachment_url)
+    return response
+
+def _previous_commenter_ids(db: Session, task_id: UUID, comment_id: UUID) -> Optional[set]:
+    """User IDs (as strings) of everyone who commented on the task before, or None for a first comment"""
+    from app.models.task_comment import TaskComment as TaskCommentModel
+    previous_comments = db.query(TaskCommentModel.user_id).filter(
+        TaskCommentModel.task_id == task_id,
+        TaskCommentModel.id != comment_id
+    ).all()
+    if not previous_comments:
+        return None
+    return {str(row.user_id) for row in previous_comments}
+
 @router.post("/", response_model=TaskComment, status_code=status.HTTP_201_CREATED)
 async def create_task_comment(
     task_id: UUID,
     message: Optional[str] = Form(None),
     attachment: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: str = Depends(http_bearer),
     current_user: dict = Depends(get_current_user),
     current_agency: dict = Depends(get_current_agency),
 ):
     """Create a new comment on a task with optional file attachment"""
     # Verify task exists and belongs to agency
-    from app import crud as crud_module
-    task = crud_module.crud_task.get_task(db, task_id, current_agency["id"])
+    task = await db.run_sync(crud.crud_task.get_task, task_id, current_agency["id"])
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     # Allow empty messages - no validation required
     # Users can send messages with or without text/attachments
     
-    # Handle file upload if provided
+    # Handle file upload if provided (the S3 upload blocks, so it runs on the threadpool)
     attachment_url = None
     attachment_name = None
     attachment_type = None
     if attachment and attachment.filename:
         try:
-            file_key = save_attachment(attachment, f"task_comments/{task_id}")
+            file_key = await run_in_threadpool(save_attachment, attachment, f"task_comments/{task_id}")
             attachment_url = file_key
             attachment_name = attachment.filename
             attachment_type = attachment.content_type or "application/octet-stream"
@@ -60,31 +109,21 @@ async def create_task_comment(
         attachment_type=attachment_type
     )
     
-    comment = crud.crud_task_comment.create_task_comment(
-        db=db,
+    comment = await db.run_sync(
+        crud.crud_task_comment.create_task_comment,
         comment=comment_data,
         task_id=task_id,
         user_id=UUID(current_user["id"])
     )
     
     # Generate presigned URL for attachment if exists
-    if comment.attachment_url:
-        try:
-            presigned_url = get_attachment_url(comment.attachment_url, expiration=3600 * 24 * 7)  # 7 days
-            if presigned_url:
-                # Update the comment object with presigned URL for response
-                comment.attachment_url = presigned_url
-        except Exception:
-            # Fallback to S3 public URL if presigned URL generation fails
-            s3_bucket = os.getenv('S3_BUCKET_NAME', '')
-            if s3_bucket:
-                comment.attachment_url = f"https://{s3_bucket}.s3.amazonaws.com/{comment.attachment_url}"
+    response = _comment_response(comment)
     
     sender_user_id = str(current_user["id"])
     
     # Emit real-time event for new comment
     try:
-        from app.socketio_manager import emit_new_comment, emit_unread_update
+        from app.socketio_manager import emit_new_comment, queue_unread_update
         import asyncio
         
         # Prepare comment data for emission
@@ -93,7 +132,7 @@ async def create_task_comment(
             "task_id": str(comment.task_id),
             "user_id": str(comment.user_id),
             "message": comment.message,
-            "attachment_url": comment.attachment_url,
+            "attachment_url": response.attachment_url,
             "attachment_name": comment.attachment_name,
             "attachment_type": comment.attachment_type,
             "created_at": comment.created_at.isoformat() if comment.created_at else None,
@@ -102,142 +141,76 @@ async def create_task_comment(
         # Emit to all users watching this task (except sender)
         asyncio.create_task(emit_new_comment(str(task_id), comment_dict, sender_user_id))
         
-        # Update unread status for all users in the task (except sender)
-        # Get all users who should see this task (assigned, collaborators, etc.)
-        from app.crud import crud_task
-        task_obj = crud_task.get_task(db, task_id, current_agency["id"])
-        if task_obj:
-            users_to_notify = set()
-            if task_obj.assigned_to:
-                users_to_notify.add(str(task_obj.assigned_to))
-            if task_obj.created_by:
-                users_to_notify.add(str(task_obj.created_by))
-            
-            # Get collaborators
-            from app.crud import crud_task_collaborator
-            collaborators = crud_task_collaborator.get_task_collaborators(db, task_id)
-            for collab in collaborators:
-                users_to_notify.add(str(collab.user_id))
-            
-            # Remove sender from notification list
-            users_to_notify.discard(sender_user_id)
-            
-            # Emit unread update to all relevant users
-            for user_id in users_to_notify:
-                asyncio.create_task(emit_unread_update(str(task_id), user_id, True))
+        # Update unread status for all users in the task (assigned, creator, collaborators) except the sender
+        users_to_notify = await db.run_sync(_task_participant_ids, task)
+        users_to_notify.discard(sender_user_id)
+        
+        # Queue unread updates; each user's are merged into one event per window
+        for user_id in users_to_notify:
+            queue_unread_update(str(task_id), user_id, True)
     except Exception as e:
         # Don't fail the request if Socket.IO fails
-        print(f"Socket.IO emission error: {e}")
+        logger.error(f"Socket.IO emission error: {e}", exc_info=True)
     
     # Send email notifications for the comment
     try:
-        from app.utils.email import send_task_comment_email
-        from app.routers.tasks import fetch_user_info_from_login_service, fetch_user_email_from_login_service
-        from app.models.task_comment import TaskComment as TaskCommentModel
+        from app.routers.tasks import fetch_user_info_from_login_service
+        from app.services.notification_worker import enqueue_notification, notify_workers
         
-        # Get sender's name
+        # Get sender's name (Login service calls block, so they run on the threadpool)
         token_str = token.credentials if hasattr(token, 'credentials') else None
-        sender_info = fetch_user_info_from_login_service(UUID(current_user["id"]), token_str)
+        sender_info = await run_in_threadpool(fetch_user_info_from_login_service, UUID(current_user["id"]), token_str)
         sender_name = sender_info.get("name") or current_user.get("name") or current_user.get("email", "Unknown")
         
-        # Get all previous comments to find who should receive email (for replies)
-        previous_comments = db.query(TaskCommentModel).filter(
-            TaskCommentModel.task_id == task_id,
-            TaskCommentModel.id != comment.id
-        ).order_by(TaskCommentModel.created_at.desc()).all()
-        
-        # Determine who should receive emails
-        users_to_email = set()
+        # Previous commenters receive the email (for replies)
+        previous_commenters = await db.run_sync(_previous_commenter_ids, task_id, comment.id)
         
-        if previous_comments:
+        if previous_commenters is not None:
             # If there are previous comments, this is a reply - send to previous commenters
             logger.info(f"Previous comments found - treating as reply. Sending email to previous commenters.")
-            for prev_comment in previous_comments:
-                if str(prev_comment.user_id) != sender_user_id:
-                    users_to_email.add(str(prev_comment.user_id))
+            users_to_email = previous_commenters
         else:
             # If no previous comments, send to all task participants (first comment)
             logger.info(f"First comment on task - sending email to all participants.")
-            if task.assigned_to and str(task.assigned_to) != sender_user_id:
-                users_to_email.add(str(task.assigned_to))
-            if task.created_by and str(task.created_by) != sender_user_id:
-                users_to_email.add(str(task.created_by))
-            
-            # Get collaborators
-            from app.crud import crud_task_collaborator
-            collaborators = crud_task_collaborator.get_task_collaborators(db, task_id)
-            for collab in collaborators:
-                if str(collab.user_id) != sender_user_id:
-                    users_to_email.add(str(collab.user_id))
-        
-        # Send emails in background thread
-        def send_comment_emails():
-            try:
-                frontend_url = os.getenv("FRONTEND_URL", "http://localhost:8003")
-                task_url = f"{frontend_url}/tasks"
-                
-                for user_id_str in users_to_email:
-                    try:
-                        user_id = UUID(user_id_str)
-                        logger.info(f"Preparing to send email to user {user_id_str} for comment on task #{task.task_number}")
-                        
-                        recipient_email = fetch_user_email_from_login_service(user_id, token_str)
-                        
-                        if recipient_email:
-                            logger.info(f"Email address retrieved for recipient: {recipient_email}")
-                            
-                            result = send_task_comment_email(
-                                to_email=recipient_email,
-                                sender_name=sender_name,
-                                task_title=task.title,
-                                task_number=task.task_number or 0,
-                                comment_message=message,
-                                has_attachment=bool(attachment_url),
-                                attachment_name=comment.attachment_name,
-                                task_url=task_url
-                            )
-                            
-                            if result:
-                                logger.info(f"Successfully sent email to {recipient_email} for comment on task #{task.task_number}")
-                            else:
-                                logger.warning(f"Failed to send email to {recipient_email} for comment on task #{task.task_number}")
-                        else:
-                            logger.warning(f"Could not fetch email for user {user_id_str} - email not sent")
-                    except Exception as e:
-                        logger.error(f"Error sending email to user {user_id_str}: {e}", exc_info=True)
-            except Exception as e:
-                logger.error(f"Error in email sending thread: {e}", exc_info=True)
+            users_to_email = await db.run_sync(_task_participant_ids, task)
+        users_to_email.discard(sender_user_id)
         
-        # Start email sending in background thread
+        # Queue the emails in the notification outbox (delivered by the notification workers)
         if users_to_email:
-            logger.info(f"Sending email notifications to {len(users_to_email)} recipient(s) for comment on task #{task.task_number}")
-            email_thread = threading.Thread(target=send_comment_emails)
-            email_thread.daemon = True
-            email_thread.start()
+            frontend_url = os.getenv("FRONTEND_URL", "http://localhost:8003")
+            
+            # Only the user IDs are stored; the notification workers resolve the emails, off the request path
+            recipients = {user_id_str: None for user_id_str in users_to_email}
+            
+            logger.info(f"Queueing email notifications to {len(recipients)} recipient(s) for comment on task #{task.task_number}")
+            queued_emails = await db.run_sync(enqueue_notification, "task_comment", recipients, {
+                "sender_name": sender_name,
+                "task_title": task.title,
+                "task_number": task.task_number or 0,
+                "comment_message": message,
+                "has_attachment": bool(attachment_url),
+                "attachment_name": comment.attachment_name,
+                "task_url": f"{frontend_url}/tasks",
+            })
+            await db.commit()
+            notify_workers(queued_emails)
         else:
             logger.info(f"No recipients to email for comment on task #{task.task_number}")
     
     except Exception as e:
-        # Don't fail the request if email sending fails
+        # Don't fail the request if queueing the emails fails
+        await db.rollback()
         logger.error(f"Error setting up email notifications: {e}", exc_info=True)
     
-    return comment
+    return response
 
-@router.get("/", response_model=List[TaskComment])
-def list_task_comments(
-    task_id: UUID,
-    skip: int = Query(0, ge=0),
-    limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
-    current_agency: dict = Depends(get_current_agency),
-):
-    """Get all comments for a task and mark them as read for the current user"""
-    # Verify task exists and belongs to agency
-    from app import crud as crud_module
-    task = crud_module.crud_task.get_task(db, task_id, current_agency["id"])
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+def _read_task_comments(db: Session, task_id: UUID, agency_id: UUID, user_id: UUID, user_name: Optional[str], skip: int, limit: int):
+    """Load a page of comments and mark the task's comments as read for the user.
+
+    Returns (comments, read watermark if it advanced), or None if the task is not in the agency.
+    """
+    if not crud.crud_task.task_exists(db, task_id, agency_id):
+        return None
     
     comments = crud.crud_task_comment.get_task_comments(
         db=db,
@@ -246,85 +219,53 @@ def list_task_comments(
         limit=limit
     )
     
+    # Mark all comments as read (moves the watermark to the latest comment)
+    watermark = None
+    if crud_task_comment_read.mark_all_comments_as_read(db, task_id, user_id, user_name) > 0:
+        watermark = crud_task_comment_read.get_read_watermark(db, task_id, user_id)
+    
+    return comments, watermark
+
+@router.get("/", response_model=List[TaskComment])
+async def list_task_comments(
+    task_id: UUID,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user),
+    current_agency: dict = Depends(get_current_agency),
+):
+    """Get all comments for a task and mark them as read for the current user"""
     # Mark all comments as read for the current user when they view the chat
     user_id = UUID(current_user["id"])
     # Store user name for display
     user_name = current_user.get("name") or current_user.get("email") or None
     
-    # Get all comments for this task before marking as read
-    from app.models.task_comment import TaskComment
-    from app.models.task_comment_read import TaskCommentRead
-    from sqlalchemy import and_
-    from datetime import datetime, timezone
-    
-    comment_ids = db.query(TaskComment.id).filter(
-        TaskComment.task_id == task_id
-    ).all()
-    comment_id_list = [c[0] for c in comment_ids]
-    
-    # Get already read comment IDs before marking
-    already_read = db.query(TaskCommentRead.comment_id).filter(
-        and_(
-            TaskCommentRead.comment_id.in_(comment_id_list),
-            TaskCommentRead.user_id == user_id
-        )
-    ).all()
-    already_read_ids = {r[0] for r in already_read}
-    
-    # Mark all comments as read
-    new_reads_count = crud_task_comment_read.mark_all_comments_as_read(db, task_id, user_id, user_name)
+    result = await db.run_sync(_read_task_comments, task_id, current_agency["id"], user_id, user_name, skip, limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    comments, watermark = result
     
-    # Emit read receipt updates for all newly read comments
-    if new_reads_count > 0:
+    # Emit one read receipt for the new read position, covering every newly read comment
+    if watermark is not None and watermark.last_read_comment_id is not None:
         try:
-            from app.socketio_manager import emit_comment_read_receipt
-            import asyncio
+            from app.socketio_manager import queue_read_receipt
             
-            # Get the comment IDs that were newly marked as read
-            newly_marked_ids = [cid for cid in comment_id_list if cid not in already_read_ids]
+            receipt_data = {
+                "id": str(watermark.id),
+                "user_id": str(watermark.user_id),
+                "read_at": watermark.read_at.isoformat() if watermark.read_at else None,
+                "user_name": watermark.user_name or user_name or "Unknown",
+                "user_email": current_user.get("email") or "N/A"
+            }
             
-            # Get the read receipts for newly marked comments (already committed in mark_all_comments_as_read)
-            recent_reads = db.query(TaskCommentRead).filter(
-                and_(
-                    TaskCommentRead.comment_id.in_(newly_marked_ids),
-                    TaskCommentRead.user_id == user_id
-                )
-            ).all()
-            
-            # Emit read receipt for each newly marked comment
-            for read_receipt in recent_reads:
-                receipt_data = {
-                    "id": str(read_receipt.id),
-                    "user_id": str(read_receipt.user_id),
-                    "read_at": read_receipt.read_at.isoformat() if read_receipt.read_at else None,
-                    "user_name": read_receipt.user_name or user_name or "Unknown",
-                    "user_email": current_user.get("email") or "N/A"
-                }
-                asyncio.create_task(emit_comment_read_receipt(
-                    str(task_id), 
-                    str(read_receipt.comment_id), 
-                    receipt_data
-                ))
+            queue_read_receipt(str(task_id), str(watermark.last_read_comment_id), receipt_data)
         except Exception as e:
             # Don't fail the request if Socket.IO fails
-            print(f"Socket.IO read receipt emission error: {e}")
+            logger.error(f"Socket.IO read receipt emission error: {e}", exc_info=True)
     
     # Generate presigned URLs for attachments
-    s3_bucket = os.getenv('S3_BUCKET_NAME', '')
-    for comment in comments:
-        if comment.attachment_url:
-            try:
-                presigned_url = get_attachment_url(comment.attachment_url, expiration=3600 * 24 * 7)  # 7 days
-                if presigned_url:
-                    comment.attachment_url = presigned_url
-                elif s3_bucket:
-                    comment.attachment_url = f"https://{s3_bucket}.s3.amazonaws.com/{comment.attachment_url}"
-            except Exception:
-                # Fallback to S3 public URL if presigned URL generation fails
-                if s3_bucket:
-                    comment.attachment_url = f"https://{s3_bucket}.s3.amazonaws.com/{comment.attachment_url}"
-    
-    return comments
+    return [_comment_response(comment) for comment in comments]
 
 @router.patch("/{comment_id}", response_model=TaskComment)
 def update_task_comment(
@@ -338,8 +279,7 @@ def update_task_comment(
     """Update a comment"""
     # Verify task exists
     from app import crud as crud_module
-    task = crud_module.crud_task.get_task(db, task_id, current_agency["id"])
-    if not task:
+    if not crud_module.crud_task.task_exists(db, task_id, current_agency["id"]):
         raise HTTPException(status_code=404, detail="Task not found")
     
     updated_comment = crud.crud_task_comment.update_task_comment(
@@ -366,8 +306,7 @@ def delete_task_comment(
     """Delete a comment"""
     # Verify task exists
     from app import crud as crud_module
-    task = crud_module.crud_task.get_task(db, task_id, current_agency["id"])
-    if not task:
+    if not crud_module.crud_task.task_exists(db, task_id, current_agency["id"]):
         raise HTTPException(status_code=404, detail="Task not found")
     
     deleted = crud.crud_task_comment.delete_task_comment(
@@ -393,8 +332,7 @@ def get_comment_read_receipts(
     """Get list of users who have read a specific comment"""
     # Verify task exists
     from app import crud as crud_module
-    task = crud_module.crud_task.get_task(db, task_id, current_agency["id"])
-    if not task:
+    if not crud_module.crud_task.task_exists(db, task_id, current_agency["id"]):
         raise HTTPException(status_code=404, detail="Task not found")
     
     # Verify comment exists and belongs to task
@@ -402,39 +340,41 @@ def get_comment_read_receipts(
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    # Get all read receipts for this comment
-    from app.models.task_comment_read import TaskCommentRead
-    
-    read_receipts = db.query(TaskCommentRead).filter(
-        TaskCommentRead.comment_id == comment_id
-    ).order_by(TaskCommentRead.read_at.desc()).all()
+    # Derive read receipts from the read watermarks that are at or past this comment
+    read_receipts = crud_task_comment_read.get_comment_readers(db, comment)
     
     # Build response using stored user_name, fallback to fetching if needed
-    from app.routers.tasks import fetch_user_info_from_login_service
+    from app.services.user_directory import get_user_directory
     import os
     token_str = os.getenv("INTERNAL_SERVICE_TOKEN", None)
     
+    # Resolve every reader without a stored name in one batched lookup
+    missing_name_ids = [receipt.user_id for receipt in read_receipts if not receipt.user_name]
+    users_by_id = {}
+    if missing_name_ids:
+        try:
+            users_by_id = get_user_directory().get_users(missing_name_ids, token_str)
+        except Exception as e:
+            # If we can't fetch user info, use defaults
+            logger.error(f"Error fetching user info for read receipts of comment {comment_id}: {e}")
+    
     receipts_with_user_info = []
+    names_updated = False
     for receipt in read_receipts:
         # user_name field stores user name
         user_name = receipt.user_name or "Unknown"
         user_email = "N/A"
         user_role = "N/A"
         
-        # Only fetch from login service if name is not stored
-        if not receipt.user_name:
-            try:
-                user_info = fetch_user_info_from_login_service(receipt.user_id, token_str)
-                if user_info:
-                    user_name = user_info.get("name") or user_info.get("email") or "Unknown"
-                    user_email = user_info.get("email") or "N/A"
-                    user_role = user_info.get("role") or "N/A"
-                    # Update the stored name for future use
-                    receipt.user_name = user_name
-                    db.commit()
-            except Exception as e:
-                # If we can't fetch user info, use defaults
-                print(f"Error fetching user info for {receipt.user_id}: {e}")
+        # Only use login service info if name is not stored
+        user_info = users_by_id.get(str(receipt.user_id)) if not receipt.user_name else None
+        if user_info:
+            user_name = user_info.get("name") or user_info.get("email") or "Unknown"
+            user_email = user_info.get("email") or "N/A"
+            user_role = user_info.get("role") or "N/A"
+            # Update the stored name for future use
+            receipt.user_name = user_name
+            names_updated = True
         
         receipts_with_user_info.append({
             "id": str(receipt.id),
@@ -445,5 +385,8 @@ def get_comment_read_receipts(
             "user_role": user_role
         })
     
+    if names_updated:
+        db.commit()
+    
     return receipts_with_user_info
 
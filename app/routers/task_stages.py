@@ -3,16 +3,13 @@ from sqlalchemy.orm import Session
 from typing import List
 from uuid import UUID
 
-from fastapi import Request
+from app.database import get_db, get_read_db
 from app.dependencies import get_current_user, get_current_agency
 from app.crud import crud_task_stage
 from app.schemas.task_stage import TaskStageCreate, TaskStageUpdate, TaskStage
 
 router = APIRouter()
 
-def get_db(request: Request):
-    return request.state.db
-
 @router.post("/", response_model=TaskStage, status_code=status.HTTP_201_CREATED)
 def create_stage(
     stage: TaskStageCreate,
@@ -29,15 +26,16 @@ def create_stage(
 
 @router.get("/", response_model=List[TaskStage])
 def list_stages(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
+    primary_db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
     current_agency: dict = Depends(get_current_agency),
 ):
-    # Initialize default stages if none exist
+    # Initialize default stages if none exist (on the primary, which re-checks as the replica may lag)
     stages = crud_task_stage.get_stages_by_agency(db, current_agency["id"])
     if not stages:
         stages = crud_task_stage.initialize_default_stages(
-            db=db,
+            db=primary_db,
             agency_id=current_agency["id"],
             user_id=UUID(current_user["id"])
         )
@@ -46,7 +44,7 @@ def list_stages(
 @router.get("/{stage_id}", response_model=TaskStage)
 def get_stage(
     stage_id: UUID,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user),
     current_agency: dict = Depends(get_current_agency),
 ):
@@ -3,16 +3,16 @@ from fastapi.security import HTTPBearer
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
-import requests
-import os
 import logging
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
-from fastapi import Request
+from fastapi import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db, get_read_db, get_async_db, get_async_read_db
 from app.dependencies import get_current_user, get_current_agency, require_role
-from app.crud import crud_task, crud_task_subtask, crud_task_timer, crud_activity_log, crud_task_collaborator, crud_task_comment_read, crud_task_closure_request
+from app.crud import crud_task, crud_task_subtask, crud_task_timer, crud_task_time_rollup, crud_activity_log, crud_task_collaborator, crud_task_comment_read, crud_task_closure_request
 from app.schemas.task import TaskCreate, TaskUpdate, Task, TaskListItem
 from app.schemas.task_subtask import TaskSubtaskCreate, TaskSubtaskUpdate, TaskSubtask
 from app.schemas.task_timer import TaskTimer, ManualTimeEntry
@@ -20,91 +20,56 @@ from app.schemas.activity_log import ActivityLog
 from app.schemas.task_collaborator import TaskCollaborator, TaskCollaboratorCreate
 from app.schemas.task_closure_request import TaskClosureRequest, TaskClosureRequestCreate, TaskClosureRequestUpdate, ClosureRequestStatus
 from app.models.task import TaskStatus
-from app import config
+from app.services.user_directory import get_user_directory
+from app.services.notification_worker import enqueue_notification, notify_workers
 
 router = APIRouter()
 http_bearer = HTTPBearer()
 
-def get_db(request: Request):
-    return request.state.db
+def _current_user_uuid(current_user: dict) -> Optional[UUID]:
+    """The caller's user ID, or None if it is missing or malformed"""
+    try:
+        return UUID(current_user.get("id"))
+    except (ValueError, TypeError, AttributeError):
+        return None
 
 def fetch_user_info_from_login_service(user_id: UUID, token: str = None) -> dict:
     """Fetch user name and role from Login service"""
-    try:
-        login_service_url = config.API_URL or os.getenv("API_URL", "http://127.0.0.1:8001")
-        headers = {
-            "accept": "application/json",
-        }
-        if token:
-            headers["Authorization"] = f"Bearer {token}"
-        
-        # Call profile endpoint to get user info
-        profile_url = f"{login_service_url}/profile/" if not login_service_url.endswith('/') else f"{login_service_url}profile/"
-        response = requests.get(profile_url, headers=headers, timeout=5)
-        if response.status_code == 200:
-            user_data = response.json()
-            return {
-                "name": user_data.get("name") or user_data.get("email", "Unknown"),
-                "role": user_data.get("role") or "N/A"
-            }
-        return {"name": None, "role": None}
-    except Exception as e:
-        logger.error(f"Error fetching user info from Login service for user {user_id}: {e}")
+    profile = get_user_directory().get_profile(user_id, token)
+    if not profile:
         return {"name": None, "role": None}
+    return {
+        "name": profile.get("name") or profile.get("email") or "Unknown",
+        "role": profile.get("role") or "N/A"
+    }
 
 def fetch_user_email_from_login_service(user_id: UUID, token: str = None) -> Optional[str]:
     """Fetch user email from Login service by user_id"""
-    try:
-        login_service_url = config.API_URL or os.getenv("API_URL", "http://127.0.0.1:8001")
-        headers = {
-            "accept": "application/json",
-        }
-        if token:
-            headers["Authorization"] = f"Bearer {token}"
-        
-        # Try multiple endpoints to get user email
-        # First try: /admin/users/{user_id} (admin endpoint)
-        admin_user_url = f"{login_service_url}/admin/users/{user_id}" if not login_service_url.endswith('/') else f"{login_service_url}admin/users/{user_id}"
-        try:
-            response = requests.get(admin_user_url, headers=headers, timeout=5)
-            if response.status_code == 200:
-                user_data = response.json()
-                logger.debug(f'Fetched user data from admin endpoint: {user_data}')
-                email = user_data.get("email")
-                if email:
-                    logger.info(f"Successfully fetched email for user {user_id} from admin endpoint: {email}")
-                    return email
-                else:
-                    logger.warning(f"Admin endpoint returned user data but no email field for user {user_id}")
-            else:
-                logger.warning(f"Admin endpoint returned status {response.status_code} for user {user_id}: {response.text}")
-        except Exception as e:
-            logger.warning(f"Admin endpoint failed for user {user_id}: {e}")
-        
-        # Second try: /team/team-member/{user_id} (team member endpoint)
-        team_member_url = f"{login_service_url}/team/team-member/{user_id}" if not login_service_url.endswith('/') else f"{login_service_url}team/team-member/{user_id}"
-        try:
-            response = requests.get(team_member_url, headers=headers, timeout=5)
-            if response.status_code == 200:
-                user_data = response.json()
-                logger.debug(f'Fetched user data from team member endpoint: {user_data}')
-                # Handle both dict and object responses
-                if isinstance(user_data, dict):
-                    email = user_data.get("email")
-                else:
-                    email = getattr(user_data, "email", None)
-                if email:
-                    logger.info(f"Successfully fetched email for user {user_id} from team member endpoint: {email}")
-                    return email
-        except Exception as e:
-            logger.debug(f"Team member endpoint failed for user {user_id}: {e}")
-        
-        # If we can't get email, return None (email won't be sent)
+    email = get_user_directory().get_user_email(user_id, token)
+    if not email:
         logger.warning(f"Could not fetch email for user {user_id} from Login service - email notification will be skipped")
-        return None
-    except Exception as e:
-        logger.error(f"Error fetching user email from Login service for user {user_id}: {e}")
-        return None
+    return email
+
+def queue_task_assignment_email(db: Session, task, user_ids: List[UUID], current_user: dict) -> int:
+    """Queue "task created" emails for the given users in the notification outbox (no commit)"""
+    creator_name = task.created_by_name or current_user.get("name") or current_user.get("email", "Unknown")
+    due_date_str = None
+    if task.due_date:
+        due_date_str = task.due_date.strftime("%Y-%m-%d")
+        if task.due_time:
+            due_date_str += f" at {task.due_time}"
+    
+    # Only the user IDs are stored; the notification workers resolve the emails, off the request path
+    recipients = {str(user_id): None for user_id in user_ids}
+    
+    return enqueue_notification(db, "task_created", recipients, {
+        "task_title": task.title,
+        "task_number": task.task_number or 0,
+        "creator_name": creator_name,
+        "task_description": task.description,
+        "due_date": due_date_str,
+        "priority": task.priority.value if task.priority else None,
+    })
 
 @router.post("/", response_model=Task, status_code=status.HTTP_201_CREATED)
 def create_task(
@@ -119,24 +84,23 @@ def create_task(
     import traceback
     
     try:
-        # Create the regular task first
-        db_task = crud_task.create_task(
-            db=db,
-            task=task,
-            agency_id=current_agency["id"],
-            user_id=UUID(current_user["id"])
-        )
-        
-        # Fetch creator's name and role from Login service
+        # Fetch creator's name and role from Login service before the transaction starts,
+        # so the agency's task number counter is not locked during the HTTP call
         token_str = token.credentials if hasattr(token, 'credentials') else None
         creator_info = fetch_user_info_from_login_service(
             UUID(current_user["id"]), 
             token_str
         )
-        db_task.created_by_name = creator_info.get("name") or current_user.get("name") or current_user.get("email", "Unknown")
-        db_task.created_by_role = creator_info.get("role") or current_user.get("role") or "N/A"
-        db.commit()
-        db.refresh(db_task)
+        
+        # The task, its activity log and the recurring template are committed together below
+        db_task = crud_task.add_task(
+            db=db,
+            task=task,
+            agency_id=current_agency["id"],
+            user_id=UUID(current_user["id"]),
+            created_by_name=creator_info.get("name") or current_user.get("name") or current_user.get("email", "Unknown"),
+            created_by_role=creator_info.get("role") or current_user.get("role") or "N/A"
+        )
         
         # If this is a recurring task, create the recurring task template
         if task.is_recurring and task.recurrence_frequency and task.recurrence_start_date:
@@ -170,27 +134,17 @@ def create_task(
             )
             
             # Create the recurring task
-            crud.crud_recurring_task.create_recurring_task(
+            crud.crud_recurring_task.add_recurring_task(
                 db=db,
                 recurring_task=recurring_task_data,
                 agency_id=current_agency["id"],
                 user_id=UUID(current_user["id"])
             )
         
-        # Serialize the task properly like get_task does
+        # Serialize the task properly like get_task does, from the flushed in-memory values
+        # (no server defaults, so nothing needs refreshing). A new task has no subtasks or timers.
         subtasks_list = []
-        if db_task.subtasks:
-            for subtask in db_task.subtasks:
-                subtasks_list.append({
-                    "id": subtask.id,
-                    "task_id": subtask.task_id,
-                    "title": subtask.title,
-                    "description": subtask.description,
-                    "is_completed": subtask.is_completed,
-                    "sort_order": subtask.sort_order,
-                    "created_at": subtask.created_at,
-                    "updated_at": subtask.updated_at
-                })
+        logged_time = {"total_logged_seconds": 0, "is_timer_running_for_me": False}
         
         task_dict = {
             "id": db_task.id,
@@ -218,8 +172,8 @@ def create_task(
             "updated_by_role": db_task.updated_by_role,
             "created_at": db_task.created_at,
             "updated_at": db_task.updated_at,
-            "total_logged_seconds": 0,
-            "is_timer_running_for_me": False,
+            "total_logged_seconds": logged_time["total_logged_seconds"],
+            "is_timer_running_for_me": logged_time["is_timer_running_for_me"],
             "subtasks": subtasks_list,
             # Recurring task fields
             "is_recurring": db_task.is_recurring,
@@ -253,62 +207,22 @@ def create_task(
                         "description": stage.description
                     }
         
-        # Send email notifications to assigned user (in background)
+        # Queue email notification to assigned user (delivered by the notification workers)
+        # in the same transaction as the task, so the email is never lost or sent for a rolled back task.
         # Note: Collaborators are added separately, so we'll send email when they're added
-        try:
-            from app.utils.email import send_task_creation_email
-            import threading
-            
-            # Prepare task details for email
-            creator_name = db_task.created_by_name or current_user.get("name") or current_user.get("email", "Unknown")
-            task_description = db_task.description
-            due_date_str = None
-            if db_task.due_date:
-                due_date_str = db_task.due_date.strftime("%Y-%m-%d")
-                if db_task.due_time:
-                    due_date_str += f" at {db_task.due_time}"
-            priority_str = db_task.priority.value if db_task.priority else None
-            
-            # Send email to assigned user (in background thread)
-            if db_task.assigned_to:
-                logger.info(f"Task #{db_task.task_number} created - preparing to send email to assigned user {db_task.assigned_to}")
-                
-            def send_email_to_assigned():
-                try:
-                    logger.debug(f"Fetching email for assigned user {db_task.assigned_to}")
-                    assigned_user_email = fetch_user_email_from_login_service(
-                        db_task.assigned_to,
-                        token_str
-                    )
-                    if assigned_user_email:
-                        logger.info(f"[TASK CREATION] Email address retrieved for assigned user: {assigned_user_email}")
-                        logger.info(f"[TASK CREATION] Initiating email send to: {assigned_user_email}")
-                        logger.info(f"[TASK CREATION] Task details - Number: #{db_task.task_number}, Title: '{db_task.title}', Assigned to: {assigned_user_email}")
-                        result = send_task_creation_email(
-                            to_email=assigned_user_email,
-                            task_title=db_task.title,
-                            task_number=db_task.task_number or 0,
-                            creator_name=creator_name,
-                            task_description=task_description,
-                            due_date=due_date_str,
-                            priority=priority_str
-                        )
-                        if result:
-                            logger.info(f"Successfully sent email to assigned user {assigned_user_email} for task #{db_task.task_number}")
-                        else:
-                            logger.warning(f"Failed to send email to assigned user {assigned_user_email} for task #{db_task.task_number}")
-                    else:
-                        logger.warning(f"Could not fetch email for assigned user {db_task.assigned_to} - email not sent")
-                except Exception as e:
-                    logger.error(f"Error sending email to assigned user {db_task.assigned_to}: {e}", exc_info=True)
-            
-            # Start email sending in background thread
-            email_thread = threading.Thread(target=send_email_to_assigned)
-            email_thread.daemon = True
-            email_thread.start()
-        except Exception as email_error:
-            # Log error but don't fail task creation if email sending fails
-            logger.warning(f"Failed to send task creation email: {str(email_error)}")
+        queued_emails = 0
+        if db_task.assigned_to:
+            try:
+                # Savepoint: a failure to queue the email must not roll back the task
+                with db.begin_nested():
+                    logger.info(f"Task #{db_task.task_number} created - queueing email to assigned user {db_task.assigned_to}")
+                    queued_emails = queue_task_assignment_email(db, db_task, [db_task.assigned_to], current_user)
+            except Exception as email_error:
+                # Log error but don't fail task creation if queueing the email fails
+                logger.warning(f"Failed to queue task creation email: {str(email_error)}")
+        
+        db.commit()
+        notify_workers(queued_emails)
         
         return TaskSchema(**task_dict)
     except Exception as e:
@@ -320,44 +234,42 @@ def create_task(
             detail=f"Error creating task: {str(e)}. Please check server logs for details."
         )
 
-@router.get("/", response_model=List[TaskListItem])
-def list_tasks(
-    client_id: Optional[UUID] = Query(None),
-    assigned_to: Optional[UUID] = Query(None),
-    status: Optional[TaskStatus] = Query(None),
-    skip: int = Query(0, ge=0),
-    limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
-    current_agency: dict = Depends(get_current_agency),
+def _build_task_list(
+    db: Session,
+    agency_id: UUID,
+    current_user: dict,
+    client_id: Optional[UUID],
+    assigned_to: Optional[UUID],
+    status: Optional[TaskStatus],
+    skip: int,
+    limit: int,
+    cursor_position
 ):
-    from app.schemas.task import TaskListItem
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    logger.info(f"list_tasks called with: agency_id={current_agency['id']}, client_id={client_id}, assigned_to={assigned_to}, status={status}")
-    
+    """One serialized page of the task list and the cursor of the next page (None on the last page)"""
     # Show all tasks in the agency by default
     # Collaborators can access tasks they're added to via the task detail endpoint
     # Don't filter by user_id here - show all tasks for the agency
     tasks = crud_task.get_tasks_by_agency(
         db=db,
-        agency_id=current_agency["id"],
+        agency_id=agency_id,
         client_id=client_id,
         assigned_to=assigned_to,
         status=status,
         skip=skip,
         limit=limit,
-        user_id=None  # Don't filter by user - show all tasks
+        user_id=None,  # Don't filter by user - show all tasks
+        cursor=cursor_position
     )
     
-    logger.info(f"Found {len(tasks)} tasks for agency {current_agency['id']}, client_id filter: {client_id}")
+    next_cursor = crud_task.encode_task_cursor(tasks[-1]) if len(tasks) == limit else None
+    
+    logger.info(f"Found {len(tasks)} tasks for agency {agency_id}, client_id filter: {client_id}")
     
     # DEBUG: Show all tasks for this agency to identify the issue
     if client_id and len(tasks) == 0:
         all_tasks = crud_task.get_tasks_by_agency(
             db=db,
-            agency_id=current_agency["id"],
+            agency_id=agency_id,
             client_id=None,  # No filter
             assigned_to=None,
             status=None,
@@ -374,15 +286,20 @@ def list_tasks(
     task_list = []
     current_user_id = UUID(current_user["id"]) if current_user.get("id") else None
     
+    # Resolve unread flags for the whole page in a single query
+    unread_task_ids = set()
+    if current_user_id:
+        unread_task_ids = crud_task_comment_read.get_task_ids_with_unread_comments(
+            db=db,
+            task_ids=[task.id for task in tasks],
+            user_id=current_user_id
+        )
+    
+    # Logged time for the whole page from the rollups
+    logged_totals = crud_task_time_rollup.get_task_logged_totals(db, [task.id for task in tasks])
+    
     for task in tasks:
-        # Check if user has unread messages for this task
-        has_unread = False
-        if current_user_id:
-            has_unread = crud_task_comment_read.has_unread_comments(
-                db=db,
-                task_id=task.id,
-                user_id=current_user_id
-            )
+        has_unread = task.id in unread_task_ids
         
         task_dict = {
             "id": task.id,
@@ -407,6 +324,7 @@ def list_tasks(
             "updated_at": task.updated_at,
             "has_unread_messages": has_unread,
             "is_recurring": task.is_recurring,
+            "total_logged_seconds": logged_totals.get(task.id, 0),
         }
         
         # Include stage object if loaded
@@ -420,58 +338,56 @@ def list_tasks(
         
         task_list.append(TaskListItem(**task_dict))
     
-    return task_list
+    return task_list, next_cursor
 
-@router.get("/{task_id}", response_model=Task)
-def get_task(
-    task_id: UUID,
-    db: Session = Depends(get_db),
+@router.get("/", response_model=List[TaskListItem])
+async def list_tasks(
+    response: Response,
+    client_id: Optional[UUID] = Query(None),
+    assigned_to: Optional[UUID] = Query(None),
+    status: Optional[TaskStatus] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page (skip is ignored)"),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: dict = Depends(get_current_user),
     current_agency: dict = Depends(get_current_agency),
 ):
-    from app.models.task_timer import TaskTimer
-    from app.models.task import Task
-    from sqlalchemy.orm import joinedload
-    from datetime import datetime, timezone
+    """List the agency's tasks, newest first.
+    
+    When a full page is returned, the X-Next-Cursor response header holds an opaque cursor
+    for the next page; pass it back as ?cursor= for keyset pagination.
+    """
+    logger.info(f"list_tasks called with: agency_id={current_agency['id']}, client_id={client_id}, assigned_to={assigned_to}, status={status}")
+    
+    cursor_position = None
+    if cursor:
+        try:
+            cursor_position = crud_task.decode_task_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # The crud queries run on the async session's connection without blocking the event loop
+    task_list, next_cursor = await db.run_sync(
+        _build_task_list, current_agency["id"], current_user, client_id, assigned_to, status, skip, limit, cursor_position
+    )
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    return task_list
+
+def _build_task_detail(db: Session, task_id: UUID, agency_id: UUID, user_id: Optional[UUID]):
+    """The serialized task with its subtasks, stage and logged time, or None if it is not in the agency"""
     from app.schemas.task import Task as TaskSchema
     
-    # Load task with collaborators relationship
-    task = db.query(Task).options(
-        joinedload(Task.collaborators)
-    ).filter(
-        Task.id == task_id,
-        Task.agency_id == current_agency["id"]
-    ).first()
+    # Subtasks and stage are rendered; timers and activity logs are not loaded
+    task = crud_task.get_task_detail(db, task_id, agency_id)
     if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    # Calculate total logged seconds from all timers
-    all_timers = db.query(TaskTimer).filter(TaskTimer.task_id == task_id).all()
-    total_seconds = 0
-    for timer in all_timers:
-        if timer.is_active and timer.start_time:
-            # Add current running time for active timers (use timezone-aware datetime)
-            now = datetime.now(timezone.utc)
-            elapsed = int((now - timer.start_time).total_seconds())
-            total_seconds += elapsed
-        else:
-            # Add stored duration for stopped timers
-            total_seconds += timer.duration_seconds or 0
+        return None
     
-    # Check if current user has an active timer
-    user_id_str = current_user.get("id")
-    is_timer_running_for_me = False
-    if user_id_str:
-        try:
-            user_id = UUID(user_id_str)
-            active_timer = db.query(TaskTimer).filter(
-                TaskTimer.task_id == task_id,
-                TaskTimer.user_id == user_id,
-                TaskTimer.is_active == True
-            ).first()
-            is_timer_running_for_me = active_timer is not None
-        except (ValueError, TypeError):
-            pass
+    # Total logged seconds and the caller's running timer, in one aggregate query
+    logged_time = crud_task_timer.get_logged_time_summary(db, task_id, user_id)
     
     # Serialize subtasks properly
     from app.schemas.task_subtask import TaskSubtask as TaskSubtaskSchema
@@ -516,8 +432,8 @@ def get_task(
         "updated_by_role": task.updated_by_role,
         "created_at": task.created_at,
         "updated_at": task.updated_at,
-        "total_logged_seconds": total_seconds,
-        "is_timer_running_for_me": is_timer_running_for_me,
+        "total_logged_seconds": logged_time["total_logged_seconds"],
+        "is_timer_running_for_me": logged_time["is_timer_running_for_me"],
         "subtasks": subtasks_list,
         "is_recurring": task.is_recurring,
         "recurrence_frequency": task.recurrence_frequency,
@@ -539,6 +455,18 @@ def get_task(
     
     return TaskSchema(**task_dict)
 
+@router.get("/{task_id}", response_model=Task)
+async def get_task(
+    task_id: UUID,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: dict = Depends(get_current_user),
+    current_agency: dict = Depends(get_current_agency),
+):
+    task = await db.run_sync(_build_task_detail, task_id, current_agency["id"], _current_user_uuid(current_user))
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
 @router.patch("/{task_id}", response_model=Task)
 def update_task(
     task_id: UUID,
@@ -549,61 +477,29 @@ def update_task(
     current_agency: dict = Depends(get_current_agency),
 ):
     from app.schemas.task import Task as TaskSchema
-    from app.models.task_timer import TaskTimer
-    from datetime import datetime, timezone
     
-    task = crud_task.update_task(
+    # Fetch updater's name and role from Login service before the transaction starts
+    token_str = token.credentials if hasattr(token, 'credentials') else None
+    updater_info = fetch_user_info_from_login_service(
+        UUID(current_user["id"]), 
+        token_str
+    )
+    
+    # The update, its activity logs and a new recurring template are committed together below
+    task = crud_task.apply_task_update(
         db=db,
         task_id=task_id,
         task_update=task_update,
         agency_id=current_agency["id"],
-        user_id=UUID(current_user["id"])
+        user_id=UUID(current_user["id"]),
+        updated_by_name=updater_info.get("name") or current_user.get("name") or current_user.get("email", "Unknown"),
+        updated_by_role=updater_info.get("role") or current_user.get("role") or "N/A"
     )
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    # Fetch updater's name and role from Login service
-    token_str = token.credentials if hasattr(token, 'credentials') else None
-    updater_info = fetch_user_info_from_login_service(
-        UUID(current_user["id"]), 
-        token_str
-    )
-    task.updated_by_name = updater_info.get("name") or current_user.get("name") or current_user.get("email", "Unknown")
-    task.updated_by_role = updater_info.get("role") or current_user.get("role") or "N/A"
-    db.commit()
-    db.refresh(task)
-    
-    # Reload task with relationships
-    db.refresh(task)
-    if task.stage_id and not task.stage:
-        from app.models.task_stage import TaskStage
-        task.stage = db.query(TaskStage).filter(TaskStage.id == task.stage_id).first()
-    
-    # Calculate total logged seconds
-    all_timers = db.query(TaskTimer).filter(TaskTimer.task_id == task_id).all()
-    total_seconds = 0
-    for timer in all_timers:
-        if timer.is_active and timer.start_time:
-            now = datetime.now(timezone.utc)
-            elapsed = int((now - timer.start_time).total_seconds())
-            total_seconds += elapsed
-        else:
-            total_seconds += timer.duration_seconds or 0
-    
-    # Check if current user has an active timer
-    user_id_str = current_user.get("id")
-    is_timer_running_for_me = False
-    if user_id_str:
-        try:
-            user_id = UUID(user_id_str)
-            active_timer = db.query(TaskTimer).filter(
-                TaskTimer.task_id == task_id,
-                TaskTimer.user_id == user_id,
-                TaskTimer.is_active == True
-            ).first()
-            is_timer_running_for_me = active_timer is not None
-        except (ValueError, TypeError):
-            pass
+    # Total logged seconds and the caller's running timer, in one aggregate query
+    logged_time = crud_task_timer.get_logged_time_summary(db, task_id, _current_user_uuid(current_user))
     
     # If this is newly set to recurring, create the template
     if task.is_recurring and task.recurrence_frequency and task.recurrence_start_date:
@@ -645,13 +541,14 @@ def update_task(
                 is_active=True
             )
             
-            crud.crud_recurring_task.create_recurring_task(
+            crud.crud_recurring_task.add_recurring_task(
                 db=db,
                 recurring_task=recurring_task_data,
                 agency_id=current_agency["id"],
                 user_id=UUID(current_user["id"])
             )
     
+    # Serialize from the in-memory state before committing, so nothing is reloaded afterwards
     # Serialize subtasks
     subtasks_list = []
     if task.subtasks:
@@ -694,8 +591,8 @@ def update_task(
         "updated_by_role": task.updated_by_role,
         "created_at": task.created_at,
         "updated_at": task.updated_at,
-        "total_logged_seconds": total_seconds,
-        "is_timer_running_for_me": is_timer_running_for_me,
+        "total_logged_seconds": logged_time["total_logged_seconds"],
+        "is_timer_running_for_me": logged_time["is_timer_running_for_me"],
         "subtasks": subtasks_list,
         "is_recurring": task.is_recurring,
         "recurrence_frequency": task.recurrence_frequency,
@@ -706,15 +603,21 @@ def update_task(
         "recurrence_start_date": task.recurrence_start_date
     }
     
-    # Include stage object if loaded
-    if task.stage:
+    # Include the stage; the loaded relationship is stale when stage_id was just changed
+    stage = task.stage
+    if task.stage_id and (stage is None or stage.id != task.stage_id):
+        from app.models.task_stage import TaskStage
+        stage = db.query(TaskStage).filter(TaskStage.id == task.stage_id).first()
+    if stage:
         task_dict["stage"] = {
-            "id": task.stage.id,
-            "name": task.stage.name,
-            "color": task.stage.color,
-            "description": task.stage.description
+            "id": stage.id,
+            "name": stage.name,
+            "color": stage.color,
+            "description": stage.description
         }
     
+    db.commit()
+    
     return TaskSchema(**task_dict)
 
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -738,13 +641,12 @@ def get_task_history(
     task_id: UUID,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user),
     current_agency: dict = Depends(get_current_agency),
 ):
     # Verify task exists
-    task = crud_task.get_task(db=db, task_id=task_id, agency_id=current_agency["id"])
-    if not task:
+    if not crud_task.task_exists(db, task_id, current_agency["id"]):
         raise HTTPException(status_code=404, detail="Task not found")
     
     return crud_activity_log.get_activity_logs_by_task(
@@ -756,14 +658,14 @@ def get_task_history(
     )
 
 @router.post("/{task_id}/timer/start", response_model=TaskTimer)
-def start_task_timer(
+async def start_task_timer(
     task_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user),
     current_agency: dict = Depends(get_current_agency),
 ):
-    timer = crud_task_timer.start_timer(
-        db=db,
+    timer = await db.run_sync(
+        crud_task_timer.start_timer,
         task_id=task_id,
         agency_id=current_agency["id"],
         user_id=UUID(current_user["id"])
@@ -773,14 +675,14 @@ def start_task_timer(
     return timer
 
 @router.post("/{task_id}/timer/stop", response_model=TaskTimer)
-def stop_task_timer(
+async def stop_task_timer(
     task_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user),
     current_agency: dict = Depends(get_current_agency),
 ):
-    timer = crud_task_timer.stop_timer(
-        db=db,
+    timer = await db.run_sync(
+        crud_task_timer.stop_timer,
         task_id=task_id,
         agency_id=current_agency["id"],
         user_id=UUID(current_user["id"])
@@ -835,8 +737,7 @@ def get_subtasks(
     current_agency: dict = Depends(get_current_agency),
 ):
     # Verify task exists
-    task = crud_task.get_task(db=db, task_id=task_id, agency_id=current_agency["id"])
-    if not task:
+    if not crud_task.task_exists(db, task_id, current_agency["id"]):
         raise HTTPException(status_code=404, detail="Task not found")
     
     return crud_task_subtask.get_subtasks_by_task(
@@ -890,7 +791,6 @@ def add_task_collaborator(
     task_id: UUID,
     collaborator: TaskCollaboratorCreate,
     db: Session = Depends(get_db),
-    token: str = Depends(http_bearer),
     current_user: dict = Depends(get_current_user),
     current_agency: dict = Depends(get_current_agency),
 ):
@@ -916,53 +816,15 @@ def add_task_collaborator(
         added_by=UUID(current_user["id"])
     )
     
-    # Send email notification to the new collaborator
-    from app.utils.email import send_task_creation_email
-    import threading
-    
-    logger.info(f"Collaborator {collaborator.user_id} added to task #{task.task_number} - preparing to send email notification")
-    
-    def send_email_to_collaborator():
-        try:
-            token_str = token.credentials if hasattr(token, 'credentials') else None
-            logger.debug(f"Fetching email for collaborator {collaborator.user_id}")
-            collaborator_email = fetch_user_email_from_login_service(
-                collaborator.user_id,
-                token_str
-            )
-            if collaborator_email:
-                logger.info(f"Sending task notification email to collaborator: {collaborator_email}")
-                creator_name = task.created_by_name or current_user.get("name") or current_user.get("email", "Unknown")
-                task_description = task.description
-                due_date_str = None
-                if task.due_date:
-                    due_date_str = task.due_date.strftime("%Y-%m-%d")
-                    if task.due_time:
-                        due_date_str += f" at {task.due_time}"
-                priority_str = task.priority.value if task.priority else None
-                
-                result = send_task_creation_email(
-                    to_email=collaborator_email,
-                    task_title=task.title,
-                    task_number=task.task_number or 0,
-                    creator_name=creator_name,
-                    task_description=task_description,
-                    due_date=due_date_str,
-                    priority=priority_str
-                )
-                if result:
-                    logger.info(f"Successfully sent email to collaborator {collaborator_email} for task #{task.task_number}")
-                else:
-                    logger.warning(f"Failed to send email to collaborator {collaborator_email} for task #{task.task_number}")
-            else:
-                logger.warning(f"Could not fetch email for collaborator {collaborator.user_id} - email not sent")
-        except Exception as e:
-            logger.error(f"Error sending email to collaborator {collaborator.user_id}: {e}", exc_info=True)
-    
-    # Start email sending in background thread
-    email_thread = threading.Thread(target=send_email_to_collaborator)
-    email_thread.daemon = True
-    email_thread.start()
+    # Queue email notification to the new collaborator
+    logger.info(f"Collaborator {collaborator.user_id} added to task #{task.task_number} - queueing email notification")
+    try:
+        queued_emails = queue_task_assignment_email(db, task, [collaborator.user_id], current_user)
+        db.commit()
+        notify_workers(queued_emails)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error queueing email to collaborator {collaborator.user_id}: {e}", exc_info=True)
     
     return db_collaborator
 
@@ -976,8 +838,7 @@ def remove_task_collaborator(
 ):
     """Remove a collaborator from a task"""
     # Verify task exists and belongs to agency
-    task = crud_task.get_task(db, task_id, current_agency["id"])
-    if not task:
+    if not crud_task.task_exists(db, task_id, current_agency["id"]):
         raise HTTPException(status_code=404, detail="Task not found")
     
     deleted = crud_task_collaborator.remove_collaborator(
@@ -1001,8 +862,7 @@ def get_task_collaborators(
 ):
     """Get all collaborators for a task"""
     # Verify task exists and belongs to agency
-    task = crud_task.get_task(db, task_id, current_agency["id"])
-    if not task:
+    if not crud_task.task_exists(db, task_id, current_agency["id"]):
         raise HTTPException(status_code=404, detail="Task not found")
     
     return crud_task_collaborator.get_task_collaborators(db=db, task_id=task_id)
@@ -1036,7 +896,7 @@ def request_task_closure(
             detail="Task is already completed"
         )
     
-    # Create closure request
+    # The closure request and its activity log are committed together below
     closure_request.task_id = task_id
     db_request = crud_task_closure_request.create_closure_request(
         db=db,
@@ -1048,26 +908,25 @@ def request_task_closure(
     crud_activity_log.create_activity_log(
         db=db,
         task_id=task_id,
-        action="closure_requested",
+        action="Closure requested",
         user_id=UUID(current_user["id"]),
-        details={"request_id": str(db_request.id)}
+        details="Requested to close the task",
+        event_type="closure_requested",
+        to_value={"request_id": str(db_request.id)}
     )
+    db.commit()
     
-    # Emit notification to task creator (if different from requester)
+    # Notify the task creator (if different from requester); queued for the event loop, never blocks this thread
     try:
-        from app.socketio_manager import emit_task_notification
-        import asyncio
+        from app.socketio_manager import emit_bridge, emit_task_notification
         if task.created_by != UUID(current_user["id"]):
-            asyncio.create_task(emit_task_notification(
-                str(task.created_by),
-                {
-                    "type": "closure_request",
-                    "task_id": str(task_id),
-                    "task_title": task.title,
-                    "requested_by": current_user.get("name") or current_user.get("email", "Unknown"),
-                    "request_id": str(db_request.id)
-                }
-            ))
+            emit_bridge.submit(emit_task_notification, str(task.created_by), {
+                "type": "closure_request",
+                "task_id": str(task_id),
+                "task_title": task.title,
+                "requested_by": current_user.get("name") or current_user.get("email", "Unknown"),
+                "request_id": str(db_request.id)
+            })
     except Exception as e:
         logger.error(f"Socket.IO notification error: {e}")
     
@@ -1107,7 +966,7 @@ def review_closure_request(
             detail=f"Closure request has already been {db_request.status.value}"
         )
     
-    # Update closure request
+    # The review, the task status change and their activity logs are committed together below
     updated_request = crud_task_closure_request.update_closure_request(
         db=db,
         request_id=request_id,
@@ -1120,7 +979,7 @@ def review_closure_request(
     if closure_request_update.status == ClosureRequestStatus.approved:
         from app.schemas.task import TaskUpdate
         task_update = TaskUpdate(status=TaskStatus.completed)
-        crud_task.update_task(
+        crud_task.apply_task_update(
             db=db,
             task_id=task_id,
             task_update=task_update,
@@ -1129,52 +988,52 @@ def review_closure_request(
         )
         
         # Create activity log
+        reviewer_name = current_user.get("name") or current_user.get("email", "Unknown")
         crud_activity_log.create_activity_log(
             db=db,
             task_id=task_id,
-            action="task_closed",
+            action="Task closed",
             user_id=UUID(current_user["id"]),
-            details={"closure_request_id": str(request_id), "approved_by": current_user.get("name") or current_user.get("email", "Unknown")}
+            details=f"Closure request approved by {reviewer_name}",
+            event_type="closure_approved",
+            to_value={"closure_request_id": str(request_id), "approved_by": reviewer_name}
         )
+        db.commit()
         
-        # Emit notification to requester
+        # Notify the requester; queued for the event loop, never blocks this thread
         try:
-            from app.socketio_manager import emit_task_notification
-            import asyncio
-            asyncio.create_task(emit_task_notification(
-                str(db_request.requested_by),
-                {
-                    "type": "closure_approved",
-                    "task_id": str(task_id),
-                    "task_title": task.title,
-                    "reviewed_by": current_user.get("name") or current_user.get("email", "Unknown")
-                }
-            ))
+            from app.socketio_manager import emit_bridge, emit_task_notification
+            emit_bridge.submit(emit_task_notification, str(db_request.requested_by), {
+                "type": "closure_approved",
+                "task_id": str(task_id),
+                "task_title": task.title,
+                "reviewed_by": reviewer_name
+            })
         except Exception as e:
             logger.error(f"Socket.IO notification error: {e}")
     else:
         # Create activity log for rejection
+        reviewer_name = current_user.get("name") or current_user.get("email", "Unknown")
         crud_activity_log.create_activity_log(
             db=db,
             task_id=task_id,
-            action="closure_rejected",
+            action="Closure rejected",
             user_id=UUID(current_user["id"]),
-            details={"closure_request_id": str(request_id), "rejected_by": current_user.get("name") or current_user.get("email", "Unknown")}
+            details=f"Closure request rejected by {reviewer_name}",
+            event_type="closure_rejected",
+            to_value={"closure_request_id": str(request_id), "rejected_by": reviewer_name}
         )
+        db.commit()
         
-        # Emit notification to requester
+        # Notify the requester; queued for the event loop, never blocks this thread
         try:
-            from app.socketio_manager import emit_task_notification
-            import asyncio
-            asyncio.create_task(emit_task_notification(
-                str(db_request.requested_by),
-                {
-                    "type": "closure_rejected",
-                    "task_id": str(task_id),
-                    "task_title": task.title,
-                    "reviewed_by": current_user.get("name") or current_user.get("email", "Unknown")
-                }
-            ))
+            from app.socketio_manager import emit_bridge, emit_task_notification
+            emit_bridge.submit(emit_task_notification, str(db_request.requested_by), {
+                "type": "closure_rejected",
+                "task_id": str(task_id),
+                "task_title": task.title,
+                "reviewed_by": reviewer_name
+            })
         except Exception as e:
             logger.error(f"Socket.IO notification error: {e}")
     
@@ -1189,8 +1048,7 @@ def get_closure_request(
 ):
     """Get pending closure request for a task"""
     # Verify task exists and belongs to agency
-    task = crud_task.get_task(db, task_id, current_agency["id"])
-    if not task:
+    if not crud_task.task_exists(db, task_id, current_agency["id"]):
         raise HTTPException(status_code=404, detail="Task not found")
     
     return crud_task_closure_request.get_pending_closure_request(db, task_id)
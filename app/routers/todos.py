@@ -3,16 +3,13 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
 
-from fastapi import Request
+from app.database import get_db
 from app.dependencies import get_current_user, get_current_agency
 from app.crud import crud_todo
 from app.schemas.todo import TodoCreate, TodoUpdate, Todo
 
 router = APIRouter()
 
-def get_db(request: Request):
-    return request.state.db
-
 @router.post("/", response_model=Todo, status_code=status.HTTP_201_CREATED)
 def create_todo(
     todo: TodoCreate,
@@ -73,6 +73,7 @@ class RecurringTask(RecurringTaskBase):
     created_at: datetime
     updated_at: datetime
     last_created_at: Optional[datetime] = None
+    next_run_date: Optional[date] = None
 
     class Config:
         from_attributes = True
@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from uuid import UUID
+from datetime import date
+import datetime
+
+class TimesheetRow(BaseModel):
+    """Logged time for one combination of the requested group_by dimensions"""
+    user_id: Optional[UUID] = None
+    client_id: Optional[UUID] = None
+    task_id: Optional[UUID] = None
+    date: Optional[datetime.date] = None  # UTC day
+    total_seconds: int
+    entry_count: int
+
+class Timesheet(BaseModel):
+    from_date: date
+    to_date: date
+    group_by: List[str]
+    total_seconds: int
+    rows: List[TimesheetRow]
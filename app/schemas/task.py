@@ -121,6 +121,7 @@ class Task(TaskBase):
 class TaskListItem(BaseModel):
     has_unread_messages: Optional[bool] = False  # Indicates if user has unread messages
     is_recurring: Optional[bool] = False  # Is this a recurring task?
+    total_logged_seconds: Optional[int] = 0  # From the logged-time rollup plus running timers
     """Lightweight schema for list views"""
     id: UUID
     task_number: Optional[int] = None  # Sequential task number (T.ID)
@@ -0,0 +1,219 @@
+"""
+Versioned schema migrations, applied once per deploy (never on application import).
+
+Scripts live in migrations/ as NNN_description.sql and are applied in version order, each in its
+own transaction. Applied versions are recorded in the schema_migrations table, and a Postgres
+advisory lock keeps concurrent deploys from applying the same script twice.
+
+An empty database is created from the models and every existing script is recorded as applied.
+A database whose scripts were applied by hand before this runner existed must be baselined once,
+up to the last script applied by hand (012 for databases that predate the runner).
+
+Usage:
+    python -m app.services.migrate [upgrade]
+    python -m app.services.migrate status
+    python -m app.services.migrate baseline --version NNN
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from app import models  # noqa: F401  (registers every table with Base.metadata)
+from app.database import Base, batch_engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "migrations")
+
+_SCRIPT_NAME = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# Last script that was applied by hand before this runner existed; later scripts must be run, not baselined
+LAST_HAND_APPLIED_VERSION = "012"
+
+# Key of the session-level advisory lock held while migrating ("task" in ASCII)
+_LOCK_KEY = 0x7461736B
+
+_CREATE_TRACKING_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(32) PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum VARCHAR(64) NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+@dataclass
+class Migration:
+    version: str
+    name: str
+    path: str
+
+    @property
+    def sql(self) -> str:
+        with open(self.path, encoding="utf-8") as f:
+            return f.read()
+
+    @property
+    def checksum(self) -> str:
+        """Checksum of the script, independent of line endings"""
+        return hashlib.sha256(self.sql.replace("\r\n", "\n").encode("utf-8")).hexdigest()
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """All migration scripts in version order"""
+    migrations = {}
+    for filename in os.listdir(directory):
+        if not filename.endswith(".sql"):
+            continue
+        match = _SCRIPT_NAME.match(filename)
+        if not match:
+            raise RuntimeError(f"Migration script {filename} is not named NNN_description.sql")
+        version = match.group(1)
+        if version in migrations:
+            raise RuntimeError(f"Duplicate migration version {version}: {migrations[version].name}, {filename}")
+        migrations[version] = Migration(version=version, name=filename, path=os.path.join(directory, filename))
+    return [migrations[v] for v in sorted(migrations, key=int)]
+
+def _lock(connection: Connection) -> None:
+    connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _LOCK_KEY})
+    connection.commit()
+
+def _unlock(connection: Connection) -> None:
+    connection.rollback()
+    connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
+    connection.commit()
+
+def _get_applied(connection: Connection) -> Dict[str, str]:
+    """Applied version -> checksum recorded when it was applied"""
+    if not inspect(connection).has_table("schema_migrations"):
+        return {}
+    rows = connection.execute(text("SELECT version, checksum FROM schema_migrations"))
+    return {version: checksum for version, checksum in rows}
+
+def _record(connection: Connection, migration: Migration) -> None:
+    connection.execute(
+        text("INSERT INTO schema_migrations (version, name, checksum) VALUES (:version, :name, :checksum)"),
+        {"version": migration.version, "name": migration.name, "checksum": migration.checksum}
+    )
+
+def upgrade(directory: str = MIGRATIONS_DIR) -> List[str]:
+    """Apply pending scripts in version order. Returns the names of the applied scripts."""
+    migrations = discover_migrations(directory)
+    applied_names = []
+
+    with batch_engine.connect() as connection:
+        _lock(connection)
+        try:
+            applied = _get_applied(connection)
+
+            if not applied:
+                if inspect(connection).has_table("tasks"):
+                    raise RuntimeError(
+                        "Database has tables but no recorded migrations; run "
+                        f"`python -m app.services.migrate baseline --version {LAST_HAND_APPLIED_VERSION}` once "
+                        "(or the last script you applied by hand, if different) to record them, then upgrade again"
+                    )
+                # Empty database: the models are the current schema, every script is already reflected in them
+                connection.exec_driver_sql(_CREATE_TRACKING_TABLE)
+                Base.metadata.create_all(bind=connection)
+                for migration in migrations:
+                    _record(connection, migration)
+                connection.commit()
+                logger.info(f"Created schema from models; recorded {len(migrations)} migration(s) as applied")
+                return []
+
+            for migration in migrations:
+                if migration.version in applied:
+                    if applied[migration.version] != migration.checksum:
+                        logger.warning(f"Migration {migration.name} changed after it was applied")
+                    continue
+
+                logger.info(f"Applying {migration.name}")
+                try:
+                    connection.exec_driver_sql(migration.sql)
+                    _record(connection, migration)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    logger.error(f"Migration {migration.name} failed; it and later scripts were not applied")
+                    raise
+                applied_names.append(migration.name)
+        finally:
+            _unlock(connection)
+
+    return applied_names
+
+def baseline(version: str, directory: str = MIGRATIONS_DIR) -> List[str]:
+    """Record scripts up to `version` as applied without running them"""
+    migrations = [m for m in discover_migrations(directory) if int(m.version) <= int(version)]
+    recorded = []
+
+    with batch_engine.connect() as connection:
+        _lock(connection)
+        try:
+            connection.exec_driver_sql(_CREATE_TRACKING_TABLE)
+            applied = _get_applied(connection)
+            for migration in migrations:
+                if migration.version not in applied:
+                    _record(connection, migration)
+                    recorded.append(migration.name)
+            connection.commit()
+        finally:
+            _unlock(connection)
+
+    return recorded
+
+def status(directory: str = MIGRATIONS_DIR) -> List[dict]:
+    """Each script with whether it is applied, pending or changed since it was applied"""
+    with batch_engine.connect() as connection:
+        applied = _get_applied(connection)
+
+    result = []
+    for migration in discover_migrations(directory):
+        if migration.version not in applied:
+            state = "pending"
+        elif applied[migration.version] != migration.checksum:
+            state = "changed"
+        else:
+            state = "applied"
+        result.append({"version": migration.version, "name": migration.name, "state": state})
+    return result
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations from migrations/")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status", "baseline"])
+    parser.add_argument(
+        "--version",
+        help=f"baseline: record scripts up to this version (required; {LAST_HAND_APPLIED_VERSION} for databases that predate the runner)"
+    )
+    args = parser.parse_args(argv)
+    if args.command == "baseline" and not args.version:
+        parser.error(f"baseline requires --version (e.g. --version {LAST_HAND_APPLIED_VERSION})")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    try:
+        if args.command == "status":
+            for row in status():
+                logger.info(f"{row['state']:>8}  {row['name']}")
+        elif args.command == "baseline":
+            recorded = baseline(args.version)
+            logger.info(f"Recorded {len(recorded)} migration(s) as applied")
+        else:
+            applied = upgrade()
+            logger.info(f"Applied {len(applied)} migration(s)")
+    except Exception as e:
+        logger.error(f"Migration {args.command} failed: {e}")
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
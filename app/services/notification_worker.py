@@ -0,0 +1,283 @@
+"""Notification outbox workers.
+
+Requests only write rows to the notification_outbox table (in the same database as everything
+else, so nothing is lost on restart). A fixed pool of worker threads drains the outbox, resolves
+recipient emails through the Login service (one batched lookup per claimed batch), sends the
+emails with a per-process cap on concurrent sends, and retries failures with exponential backoff.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app import config
+from app.crud import crud_notification_outbox
+from app.database import SessionLocal
+from app.models.notification_outbox import NotificationOutbox
+from app.services.user_directory import get_user_directory
+from app.utils.email import send_task_creation_email, send_task_comment_email
+
+logger = logging.getLogger(__name__)
+
+# Notification kind -> email sender; payload keys are passed as keyword arguments
+NOTIFICATION_SENDERS: Dict[str, Callable[..., bool]] = {
+    "task_created": send_task_creation_email,
+    "task_comment": send_task_comment_email,
+}
+
+class NotificationMetrics:
+    """Thread-safe counters for the outbox workers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.send_count = 0
+        self.send_seconds_total = 0.0
+        self.send_seconds_max = 0.0
+        self.delivery_seconds_total = 0.0  # From enqueue to successful send
+
+    def record_enqueued(self, count: int) -> None:
+        with self._lock:
+            self.enqueued += count
+
+    def send_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def send_finished(self, seconds: float, outcome: str, delivery_seconds: Optional[float] = None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.send_count += 1
+            self.send_seconds_total += seconds
+            self.send_seconds_max = max(self.send_seconds_max, seconds)
+            if outcome == "sent":
+                self.sent += 1
+                if delivery_seconds is not None:
+                    self.delivery_seconds_total += delivery_seconds
+            elif outcome == "retried":
+                self.retried += 1
+            else:
+                self.failed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enqueued": self.enqueued,
+                "sent": self.sent,
+                "retried": self.retried,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "send_latency_seconds": {
+                    "count": self.send_count,
+                    "avg": self.send_seconds_total / self.send_count if self.send_count else 0.0,
+                    "max": self.send_seconds_max,
+                },
+                "delivery_latency_seconds_avg": self.delivery_seconds_total / self.sent if self.sent else 0.0,
+            }
+
+metrics = NotificationMetrics()
+
+class NotificationWorkerPool:
+    """Fixed-size pool of threads draining the notification outbox"""
+
+    def __init__(
+        self,
+        workers: int,
+        max_concurrent_sends: int,
+        batch_size: int,
+        poll_interval: float,
+        max_attempts: int,
+        retry_base_seconds: float,
+        retry_max_seconds: float,
+        stale_lock_seconds: int
+    ):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.stale_lock_seconds = stale_lock_seconds
+        self._send_slots = threading.BoundedSemaphore(max(1, max_concurrent_sends))
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"notification-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} notification worker(s)")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Notification workers stopped")
+
+    def wake(self) -> None:
+        """Let idle workers pick up newly queued notifications without waiting for the next poll"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            claimed = 0
+            try:
+                claimed = self._drain_batch()
+            except Exception as e:
+                logger.error(f"Notification worker error: {e}", exc_info=True)
+
+            # A full batch means more work is probably waiting
+            if claimed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _drain_batch(self) -> int:
+        db = SessionLocal()
+        try:
+            notifications = crud_notification_outbox.claim_due_notifications(
+                db, self.batch_size, self.stale_lock_seconds
+            )
+            emails = self._resolve_emails(notifications)
+            for notification in notifications:
+                if self._stop.is_set():
+                    # Left in 'sending'; picked up again once its lock goes stale
+                    break
+                self._deliver(db, notification, emails.get(str(notification.recipient_user_id)))
+            return len(notifications)
+        finally:
+            db.close()
+
+    def _retry_delay(self, attempts: int) -> Optional[float]:
+        """Exponential backoff with jitter, or None once attempts are exhausted"""
+        if attempts >= self.max_attempts:
+            return None
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _resolve_emails(self, notifications) -> Dict[str, str]:
+        """Recipient user_id -> email for the notifications stored without one, in one batched lookup"""
+        user_ids = {n.recipient_user_id for n in notifications if not n.to_email and n.recipient_user_id}
+        if not user_ids:
+            return {}
+        try:
+            users = get_user_directory().get_users(user_ids, config.INTERNAL_SERVICE_TOKEN)
+        except Exception as e:
+            logger.warning(f"Could not resolve emails for {len(user_ids)} notification recipient(s): {e}")
+            return {}
+        return {user_id: user["email"] for user_id, user in users.items() if user and user.get("email")}
+
+    def _deliver(self, db: Session, notification: NotificationOutbox, resolved_email: Optional[str] = None) -> None:
+        notification_id = notification.id
+        attempts = notification.attempts
+
+        sender = NOTIFICATION_SENDERS.get(notification.kind)
+        if sender is None:
+            crud_notification_outbox.mark_notification_failed(
+                db, notification_id, f"Unknown notification kind: {notification.kind}", None
+            )
+            return
+
+        to_email = notification.to_email
+        if not to_email and resolved_email:
+            to_email = resolved_email
+            crud_notification_outbox.set_notification_email(db, notification_id, to_email)
+
+        if not to_email:
+            crud_notification_outbox.mark_notification_failed(
+                db, notification_id, "Recipient email could not be resolved", self._retry_delay(attempts)
+            )
+            return
+
+        error = None
+        with self._send_slots:
+            metrics.send_started()
+            started = time.monotonic()
+            try:
+                if not sender(to_email=to_email, **(notification.payload or {})):
+                    error = "Email provider did not accept the message"
+            except Exception as e:
+                error = str(e)
+            elapsed = time.monotonic() - started
+
+        if error is None:
+            crud_notification_outbox.mark_notification_sent(db, notification_id)
+            delivery_seconds = None
+            if notification.created_at:
+                delivery_seconds = max(0.0, time.time() - notification.created_at.timestamp())
+            metrics.send_finished(elapsed, "sent", delivery_seconds)
+            logger.info(f"Sent {notification.kind} notification {notification_id} to {to_email}")
+        else:
+            retry_in = self._retry_delay(attempts)
+            crud_notification_outbox.mark_notification_failed(db, notification_id, error, retry_in)
+            metrics.send_finished(elapsed, "retried" if retry_in is not None else "failed")
+            logger.warning(
+                f"Failed to send {notification.kind} notification {notification_id} to {to_email} "
+                f"(attempt {attempts}/{self.max_attempts}): {error}"
+            )
+
+# Process-wide worker pool (started on application startup)
+_pool: Optional[NotificationWorkerPool] = None
+
+def get_notification_pool() -> NotificationWorkerPool:
+    """Get or create the process-wide notification worker pool"""
+    global _pool
+    if _pool is None:
+        _pool = NotificationWorkerPool(
+            workers=config.NOTIFICATION_WORKERS,
+            max_concurrent_sends=config.NOTIFICATION_MAX_CONCURRENT_SENDS,
+            batch_size=config.NOTIFICATION_BATCH_SIZE,
+            poll_interval=config.NOTIFICATION_POLL_INTERVAL,
+            max_attempts=config.NOTIFICATION_MAX_ATTEMPTS,
+            retry_base_seconds=config.NOTIFICATION_RETRY_BASE_SECONDS,
+            retry_max_seconds=config.NOTIFICATION_RETRY_MAX_SECONDS,
+            stale_lock_seconds=config.NOTIFICATION_STALE_LOCK_SECONDS,
+        )
+    return _pool
+
+def start_notification_workers() -> None:
+    get_notification_pool().start()
+
+def stop_notification_workers() -> None:
+    if _pool is not None:
+        _pool.stop()
+
+def enqueue_notification(
+    db: Session,
+    kind: str,
+    recipients: Dict[str, Optional[str]],
+    payload: dict
+) -> int:
+    """Queue a notification for each recipient (user_id -> email or None) in the caller's transaction.
+
+    Nothing is committed here, so the notifications are saved atomically with the change that
+    caused them. Call notify_workers with the returned count once the transaction has committed.
+    """
+    notifications = crud_notification_outbox.enqueue_notifications(db, kind, recipients, payload)
+    return len(notifications)
+
+def notify_workers(count: int) -> None:
+    """Record `count` committed notifications and wake the workers to deliver them"""
+    if count:
+        metrics.record_enqueued(count)
+        if _pool is not None:
+            _pool.wake()
+
+def get_notification_metrics(db: Session) -> dict:
+    """Worker counters plus current queue depth"""
+    snapshot = metrics.snapshot()
+    snapshot["queue_depth"] = crud_notification_outbox.count_notifications_by_status(db)
+    return snapshot
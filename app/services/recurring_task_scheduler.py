@@ -2,12 +2,18 @@
 Service to automatically create tasks from recurring task templates.
 This should be run as a background job (e.g., via cron, celery, or APScheduler).
 """
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
 from datetime import datetime, date, timedelta
-from typing import List
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Tuple
+from uuid import UUID, uuid4
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import logging
+import time
 
-from app.database import SessionLocal
+from app import config
+from app.database import BatchSessionLocal, batch_engine
 from app import crud
 from app.schemas.task import TaskCreate, TaskPriority
 from app.schemas.task import DocumentRequest as DocumentRequestSchema
@@ -21,62 +27,309 @@ def create_tasks_from_recurring_templates(check_date: date = None) -> int:
     
     Returns the number of tasks created.
     """
+    return materialize_recurring_tasks(check_date)["tasks_created"]
+
+def materialize_recurring_tasks(
+    check_date: date = None,
+    batch_size: int = None,
+    catch_up: bool = False,
+    workers: int = None,
+    executor: str = None
+) -> dict:
+    """
+    Create tasks for all recurring templates due on the given date, in chunks.
+    
+    With catch_up, occurrences missed since each template's next_run_date (e.g. a day the
+    cron did not run) are created as well, up to check_date.
+    """
     if check_date is None:
         check_date = date.today()
     
-    db: Session = SessionLocal()
-    tasks_created = 0
-    
-    try:
+    def load_occurrences(db: Session) -> List[Tuple[Any, date]]:
+        if catch_up:
+            recurring_tasks = crud.crud_recurring_task.get_active_recurring_tasks_scheduled_through(
+                db=db,
+                check_date=check_date
+            )
+            occurrences = []
+            for recurring_task in recurring_tasks:
+                occurrence_dates = crud.crud_recurring_task.get_occurrence_dates(
+                    recurring_task, recurring_task.next_run_date, check_date
+                )
+                if not occurrence_dates:
+                    # Nothing due through check_date (next_run_date was not an actual occurrence):
+                    # move it forward so the template is not reloaded on every run (committed by the caller)
+                    crud.crud_recurring_task.refresh_next_run_date(recurring_task, check_date + timedelta(days=1))
+                occurrences.extend((recurring_task, occurrence_date) for occurrence_date in occurrence_dates)
+            return occurrences
+        
         # Get all active recurring tasks that should create tasks today
         recurring_tasks = crud.crud_recurring_task.get_active_recurring_tasks_due(
             db=db,
             check_date=check_date
         )
-        
-        logger.info(f"Found {len(recurring_tasks)} recurring tasks due on {check_date}")
-        
-        for recurring_task in recurring_tasks:
-            try:
-                # Create task from template
-                task_data = create_task_from_recurring_template(recurring_task, check_date)
-                
-                # Get agency_id and created_by from recurring task
-                agency_id = recurring_task.agency_id
-                created_by = recurring_task.created_by
-                
-                # Create the task
-                created_task = crud.crud_task.create_task(
-                    db=db,
-                    task=task_data,
-                    agency_id=agency_id,
-                    user_id=created_by
-                )
-                
-                # Update last_created_at timestamp
-                crud.crud_recurring_task.update_last_created_at(
-                    db=db,
-                    recurring_task_id=recurring_task.id,
-                    created_at=datetime.utcnow()
-                )
-                
-                tasks_created += 1
-                logger.info(f"Created task '{created_task.title}' from recurring task '{recurring_task.title}'")
-                
-            except Exception as e:
-                logger.error(f"Error creating task from recurring task {recurring_task.id}: {str(e)}")
-                continue
-        
+        return [(recurring_task, check_date) for recurring_task in recurring_tasks]
+    
+    report = _materialize(load_occurrences, batch_size, workers, executor)
+    report["check_date"] = check_date
+    return report
+
+def materialize_recurring_tasks_range(
+    from_date: date,
+    to_date: date,
+    batch_size: int = None,
+    workers: int = None,
+    executor: str = None
+) -> dict:
+    """
+    Create tasks for every occurrence of every active template between from_date and
+    to_date (inclusive), e.g. to backfill days the scheduler missed.
+    
+    Occurrences are expanded per template with date arithmetic. Occurrences that were
+    already created (by an earlier run or backfill) are skipped, so reruns are safe; dates
+    before a template's occurrences_tracked_from (runs from before occurrences were
+    recorded) are never backfilled.
+    """
+    def load_occurrences(db: Session) -> List[Tuple[Any, date]]:
+        recurring_tasks = crud.crud_recurring_task.get_active_recurring_tasks_between(
+            db=db,
+            from_date=from_date,
+            to_date=to_date
+        )
+        return [
+            (recurring_task, occurrence_date)
+            for recurring_task in recurring_tasks
+            for occurrence_date in crud.crud_recurring_task.get_occurrence_dates(
+                recurring_task, from_date, to_date
+            )
+        ]
+    
+    report = _materialize(load_occurrences, batch_size, workers, executor)
+    report["from_date"] = from_date
+    report["to_date"] = to_date
+    return report
+
+def _materialize(
+    load_occurrences: Callable[[Session], List[Tuple[Any, date]]],
+    batch_size: int = None,
+    workers: int = None,
+    executor: str = None
+) -> dict:
+    """
+    Create the tasks for (template, occurrence date) pairs, sharded by agency.
+    
+    Each agency is materialized on its own session (and, with workers > 1, on its own
+    thread or process), so a failure in one agency never rolls back another's work.
+    """
+    batch_size = batch_size or config.RECURRING_TASK_BATCH_SIZE
+    workers = workers or config.RECURRING_SCHEDULER_WORKERS
+    executor = executor or config.RECURRING_SCHEDULER_EXECUTOR
+    report = {"tasks_created": 0, "occurrences_skipped": 0, "failures": [], "agencies": []}
+    
+    # Only ids and dates leave this session, so shards can run in other processes. The templates
+    # stay loaded after the commit so their ids and agencies can be read once the session is closed.
+    db: Session = BatchSessionLocal(expire_on_commit=False)
+    try:
+        occurrences = load_occurrences(db)
         db.commit()
-        logger.info(f"Successfully created {tasks_created} tasks from recurring templates")
+    except Exception as e:
+        logger.error(f"Error loading recurring task occurrences: {str(e)}")
+        db.rollback()
+        return report
+    finally:
+        db.close()
+    
+    shards: Dict[UUID, List[Tuple[UUID, date]]] = {}
+    for recurring_task, occurrence_date in occurrences:
+        shards.setdefault(recurring_task.agency_id, []).append((recurring_task.id, occurrence_date))
+    
+    logger.info(f"Found {len(occurrences)} recurring task occurrences to create across {len(shards)} agencies")
+    
+    if workers <= 1 or len(shards) <= 1:
+        agency_stats = [
+            _materialize_agency(agency_id, items, batch_size)
+            for agency_id, items in shards.items()
+        ]
+    else:
+        if executor == "process":
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker_process)
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recurring-scheduler")
+        with pool:
+            futures = [
+                pool.submit(_materialize_agency, agency_id, items, batch_size)
+                for agency_id, items in shards.items()
+            ]
+            agency_stats = [future.result() for future in futures]
+    
+    for stats in agency_stats:
+        report["tasks_created"] += stats["tasks_created"]
+        report["occurrences_skipped"] += stats["occurrences_skipped"]
+        report["failures"].extend(stats.pop("failures"))
+        report["agencies"].append(stats)
+    
+    logger.info(
+        f"Successfully created {report['tasks_created']} tasks from recurring templates "
+        f"({report['occurrences_skipped']} already created, {len(report['failures'])} failed)"
+    )
+    return report
+
+def _init_worker_process() -> None:
+    """Drop connections inherited from the parent process; each worker opens its own"""
+    batch_engine.dispose(close=False)
+
+def _materialize_agency(agency_id: UUID, items: List[Tuple[UUID, date]], batch_size: int) -> dict:
+    """
+    Materialize one agency's occurrences on a dedicated session, in chunks.
+    
+    Each chunk claims its occurrences, allocates its task numbers in bulk and inserts its
+    tasks, activity logs and template updates with bulk inserts in a single transaction.
+    A template that fails is reported in "failures" without aborting the rest of its chunk.
+    """
+    started = time.monotonic()
+    stats = {
+        "agency_id": str(agency_id),
+        "templates_seen": len({recurring_task_id for recurring_task_id, _ in items}),
+        "occurrences": len(items),
+        "tasks_created": 0,
+        "occurrences_skipped": 0,
+        "failures": [],
+        "error": None,
+    }
+    
+    # Templates are loaded once up front and snapshotted, so commits and rollbacks never reload them
+    db: Session = BatchSessionLocal(expire_on_commit=False)
+    try:
+        templates = {
+            recurring_task.id: _snapshot_template(recurring_task)
+            for recurring_task in crud.crud_recurring_task.get_recurring_tasks_by_ids(
+                db, list({recurring_task_id for recurring_task_id, _ in items})
+            )
+        }
+        occurrences = [
+            (templates[recurring_task_id], occurrence_date)
+            for recurring_task_id, occurrence_date in items
+            if recurring_task_id in templates
+        ]
+        
+        for start in range(0, len(occurrences), batch_size):
+            chunk = occurrences[start:start + batch_size]
+            created, skipped = _materialize_chunk(db, chunk, stats["failures"])
+            stats["tasks_created"] += created
+            stats["occurrences_skipped"] += skipped
         
     except Exception as e:
-        logger.error(f"Error in create_tasks_from_recurring_templates: {str(e)}")
+        logger.error(f"Error materializing recurring tasks for agency {agency_id}: {str(e)}")
+        stats["error"] = str(e)
         db.rollback()
     finally:
         db.close()
     
-    return tasks_created
+    stats["duration_seconds"] = round(time.monotonic() - started, 3)
+    return stats
+
+def _snapshot_template(recurring_task) -> SimpleNamespace:
+    """Column values of a template, detached from the session"""
+    return SimpleNamespace(**{
+        attr.key: getattr(recurring_task, attr.key)
+        for attr in inspect(recurring_task).mapper.column_attrs
+    })
+
+def _materialize_chunk(db: Session, occurrences: list, failures: list) -> Tuple[int, int]:
+    """Create the tasks for one chunk of occurrences. Returns (created, already created)."""
+    created_at = datetime.utcnow()
+    
+    # Build the task data for every occurrence; a template that cannot be converted is skipped
+    prepared = []
+    for recurring_task, occurrence_date in occurrences:
+        try:
+            task_data = create_task_from_recurring_template(recurring_task, occurrence_date)
+            prepared.append((recurring_task, occurrence_date, task_data))
+        except Exception as e:
+            _record_failure(failures, recurring_task, occurrence_date, e)
+    
+    if not prepared:
+        return 0, 0
+    
+    try:
+        created = _insert_prepared(db, prepared, created_at)
+        db.commit()
+        return created, len(prepared) - created
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Bulk insert of {len(prepared)} recurring tasks failed ({e}); retrying one occurrence at a time")
+    
+    # Isolate the failing templates: one savepoint per occurrence, one commit for the chunk.
+    # Rolling back a failed occurrence's savepoint also reverts its occurrence claim and task number.
+    created = 0
+    skipped = 0
+    for item in prepared:
+        try:
+            with db.begin_nested():
+                if _insert_prepared(db, [item], created_at):
+                    created += 1
+                else:
+                    skipped += 1
+        except Exception as e:
+            _record_failure(failures, item[0], item[1], e)
+    db.commit()
+    return created, skipped
+
+def _insert_prepared(db: Session, prepared: list, created_at: datetime) -> int:
+    """Claim occurrences, allocate task numbers and bulk insert tasks, activity logs and
+    template updates (no commit). Returns the number of tasks inserted."""
+    task_ids = {(recurring_task.id, occurrence_date): uuid4() for recurring_task, occurrence_date, _ in prepared}
+    claimed = crud.crud_recurring_task.claim_occurrences(
+        db,
+        [(recurring_task_id, occurrence_date, task_id) for (recurring_task_id, occurrence_date), task_id in task_ids.items()]
+    )
+    prepared = [item for item in prepared if (item[0].id, item[1]) in claimed]
+    if not prepared:
+        return 0
+    
+    due_per_agency = {}
+    for recurring_task, _, _ in prepared:
+        due_per_agency[recurring_task.agency_id] = due_per_agency.get(recurring_task.agency_id, 0) + 1
+    reserved_numbers = {
+        agency_id: iter(crud.crud_task.reserve_task_numbers(db, agency_id, count))
+        for agency_id, count in due_per_agency.items()
+    }
+    
+    task_rows = []
+    activity_rows = []
+    run_dates = {}
+    templates = {}
+    for recurring_task, occurrence_date, task_data in prepared:
+        task_row, activity_row = crud.crud_task.build_task_rows(
+            task=task_data,
+            agency_id=recurring_task.agency_id,
+            user_id=recurring_task.created_by,
+            task_number=next(reserved_numbers[recurring_task.agency_id]),
+            created_at=created_at,
+            task_id=task_ids[(recurring_task.id, occurrence_date)]
+        )
+        task_rows.append(task_row)
+        activity_rows.append(activity_row)
+        templates[recurring_task.id] = recurring_task
+        run_dates[recurring_task.id] = max(occurrence_date, run_dates.get(recurring_task.id, occurrence_date))
+    
+    crud.crud_task.bulk_insert_tasks(db, task_rows, activity_rows)
+    crud.crud_recurring_task.bulk_mark_recurring_tasks_run(
+        db,
+        list(templates.values()),
+        run_dates=run_dates,
+        created_at=created_at
+    )
+    return len(task_rows)
+
+def _record_failure(failures: list, recurring_task, occurrence_date: date, error: Exception) -> None:
+    logger.error(f"Error creating task from recurring task {recurring_task.id} for {occurrence_date}: {str(error)}")
+    failures.append({
+        "recurring_task_id": str(recurring_task.id),
+        "title": recurring_task.title,
+        "occurrence_date": str(occurrence_date),
+        "error": str(error)
+    })
 
 def create_task_from_recurring_template(recurring_task, creation_date: date) -> TaskCreate:
     """Convert a recurring task template into a TaskCreate schema"""
@@ -0,0 +1,80 @@
+"""
+Benchmark the Socket.IO connection registry.
+
+Simulates N connections (each socket joins a few task rooms shared with other users), then
+disconnects them all, and reports the average cost of a connect and a disconnect. With the
+socket reverse indexes both stay flat as N grows; a scan over all connections would grow with N.
+
+Usage:
+    python -m app.services.socketio_benchmark [--connections 50000] [--rooms-per-socket 3]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from app import socketio_manager
+
+logger = logging.getLogger(__name__)
+
+SOCKETS_PER_USER = 2
+SOCKETS_PER_TASK = 50
+
+def _reset():
+    socketio_manager.user_connections.clear()
+    socketio_manager.task_rooms.clear()
+    socketio_manager.socket_users.clear()
+    socketio_manager.socket_rooms.clear()
+
+async def _run(connections: int, rooms_per_socket: int) -> Tuple[float, float]:
+    """Average microseconds per connect (register and join rooms) and per disconnect"""
+    _reset()
+    task_count = max(1, connections // SOCKETS_PER_TASK)
+
+    start = time.perf_counter()
+    for n in range(connections):
+        socket_id = f"sid-{n}"
+        user_id = f"user-{n // SOCKETS_PER_USER}"
+        await socketio_manager.register_user_connection(user_id, socket_id)
+        for r in range(rooms_per_socket):
+            await socketio_manager.join_task_room(f"task-{(n + r * 7919) % task_count}", user_id, socket_id)
+    connect_us = (time.perf_counter() - start) / connections * 1e6
+
+    start = time.perf_counter()
+    for n in range(connections):
+        await socketio_manager.disconnect_socket(f"sid-{n}")
+    disconnect_us = (time.perf_counter() - start) / connections * 1e6
+
+    leftovers = (socketio_manager.user_connections, socketio_manager.task_rooms,
+                 socketio_manager.socket_users, socketio_manager.socket_rooms)
+    if any(leftovers):
+        raise RuntimeError("Registry not empty after every socket disconnected")
+    return connect_us, disconnect_us
+
+def benchmark(connections: int = 50000, rooms_per_socket: int = 3) -> List[Tuple[int, float, float]]:
+    """(connections, connect us, disconnect us) at increasing registry sizes up to `connections`"""
+    sizes = sorted({max(1, connections // 50), max(1, connections // 5), connections})
+    results = []
+    for size in sizes:
+        connect_us, disconnect_us = asyncio.run(_run(size, rooms_per_socket))
+        results.append((size, connect_us, disconnect_us))
+    _reset()
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Socket.IO registry connect and disconnect cost")
+    parser.add_argument("--connections", type=int, default=50000)
+    parser.add_argument("--rooms-per-socket", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    for size, connect_us, disconnect_us in benchmark(args.connections, args.rooms_per_socket):
+        logger.info(f"{size:>7} connections: connect {connect_us:.2f} us, disconnect {disconnect_us:.2f} us")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
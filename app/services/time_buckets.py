@@ -0,0 +1,57 @@
+"""
+Backfill (or rebuild) the daily time buckets used by the timesheet report from the
+raw task_timers rows. Safe to rerun: each task's buckets are recomputed from scratch.
+
+Usage:
+    python -m app.services.time_buckets backfill [--agency-id <uuid>] [--batch-size 500]
+"""
+import argparse
+import logging
+import sys
+from typing import List, Optional
+from uuid import UUID
+
+from app.database import BatchSessionLocal
+from app.crud import crud_time_bucket
+
+logger = logging.getLogger(__name__)
+
+def backfill_time_buckets(agency_id: Optional[UUID] = None, batch_size: int = 500) -> int:
+    """Recompute the buckets of every task with timers, one transaction per batch of tasks.
+    Returns the number of timers processed."""
+    db = BatchSessionLocal()
+    timers_processed = 0
+    tasks_processed = 0
+    last_task_id = None
+    try:
+        while True:
+            task_ids = crud_time_bucket.get_task_ids_with_timers(db, agency_id, last_task_id, batch_size)
+            if not task_ids:
+                break
+            timers_processed += crud_time_bucket.rebuild_buckets_for_tasks(db, task_ids)
+            tasks_processed += len(task_ids)
+            last_task_id = task_ids[-1]
+            logger.info(f"Backfilled time buckets for {tasks_processed} tasks ({timers_processed} timers)")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    
+    return timers_processed
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Backfill daily time buckets from raw timers")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--agency-id", type=UUID, help="Only this agency; default is all agencies")
+    parser.add_argument("--batch-size", type=int, default=500, help="Tasks per transaction")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    timers_processed = backfill_time_buckets(args.agency_id, args.batch_size)
+    logger.info(f"Time bucket backfill completed ({timers_processed} timers)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
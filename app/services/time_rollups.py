@@ -0,0 +1,61 @@
+"""
+Verify or rebuild the logged-time rollups (task_time_rollups, task_user_time_rollups)
+from the raw task_timers rows, e.g. to repair drift.
+
+Usage:
+    python -m app.services.time_rollups verify [--task-id <uuid> ...]
+    python -m app.services.time_rollups rebuild [--task-id <uuid> ...]
+"""
+import argparse
+import logging
+import sys
+from typing import List, Optional
+from uuid import UUID
+
+from app.database import BatchSessionLocal
+from app.crud import crud_task_time_rollup
+
+logger = logging.getLogger(__name__)
+
+def verify(task_ids: Optional[List[UUID]] = None) -> List[dict]:
+    """Return the rollup rows that differ from the totals recomputed from raw timers"""
+    db = BatchSessionLocal()
+    try:
+        return crud_task_time_rollup.verify_rollups(db, task_ids)
+    finally:
+        db.close()
+
+def rebuild(task_ids: Optional[List[UUID]] = None) -> None:
+    """Recompute the rollups from raw timers"""
+    db = BatchSessionLocal()
+    try:
+        crud_task_time_rollup.rebuild_rollups(db, task_ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Verify or rebuild logged-time rollups from raw timers")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--task-id", dest="task_ids", action="append", type=UUID,
+                        help="Limit to this task (can be repeated); default is all tasks")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == "rebuild":
+        rebuild(args.task_ids)
+        logger.info("Rollups rebuilt from raw timers")
+
+    drift = verify(args.task_ids)
+    for row in drift:
+        scope = f"task {row['task_id']}" + (f" user {row['user_id']}" if row["user_id"] else "")
+        logger.warning(f"Drift for {scope}: stored {row['stored_seconds']}s, expected {row['expected_seconds']}s")
+    logger.info(f"{len(drift)} rollup row(s) drifted")
+
+    return 1 if drift else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+"""
+Client for looking up users in the Login service.
+Reuses pooled HTTP connections, caches lookups per user_id (404 misses included),
+collapses concurrent lookups of the same user into one request and stops calling
+the Login service for a while after repeated failures (circuit breaker).
+"""
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised when the Login service is skipped because the circuit breaker is open"""
+
+class _TransientLookupError(Exception):
+    """Lookup failed for a reason that must not be cached (timeout, 5xx, breaker open, a token
+    that may not see the user, a response that is not JSON)"""
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a per-entry TTL"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (hit, value); expired entries count as misses"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and lets a single trial
+    request through once `reset_seconds` have passed (half-open)."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def allow_request(self) -> bool:
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            if self._trial_in_progress:
+                return False
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Login service circuit breaker opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+class _InFlightLookup:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+
+class UserDirectoryClient:
+    """Cached, pooled client for user lookups against the Login service"""
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 5,
+        pool_size: int = 20,
+        cache_size: int = 5000,
+        cache_ttl: float = 300,
+        negative_cache_ttl: float = 60,
+        breaker_failures: int = 5,
+        breaker_reset_seconds: float = 30,
+        batch_path: Optional[str] = None,
+        fallback_concurrency: int = 8,
+        batch_denied_cooldown_seconds: float = 600,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.batch_path = batch_path.strip('/') if batch_path else None
+        self.fallback_concurrency = max(1, fallback_concurrency)
+        self.batch_denied_cooldown_seconds = batch_denied_cooldown_seconds
+        # Tokens (by hash) the batch endpoint rejected recently; their lookups go straight to single lookups
+        self._batch_denied = TTLCache(1000)
+        self.cache_ttl = cache_ttl
+        self.negative_cache_ttl = negative_cache_ttl
+        self.cache = TTLCache(cache_size)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset_seconds)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._in_flight: Dict[str, _InFlightLookup] = {}
+        self._in_flight_lock = threading.Lock()
+
+    def _request(self, path: str, token: Optional[str] = None, json_body: Optional[dict] = None) -> requests.Response:
+        """GET (or POST when a body is given) a Login service path through the circuit breaker"""
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("Login service circuit breaker is open")
+
+        headers = {"accept": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        try:
+            if json_body is None:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            else:
+                response = self.session.post(url, headers=headers, json=json_body, timeout=self.timeout)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _lookup(self, key: str, loader: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """Serve from cache, otherwise run the loader once for all concurrent callers of `key`"""
+        hit, value = self.cache.get(key)
+        if hit:
+            return value
+
+        with self._in_flight_lock:
+            in_flight = self._in_flight.get(key)
+            is_leader = in_flight is None
+            if is_leader:
+                in_flight = _InFlightLookup()
+                self._in_flight[key] = in_flight
+
+        if not is_leader:
+            in_flight.done.wait(self.timeout * 2 + 1)
+            return in_flight.value
+
+        try:
+            try:
+                value = loader()
+                self.cache.set(key, value, self.cache_ttl if value else self.negative_cache_ttl)
+            except (_TransientLookupError, CircuitOpenError, requests.RequestException) as e:
+                logger.warning(f"User lookup '{key}' failed, not caching: {e}")
+                value = None
+            in_flight.value = value
+            return value
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(key, None)
+            in_flight.done.set()
+
+    def get_profile(self, user_id: UUID, token: Optional[str] = None) -> Optional[dict]:
+        """Fetch the profile of the user the token belongs to (cached by that user's id)"""
+        def load() -> Optional[dict]:
+            response = self._request("profile/", token)
+            if response.status_code == 404:
+                return None
+            if response.status_code != 200:
+                # 5xx, or a 401/403 for an expired token: says nothing lasting about the user
+                raise _TransientLookupError(f"profile endpoint returned {response.status_code}")
+            user_data = _json(response, "profile endpoint")
+            if not isinstance(user_data, dict):
+                raise _TransientLookupError("profile endpoint returned an unexpected payload")
+            return {
+                "name": user_data.get("name"),
+                "email": user_data.get("email"),
+                "role": user_data.get("role"),
+            }
+
+        return self._lookup(f"profile:{user_id}", load)
+
+    def _load_user(self, user_id: str, token: Optional[str] = None) -> Optional[dict]:
+        """Fetch one user by id (admin endpoint, then team member endpoint), bypassing the cache.
+
+        Returns None only when every endpoint definitively has no such user (404, or a user without
+        an email); any other failure raises _TransientLookupError so the miss is not cached.
+        """
+        transient_error = None
+        for path in (f"admin/users/{user_id}", f"team/team-member/{user_id}"):
+            response = self._request(path, token)
+            if response.status_code == 404:
+                continue
+            if response.status_code != 200:
+                # 5xx, or 401/403 when the caller's token may not use this endpoint: another
+                # caller may well see the user, so the miss must not be cached for everyone
+                logger.debug(f"{path} returned status {response.status_code} for user {user_id}")
+                transient_error = _TransientLookupError(f"{path} returned {response.status_code}")
+                continue
+            try:
+                user = _parse_user(_json(response, path))
+            except _TransientLookupError as e:
+                transient_error = e
+                continue
+            if user:
+                return user
+        if transient_error:
+            raise transient_error
+        return None
+
+    def get_user(self, user_id: UUID, token: Optional[str] = None) -> Optional[dict]:
+        """Fetch any user's name, email and role by id"""
+        return self._lookup(f"user:{user_id}", lambda: self._load_user(str(user_id), token))
+
+    def _load_users_batch(self, user_ids: List[str], token: Optional[str] = None) -> Optional[Dict[str, Optional[dict]]]:
+        """Fetch many users in one request; returns the users found by id, or None when the batch
+        endpoint is unavailable"""
+        if not self.batch_path:
+            return None
+        token_key = hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+        if self._batch_denied.get(token_key)[0]:
+            return None
+
+        response = self._request(self.batch_path, token, json_body={"user_ids": user_ids})
+        if response.status_code in (404, 405):
+            logger.info(f"Login service has no batch user endpoint at '{self.batch_path}' - falling back to single lookups")
+            self.batch_path = None
+            return None
+        if response.status_code in (401, 403, 422):
+            # The token may not use the (admin) batch endpoint; don't pay for the attempt on every call
+            logger.info(
+                f"Batch user endpoint '{self.batch_path}' returned {response.status_code} for this token - "
+                f"using single lookups for it for {self.batch_denied_cooldown_seconds:.0f}s"
+            )
+            self._batch_denied.set(token_key, True, self.batch_denied_cooldown_seconds)
+            return None
+        if response.status_code >= 500:
+            raise _TransientLookupError(f"{self.batch_path} returned {response.status_code}")
+        if response.status_code != 200:
+            return None
+
+        payload = _json(response, self.batch_path)
+        items = payload.get("users", []) if isinstance(payload, dict) else payload
+        found: Dict[str, Optional[dict]] = {}
+        for item in items or []:
+            if not isinstance(item, dict):
+                continue
+            item_id = item.get("id") or item.get("user_id")
+            user = _parse_user(item)
+            if item_id and user:
+                found[str(item_id)] = user
+        return found
+
+    def get_users(self, user_ids: Iterable[UUID], token: Optional[str] = None) -> Dict[str, Optional[dict]]:
+        """Resolve many users at once, keyed by str(user_id).
+
+        Cached users are served locally; the rest are fetched with one batched request
+        (or parallel single lookups when the Login service has no batch endpoint).
+        """
+        results: Dict[str, Optional[dict]] = {}
+        missing: List[str] = []
+        for user_id in dict.fromkeys(str(u) for u in user_ids):
+            hit, value = self.cache.get(f"user:{user_id}")
+            if hit:
+                results[user_id] = value
+            else:
+                missing.append(user_id)
+        if not missing:
+            return results
+
+        # Claim the lookups nobody else is running; wait for the ones already in flight
+        led: Dict[str, _InFlightLookup] = {}
+        waiting: Dict[str, _InFlightLookup] = {}
+        with self._in_flight_lock:
+            for user_id in missing:
+                key = f"user:{user_id}"
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    in_flight = _InFlightLookup()
+                    self._in_flight[key] = in_flight
+                    led[user_id] = in_flight
+                else:
+                    waiting[user_id] = in_flight
+
+        try:
+            if led:
+                results.update(self._resolve_uncached(list(led), token))
+        finally:
+            with self._in_flight_lock:
+                for user_id in led:
+                    self._in_flight.pop(f"user:{user_id}", None)
+            for user_id, in_flight in led.items():
+                in_flight.value = results.get(user_id)
+                in_flight.done.set()
+
+        for user_id, in_flight in waiting.items():
+            in_flight.done.wait(self.timeout * 2 + 1)
+            results[user_id] = in_flight.value
+        return results
+
+    def _resolve_uncached(self, user_ids: List[str], token: Optional[str]) -> Dict[str, Optional[dict]]:
+        """Fetch users missing from the cache and cache whatever was definitively resolved"""
+        try:
+            fetched = self._load_users_batch(user_ids, token)
+        except (_TransientLookupError, CircuitOpenError, requests.RequestException) as e:
+            logger.warning(f"Batch user lookup for {len(user_ids)} user(s) failed, not caching: {e}")
+            return {user_id: None for user_id in user_ids}
+
+        results: Dict[str, Optional[dict]] = {}
+        for user_id, user in (fetched or {}).items():
+            if user_id in user_ids:
+                results[user_id] = user
+                self.cache.set(f"user:{user_id}", user, self.cache_ttl)
+
+        # An id missing from a batch response may only be hidden from this token, so it is not
+        # cached as unknown; single lookups decide (and cache only a definitive 404)
+        remaining = [user_id for user_id in user_ids if user_id not in results]
+        if not remaining:
+            return results
+
+        def load_one(user_id: str) -> Tuple[str, Optional[dict], bool]:
+            try:
+                return user_id, self._load_user(user_id, token), True
+            except (_TransientLookupError, CircuitOpenError, requests.RequestException) as e:
+                logger.warning(f"User lookup 'user:{user_id}' failed, not caching: {e}")
+                return user_id, None, False
+
+        workers = min(self.fallback_concurrency, len(remaining))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(load_one, remaining))
+        for user_id, user, resolved in outcomes:
+            results[user_id] = user
+            if resolved:
+                self.cache.set(f"user:{user_id}", user, self.cache_ttl if user else self.negative_cache_ttl)
+        return results
+
+    def get_user_email(self, user_id: UUID, token: Optional[str] = None) -> Optional[str]:
+        user = self.get_user(user_id, token)
+        return user.get("email") if user else None
+
+    def clear_cache(self) -> None:
+        self.cache.clear()
+
+def _json(response: requests.Response, source: str) -> Any:
+    """Decode a JSON response body; a non-JSON body (e.g. a proxy error page) is a transient failure"""
+    try:
+        return response.json()
+    except ValueError as e:
+        raise _TransientLookupError(f"{source} returned a non-JSON body: {e}")
+
+def _parse_user(user_data: Any) -> Optional[dict]:
+    """Normalize a Login service user payload; users without an email are treated as not found"""
+    if not isinstance(user_data, dict) or not user_data.get("email"):
+        return None
+    return {
+        "name": user_data.get("name"),
+        "email": user_data.get("email"),
+        "role": user_data.get("role"),
+    }
+
+# Initialize lazily so importing this module never opens connections
+_user_directory: Optional[UserDirectoryClient] = None
+_user_directory_lock = threading.Lock()
+
+def get_user_directory() -> UserDirectoryClient:
+    """Get or create the process-wide user directory client"""
+    global _user_directory
+    if _user_directory is None:
+        with _user_directory_lock:
+            if _user_directory is None:
+                _user_directory = UserDirectoryClient(
+                    base_url=config.API_URL,
+                    timeout=config.USER_DIRECTORY_TIMEOUT,
+                    pool_size=config.USER_DIRECTORY_POOL_SIZE,
+                    cache_size=config.USER_DIRECTORY_CACHE_SIZE,
+                    cache_ttl=config.USER_DIRECTORY_CACHE_TTL,
+                    negative_cache_ttl=config.USER_DIRECTORY_NEGATIVE_CACHE_TTL,
+                    breaker_failures=config.USER_DIRECTORY_BREAKER_FAILURES,
+                    breaker_reset_seconds=config.USER_DIRECTORY_BREAKER_RESET_SECONDS,
+                    batch_path=config.USER_DIRECTORY_BATCH_PATH,
+                    fallback_concurrency=config.USER_DIRECTORY_FALLBACK_CONCURRENCY,
+                    batch_denied_cooldown_seconds=config.USER_DIRECTORY_BATCH_DENIED_COOLDOWN_SECONDS,
+                )
+    return _user_directory
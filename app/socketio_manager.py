@@ -1,6 +1,15 @@
-from socketio import AsyncServer
-from typing import Dict, Set
+from socketio import AsyncServer, AsyncPubSubManager, AsyncRedisManager
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+import asyncio
 import json
+import logging
+import queue
+import re
+import threading
+
+from app.config import SOCKETIO_MESSAGE_QUEUE, SOCKETIO_CHANNEL, SOCKETIO_COALESCE_SECONDS, SOCKETIO_EMIT_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
 
 # Global Socket.IO server instance
 sio: AsyncServer = None
@@ -8,13 +17,188 @@ sio: AsyncServer = None
 # Store user connections: {user_id: {socket_id1, socket_id2, ...}}
 user_connections: Dict[str, Set[str]] = {}
 
-# Store task rooms: {task_id: {user_id1, user_id2, ...}}
-task_rooms: Dict[str, Set[str]] = {}
+# Store task rooms: {task_id: {user_id: {socket ids of that user in the room}}}
+task_rooms: Dict[str, Dict[str, Set[str]]] = {}
+
+# Reverse indexes, so a disconnect only touches the rooms of that socket
+# {socket_id: user_id}
+socket_users: Dict[str, str] = {}
+# {socket_id: {task_id: user_id the socket joined as}}
+socket_rooms: Dict[str, Dict[str, str]] = {}
+
+# Coalesced events waiting for the next flush
+# {(task_id, reader user_id): latest read receipt payload}
+_pending_read_receipts: Dict[Tuple[str, str], dict] = {}
+# {user_id: {task_id: has_unread}}
+_pending_unread_updates: Dict[str, Dict[str, bool]] = {}
+_flush_task: Optional[asyncio.Task] = None
+
+class AsyncPostgresManager(AsyncPubSubManager):
+    """Socket.IO client manager that shares emits between workers over Postgres LISTEN/NOTIFY"""
+    name = 'asyncpg'
+
+    # NOTIFY payloads must be shorter than 8000 bytes
+    MAX_PAYLOAD_BYTES = 7999
+    # Idle time after which the listening connection is checked
+    KEEPALIVE_SECONDS = 30
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None):
+        # asyncpg takes a plain postgresql:// URL
+        self.url = re.sub(r"^postgres(?:ql)?(?:\+\w+)?://", "postgresql://", url)
+        self._connection = None
+        self._publish_lock = None
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    async def _publish(self, data):
+        import asyncpg
+
+        payload = json.dumps(data)
+        if len(payload.encode('utf-8')) > self.MAX_PAYLOAD_BYTES:
+            logger.error(f"Socket.IO {data.get('event')} event too large for NOTIFY; delivered to this worker only")
+            return
+
+        if self._publish_lock is None:
+            self._publish_lock = asyncio.Lock()
+        async with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._connection is None or self._connection.is_closed():
+                        self._connection = await asyncpg.connect(self.url)
+                    await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                    return
+                except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                    self._connection = None
+                    logger.error(f"Cannot publish Socket.IO event to Postgres (attempt {attempt + 1}): {e}")
+
+    async def _listen(self):
+        import asyncpg
+
+        retry_sleep = 1
+        while True:
+            connection = None
+            try:
+                queue = asyncio.Queue()
+                connection = await asyncpg.connect(self.url)
+                await connection.add_listener(
+                    self.channel, lambda conn, pid, channel, payload: queue.put_nowait(payload)
+                )
+                retry_sleep = 1
+                while True:
+                    try:
+                        payload = await asyncio.wait_for(queue.get(), timeout=self.KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        # Raises if the connection dropped while idle
+                        await connection.execute("SELECT 1")
+                        continue
+                    yield payload
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.error(f"Cannot listen for Socket.IO events on Postgres, retrying in {retry_sleep}s: {e}")
+                await asyncio.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+class EmitBridge:
+    """Runs emit coroutines on the Socket.IO event loop for code in other threads (sync endpoints in the threadpool).
+
+    submit() never blocks: work goes into a bounded queue drained by one task on the loop, and work that
+    does not fit, or arrives while the bridge is not running, is dropped and counted.
+    """
+
+    def __init__(self, maxsize: int):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._counts_lock = threading.Lock()
+        self._counts = {"queued": 0, "sent": 0, "failed": 0, "dropped_queue_full": 0, "dropped_not_running": 0}
+
+    def start(self):
+        """Bind to the running loop and start draining (call from the loop, on startup)"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._worker = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting work and send what is already queued"""
+        if self._worker is None:
+            return
+        self._loop = None
+        self._stopping = True
+        self._wakeup.set()
+        await self._worker
+        self._worker = None
+
+    def submit(self, emit: Callable[..., Awaitable[Any]], *args) -> bool:
+        """Schedule emit(*args) on the loop from any thread. Returns False if it was dropped."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            self._count("dropped_not_running")
+            logger.warning(f"Socket.IO emit {emit.__name__} dropped: emit bridge is not running")
+            return False
+        try:
+            self._queue.put_nowait((emit, args))
+        except queue.Full:
+            self._count("dropped_queue_full")
+            logger.warning(f"Socket.IO emit {emit.__name__} dropped: emit queue is full")
+            return False
+        self._count("queued")
+        try:
+            loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # Loop closed after the check
+            pass
+        return True
+
+    def metrics(self) -> dict:
+        with self._counts_lock:
+            counts = dict(self._counts)
+        counts["queue_depth"] = self._queue.qsize()
+        return counts
+
+    def _count(self, key: str):
+        with self._counts_lock:
+            self._counts[key] += 1
+
+    async def _run(self):
+        while not self._stopping:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self._drain()
+
+    async def _drain(self):
+        while True:
+            try:
+                emit, args = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                await emit(*args)
+                self._count("sent")
+            except Exception as e:
+                self._count("failed")
+                logger.error(f"Socket.IO emit {emit.__name__} failed: {e}")
+
+emit_bridge = EmitBridge(SOCKETIO_EMIT_QUEUE_SIZE)
+
+def _create_client_manager():
+    """Client manager for SOCKETIO_MESSAGE_QUEUE (None = this process only)"""
+    if not SOCKETIO_MESSAGE_QUEUE:
+        return None
+    if SOCKETIO_MESSAGE_QUEUE.startswith(("redis://", "rediss://")):
+        return AsyncRedisManager(SOCKETIO_MESSAGE_QUEUE, channel=SOCKETIO_CHANNEL)
+    if re.match(r"^postgres(?:ql)?(?:\+\w+)?://", SOCKETIO_MESSAGE_QUEUE):
+        return AsyncPostgresManager(SOCKETIO_MESSAGE_QUEUE, channel=SOCKETIO_CHANNEL)
+    raise ValueError("SOCKETIO_MESSAGE_QUEUE must be a redis:// or postgresql:// URL")
 
 def init_socketio(fastapi_app):
     """Initialize Socket.IO server"""
     global sio
     sio = AsyncServer(
+        client_manager=_create_client_manager(),
         cors_allowed_origins="*",
         async_mode='asgi',
         logger=False,
@@ -26,59 +210,92 @@ def get_sio():
     """Get the global Socket.IO server instance"""
     return sio
 
+def task_room(task_id: str) -> str:
+    """Name of the Socket.IO room of everyone watching a task"""
+    return f"task_{task_id}"
+
+def user_room(user_id: str) -> str:
+    """Name of the Socket.IO room holding every socket of a user"""
+    return f"user_{user_id}"
+
 async def emit_new_comment(task_id: str, comment_data: dict, sender_user_id: str):
     """Emit new comment event to all users watching this task except the sender"""
     if not sio:
         return
     
-    # Get all users in the task room
     task_id_str = str(task_id)
-    if task_id_str in task_rooms:
-        for user_id in task_rooms[task_id_str]:
-            # Don't send to the sender
-            if user_id != sender_user_id:
-                # Send to all socket connections for this user
-                if user_id in user_connections:
-                    for socket_id in user_connections[user_id]:
-                        await sio.emit('new_comment', {
-                            'task_id': task_id_str,
-                            'comment': comment_data
-                        }, room=socket_id)
-
-async def emit_unread_update(task_id: str, user_id: str, has_unread: bool):
-    """Emit unread message status update to a specific user"""
+    # One emit to the task room; the sender's own sockets are skipped
+    await sio.emit('new_comment', {
+        'task_id': task_id_str,
+        'comment': comment_data
+    }, room=task_room(task_id_str), skip_sid=list(user_connections.get(sender_user_id, ())) or None)
+
+async def emit_task_notification(user_id: str, notification: dict):
+    """Emit a task notification (closure requested, approved, rejected) to every socket of a user"""
     if not sio:
         return
     
-    if user_id in user_connections:
-        for socket_id in user_connections[user_id]:
-            await sio.emit('unread_update', {
-                'task_id': str(task_id),
-                'has_unread': has_unread
-            }, room=socket_id)
-
-async def emit_comment_read_receipt(task_id: str, comment_id: str, receipt_data: dict):
-    """Emit read receipt update for a comment to all users watching this task"""
+    await sio.emit('task_notification', notification, room=user_room(str(user_id)))
+
+def queue_unread_update(task_id: str, user_id: str, has_unread: bool):
+    """Queue an unread status change for a user; a user's changes are sent as one unread_updates event per window"""
+    if not sio:
+        return
+    _pending_unread_updates.setdefault(str(user_id), {})[str(task_id)] = has_unread
+    _schedule_flush()
+
+def queue_read_receipt(task_id: str, up_to_comment_id: str, receipt_data: dict):
+    """Queue "user read everything up to this comment"; only a reader's latest position per task is sent"""
     if not sio:
         return
-    
     task_id_str = str(task_id)
-    if task_id_str in task_rooms:
-        for user_id in task_rooms[task_id_str]:
-            # Send to all socket connections for each user in the task room
-            if user_id in user_connections:
-                for socket_id in user_connections[user_id]:
-                    await sio.emit('comment_read_receipt', {
-                        'task_id': task_id_str,
-                        'comment_id': str(comment_id),
-                        'receipt': receipt_data
-                    }, room=socket_id)
+    _pending_read_receipts[(task_id_str, str(receipt_data.get('user_id')))] = {
+        'task_id': task_id_str,
+        'comment_id': str(up_to_comment_id),
+        'receipt': receipt_data
+    }
+    _schedule_flush()
+
+def _schedule_flush():
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.get_running_loop().create_task(_flush_after_window())
+
+async def _flush_after_window():
+    await asyncio.sleep(SOCKETIO_COALESCE_SECONDS)
+    await flush_coalesced_events()
+
+async def flush_coalesced_events():
+    """Emit every queued read receipt and unread update now"""
+    global _flush_task
+    _flush_task = None
+    read_receipts = list(_pending_read_receipts.values())
+    unread_updates = list(_pending_unread_updates.items())
+    _pending_read_receipts.clear()
+    _pending_unread_updates.clear()
+    if not sio:
+        return
+    
+    for payload in read_receipts:
+        try:
+            await sio.emit('comment_read_receipt', payload, room=task_room(payload['task_id']))
+        except Exception as e:
+            logger.error(f"Socket.IO read receipt emission error: {e}")
+    
+    for user_id, updates in unread_updates:
+        try:
+            await sio.emit('unread_updates', {
+                'updates': [{'task_id': task_id, 'has_unread': has_unread} for task_id, has_unread in updates.items()]
+            }, room=user_room(user_id))
+        except Exception as e:
+            logger.error(f"Socket.IO unread update emission error: {e}")
 
 async def register_user_connection(user_id: str, socket_id: str):
     """Register a user's socket connection"""
     if user_id not in user_connections:
         user_connections[user_id] = set()
     user_connections[user_id].add(socket_id)
+    socket_users[socket_id] = user_id
 
 async def unregister_user_connection(user_id: str, socket_id: str):
     """Unregister a user's socket connection"""
@@ -86,19 +303,38 @@ async def unregister_user_connection(user_id: str, socket_id: str):
         user_connections[user_id].discard(socket_id)
         if not user_connections[user_id]:
             del user_connections[user_id]
+    socket_users.pop(socket_id, None)
 
-async def join_task_room(task_id: str, user_id: str):
-    """Add user to task room"""
-    task_id_str = str(task_id)
-    if task_id_str not in task_rooms:
-        task_rooms[task_id_str] = set()
-    task_rooms[task_id_str].add(user_id)
+async def disconnect_socket(socket_id: str) -> Optional[str]:
+    """Drop a socket from every room it joined and from its user's connections. Returns the user id."""
+    user_id = socket_users.get(socket_id)
+    for task_id, member_id in socket_rooms.pop(socket_id, {}).items():
+        _remove_from_room(task_id, member_id, socket_id)
+    if user_id is not None:
+        await unregister_user_connection(user_id, socket_id)
+    return user_id
 
-async def leave_task_room(task_id: str, user_id: str):
-    """Remove user from task room"""
+def _remove_from_room(task_id: str, user_id: str, socket_id: str):
+    members = task_rooms.get(task_id)
+    if not members or user_id not in members:
+        return
+    members[user_id].discard(socket_id)
+    if not members[user_id]:
+        del members[user_id]
+    if not members:
+        del task_rooms[task_id]
+
+async def join_task_room(task_id: str, user_id: str, socket_id: str):
+    """Add a user's socket to task room"""
     task_id_str = str(task_id)
-    if task_id_str in task_rooms:
-        task_rooms[task_id_str].discard(user_id)
-        if not task_rooms[task_id_str]:
-            del task_rooms[task_id_str]
+    task_rooms.setdefault(task_id_str, {}).setdefault(user_id, set()).add(socket_id)
+    socket_rooms.setdefault(socket_id, {})[task_id_str] = user_id
 
+async def leave_task_room(task_id: str, user_id: str, socket_id: str):
+    """Remove a user's socket from task room"""
+    task_id_str = str(task_id)
+    _remove_from_room(task_id_str, user_id, socket_id)
+    if socket_id in socket_rooms:
+        socket_rooms[socket_id].pop(task_id_str, None)
+        if not socket_rooms[socket_id]:
+            del socket_rooms[socket_id]
@@ -2,6 +2,7 @@ from __future__ import print_function
 from dotenv import load_dotenv
 import os
 import logging
+import threading
 
 # Try to import email SDK, but don't fail if it's not installed
 try:
@@ -18,6 +19,27 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# The Sendinblue API client is built once and shared by every send (it is thread-safe)
+_email_api = None
+_email_api_lock = threading.Lock()
+
+def get_email_api():
+    """Get or create the shared transactional email API client, or None if sending is disabled"""
+    global _email_api
+    if _email_api is None:
+        with _email_api_lock:
+            if _email_api is None:
+                API_KEY = os.getenv("SENDINBLUE_API_KEY") or os.getenv("API_KEY")
+                if not API_KEY:
+                    logger.warning("SENDINBLUE_API_KEY not found in environment variables - email sending disabled")
+                    return None
+                configuration = sib_api_v3_sdk.Configuration()
+                configuration.api_key["api-key"] = API_KEY
+                _email_api = sib_api_v3_sdk.TransactionalEmailsApi(
+                    sib_api_v3_sdk.ApiClient(configuration)
+                )
+    return _email_api
+
 def send_task_creation_email(to_email: str, task_title: str, task_number: int, creator_name: str, task_description: str = None, due_date: str = None, priority: str = None):
     """Send email notification when a task is created"""
     logger.info(f"Attempting to send task creation email to {to_email} for task #{task_number}: {task_title}")
@@ -27,14 +49,13 @@ def send_task_creation_email(to_email: str, task_title: str, task_number: int, c
         return False
     
     try:
-        API_KEY = os.getenv("SENDINBLUE_API_KEY") or os.getenv("API_KEY")
         SENDER = os.getenv("SENDER")
         REPLY_TO = os.getenv("REPLY_TO")
         NAME = os.getenv("NAME")
         FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:8003")
 
-        if not API_KEY:
-            logger.warning("SENDINBLUE_API_KEY not found in environment variables - email sending disabled")
+        api_instance = get_email_api()
+        if api_instance is None:
             return False
         
         if not SENDER:
@@ -42,13 +63,6 @@ def send_task_creation_email(to_email: str, task_title: str, task_number: int, c
         
         logger.debug(f"Email configuration - Sender: {SENDER}, Reply-To: {REPLY_TO}, Name: {NAME}")
 
-        configuration = sib_api_v3_sdk.Configuration()
-        configuration.api_key["api-key"] = API_KEY
-
-        api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
-            sib_api_v3_sdk.ApiClient(configuration)
-        )
-
         sender = {"name": NAME or "Task Management", "email": SENDER}
         reply_to = {"name": NAME or "Task Management", "email": REPLY_TO or SENDER}
 
@@ -151,26 +165,18 @@ def send_task_comment_email(to_email: str, sender_name: str, task_title: str, ta
         return False
     
     try:
-        API_KEY = os.getenv("SENDINBLUE_API_KEY") or os.getenv("API_KEY")
         SENDER = os.getenv("SENDER")
         REPLY_TO = os.getenv("REPLY_TO")
         NAME = os.getenv("NAME")
         FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:8003")
         
-        if not API_KEY:
-            logger.warning("SENDINBLUE_API_KEY not found in environment variables - email sending disabled")
+        api_instance = get_email_api()
+        if api_instance is None:
             return False
         
         if not SENDER:
             logger.warning("SENDER not found in environment variables - email sending may fail")
         
-        configuration = sib_api_v3_sdk.Configuration()
-        configuration.api_key["api-key"] = API_KEY
-        
-        api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
-            sib_api_v3_sdk.ApiClient(configuration)
-        )
-        
         sender = {"name": NAME or "Task Management", "email": SENDER}
         reply_to = {"name": NAME or "Task Management", "email": REPLY_TO or SENDER}
         
@@ -0,0 +1,37 @@
+-- Migration script to replace per-comment read rows with per-(task, user) read watermarks
+-- Run this script in pgAdmin or any PostgreSQL client
+
+CREATE TABLE IF NOT EXISTS task_comment_read_watermarks (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    task_id UUID NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    user_name VARCHAR(255),
+    last_read_comment_id UUID REFERENCES task_comments(id) ON DELETE SET NULL,
+    last_read_comment_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    read_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_task_comment_read_watermark UNIQUE (task_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_task_comment_read_watermarks_task_id ON task_comment_read_watermarks (task_id);
+CREATE INDEX IF NOT EXISTS ix_task_comment_read_watermarks_user_id ON task_comment_read_watermarks (user_id);
+
+-- Seed watermarks from existing read rows: each user's position is the newest comment they have read
+INSERT INTO task_comment_read_watermarks (task_id, user_id, user_name, last_read_comment_id, last_read_comment_at, read_at)
+SELECT DISTINCT ON (c.task_id, r.user_id)
+    c.task_id,
+    r.user_id,
+    r.user_name,
+    c.id,
+    c.created_at,
+    r.read_at
+FROM task_comment_reads r
+JOIN task_comments c ON c.id = r.comment_id
+WHERE c.created_at IS NOT NULL
+ORDER BY c.task_id, r.user_id, c.created_at DESC
+ON CONFLICT (task_id, user_id) DO NOTHING;
+
+-- task_comment_reads is no longer written by the application and can be dropped once verified:
+-- DROP TABLE task_comment_reads;
+
+-- Verify table creation
+SELECT 'task_comment_read_watermarks table created and seeded successfully.' AS status;
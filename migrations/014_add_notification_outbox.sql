@@ -0,0 +1,28 @@
+-- Migration script to add the notification outbox drained by the notification workers
+-- Run this script in pgAdmin or any PostgreSQL client
+
+DO $$ BEGIN
+    CREATE TYPE notificationstatus AS ENUM ('pending', 'sending', 'sent', 'failed');
+EXCEPTION
+    WHEN duplicate_object THEN null;
+END $$;
+
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    kind VARCHAR NOT NULL,
+    recipient_user_id UUID,
+    to_email VARCHAR,
+    payload JSON NOT NULL,
+    status notificationstatus NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS ix_notification_outbox_status_next_attempt_at ON notification_outbox (status, next_attempt_at);
+
+-- Verify table creation
+SELECT 'notification_outbox table created successfully.' AS status;
@@ -0,0 +1,30 @@
+-- Migration script to allocate task numbers per agency from a counter table
+-- Run this script in pgAdmin or any PostgreSQL client
+
+CREATE TABLE IF NOT EXISTS task_number_counters (
+    agency_id UUID PRIMARY KEY,
+    last_number INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Seed one counter per agency from the highest number already in use
+INSERT INTO task_number_counters (agency_id, last_number, updated_at)
+SELECT agency_id, COALESCE(MAX(task_number), 0), CURRENT_TIMESTAMP
+FROM tasks
+GROUP BY agency_id
+ON CONFLICT (agency_id) DO UPDATE
+SET last_number = GREATEST(task_number_counters.last_number, EXCLUDED.last_number),
+    updated_at = CURRENT_TIMESTAMP;
+
+-- Task numbers are unique per agency, not globally
+DROP INDEX IF EXISTS ix_tasks_task_number;
+ALTER TABLE tasks DROP CONSTRAINT IF EXISTS tasks_task_number_key;
+
+DO $$ BEGIN
+    ALTER TABLE tasks ADD CONSTRAINT uq_tasks_agency_task_number UNIQUE (agency_id, task_number);
+EXCEPTION
+    WHEN duplicate_table OR duplicate_object THEN null;
+END $$;
+
+-- Verify counters
+SELECT agency_id, last_number FROM task_number_counters ORDER BY agency_id;
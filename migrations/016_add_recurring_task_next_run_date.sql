@@ -0,0 +1,27 @@
+-- Migration script to add next_run_date to recurring_tasks so the scheduler only loads due templates
+-- Run this script in pgAdmin or any PostgreSQL client
+
+ALTER TABLE recurring_tasks 
+ADD COLUMN IF NOT EXISTS next_run_date DATE;
+
+-- Partial index: the scheduler only looks at active templates
+CREATE INDEX IF NOT EXISTS ix_recurring_tasks_next_run_date_active 
+ON recurring_tasks(next_run_date) 
+WHERE is_active = true;
+
+-- Seed active templates with the earliest date they could run; the scheduler moves each one
+-- forward to its actual next occurrence the first time it is examined
+UPDATE recurring_tasks 
+SET next_run_date = GREATEST(start_date, CURRENT_DATE) 
+WHERE is_active = true 
+    AND next_run_date IS NULL 
+    AND (end_date IS NULL OR end_date >= CURRENT_DATE);
+
+-- Verify the column was added
+SELECT 
+    column_name, 
+    data_type, 
+    is_nullable
+FROM information_schema.columns 
+WHERE table_name = 'recurring_tasks' 
+    AND column_name = 'next_run_date';
@@ -0,0 +1,21 @@
+-- Migration script to record materialized recurring task occurrences (makes scheduler runs idempotent)
+-- Run this script in pgAdmin or any PostgreSQL client
+
+CREATE TABLE IF NOT EXISTS recurring_task_occurrences (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    recurring_task_id UUID NOT NULL REFERENCES recurring_tasks(id) ON DELETE CASCADE,
+    occurrence_date DATE NOT NULL,
+    task_id UUID,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_recurring_task_occurrence UNIQUE (recurring_task_id, occurrence_date)
+);
+
+-- Seed the latest run of each template so rerunning that day does not duplicate it
+INSERT INTO recurring_task_occurrences (recurring_task_id, occurrence_date, created_at)
+SELECT id, last_created_at::date, last_created_at
+FROM recurring_tasks
+WHERE last_created_at IS NOT NULL
+ON CONFLICT (recurring_task_id, occurrence_date) DO NOTHING;
+
+-- Verify table creation
+SELECT 'recurring_task_occurrences table created successfully.' AS status;
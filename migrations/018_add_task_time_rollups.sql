@@ -0,0 +1,49 @@
+-- Migration script to add logged-time rollups per task and per (task, user)
+-- Run this script in pgAdmin or any PostgreSQL client
+
+CREATE TABLE IF NOT EXISTS task_time_rollups (
+    task_id UUID PRIMARY KEY REFERENCES tasks(id) ON DELETE CASCADE,
+    total_seconds BIGINT NOT NULL DEFAULT 0,
+    entry_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS task_user_time_rollups (
+    task_id UUID NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    total_seconds BIGINT NOT NULL DEFAULT 0,
+    entry_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (task_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_task_user_time_rollups_user_id ON task_user_time_rollups (user_id);
+
+-- Running timers of a task (live part of the logged-time summary)
+CREATE INDEX IF NOT EXISTS ix_task_timers_task_id_active 
+ON task_timers(task_id) 
+WHERE is_active = true;
+
+-- Seed the rollups from finished timers
+INSERT INTO task_time_rollups (task_id, total_seconds, entry_count, updated_at)
+SELECT task_id, SUM(COALESCE(duration_seconds, 0)), COUNT(*), CURRENT_TIMESTAMP
+FROM task_timers
+WHERE is_active = false
+GROUP BY task_id
+ON CONFLICT (task_id) DO UPDATE
+SET total_seconds = EXCLUDED.total_seconds,
+    entry_count = EXCLUDED.entry_count,
+    updated_at = EXCLUDED.updated_at;
+
+INSERT INTO task_user_time_rollups (task_id, user_id, total_seconds, entry_count, updated_at)
+SELECT task_id, user_id, SUM(COALESCE(duration_seconds, 0)), COUNT(*), CURRENT_TIMESTAMP
+FROM task_timers
+WHERE is_active = false
+GROUP BY task_id, user_id
+ON CONFLICT (task_id, user_id) DO UPDATE
+SET total_seconds = EXCLUDED.total_seconds,
+    entry_count = EXCLUDED.entry_count,
+    updated_at = EXCLUDED.updated_at;
+
+-- Verify table creation
+SELECT 'task_time_rollups and task_user_time_rollups tables created and seeded successfully.' AS status;
@@ -0,0 +1,22 @@
+-- Migration script to add daily logged-time buckets for timesheet and utilization reports
+-- Run this script in pgAdmin or any PostgreSQL client
+-- Then fill the table from existing timers with:
+--   python -m app.services.time_buckets backfill
+
+CREATE TABLE IF NOT EXISTS time_buckets_daily (
+    task_id UUID NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    bucket_date DATE NOT NULL,
+    agency_id UUID NOT NULL,
+    client_id UUID,
+    total_seconds BIGINT NOT NULL DEFAULT 0,
+    entry_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (task_id, user_id, bucket_date)
+);
+
+CREATE INDEX IF NOT EXISTS ix_time_buckets_daily_agency_date ON time_buckets_daily (agency_id, bucket_date);
+CREATE INDEX IF NOT EXISTS ix_time_buckets_daily_agency_user_date ON time_buckets_daily (agency_id, user_id, bucket_date);
+
+-- Verify table creation
+SELECT 'time_buckets_daily table created successfully.' AS status;
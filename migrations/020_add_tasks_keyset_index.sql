@@ -0,0 +1,11 @@
+-- Migration script to add the composite index used by the task list order and keyset (cursor) pagination
+-- Run this script in pgAdmin or any PostgreSQL client
+
+CREATE INDEX IF NOT EXISTS ix_tasks_agency_created_at_id 
+ON tasks(agency_id, created_at DESC, id DESC);
+
+-- Verify the index was created
+SELECT indexname, indexdef 
+FROM pg_indexes 
+WHERE tablename = 'tasks' 
+    AND indexname = 'ix_tasks_agency_created_at_id';
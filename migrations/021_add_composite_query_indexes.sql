@@ -0,0 +1,33 @@
+-- Migration script to add the composite and partial indexes used by the hot task queries
+-- Run this script in pgAdmin or any PostgreSQL client
+-- On large tables each CREATE INDEX can instead be run on its own as CREATE INDEX CONCURRENTLY
+
+-- Task list filtered by client, in list order (created_at DESC, id DESC)
+CREATE INDEX IF NOT EXISTS ix_tasks_agency_client_created_at_id
+ON tasks(agency_id, client_id, created_at DESC, id DESC);
+
+-- Task list filtered by assignee (and optionally status), in list order
+CREATE INDEX IF NOT EXISTS ix_tasks_agency_assignee_status
+ON tasks(agency_id, assigned_to, status, created_at DESC, id DESC);
+
+-- Running timers of a task / of a (task, user): logged-time summary and get_active_timer
+CREATE INDEX IF NOT EXISTS ix_task_timers_task_user_active
+ON task_timers(task_id, user_id)
+WHERE is_active = true;
+
+-- Superseded by ix_task_timers_task_user_active (same leading column and predicate)
+DROP INDEX IF EXISTS ix_task_timers_task_id_active;
+
+-- Comments of a task in thread order, and unread comments after a read watermark
+CREATE INDEX IF NOT EXISTS ix_task_comments_task_created_at
+ON task_comments(task_id, created_at);
+
+-- Verify the indexes were created
+SELECT tablename, indexname, indexdef
+FROM pg_indexes
+WHERE indexname IN (
+    'ix_tasks_agency_client_created_at_id',
+    'ix_tasks_agency_assignee_status',
+    'ix_task_timers_task_user_active',
+    'ix_task_comments_task_created_at'
+);
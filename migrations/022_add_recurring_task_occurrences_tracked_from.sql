@@ -0,0 +1,30 @@
+-- Migration script to record where each template's occurrence history starts
+-- Run this script in pgAdmin or any PostgreSQL client
+
+-- Occurrences before this date were materialized (or not) by the scheduler before occurrences were
+-- recorded, so a backfill cannot tell which of them already have a task and must not recreate them.
+-- NULL: the template's whole history is recorded.
+ALTER TABLE recurring_tasks
+ADD COLUMN IF NOT EXISTS occurrences_tracked_from DATE;
+
+-- 017 seeded each template's latest run before the occurrence table existed (the only rows
+-- without a task_id); history is complete from the day after it
+UPDATE recurring_tasks rt
+SET occurrences_tracked_from = seeded.last_seeded_date + 1
+FROM (
+    SELECT recurring_task_id, MAX(occurrence_date) AS last_seeded_date
+    FROM recurring_task_occurrences
+    WHERE task_id IS NULL
+    GROUP BY recurring_task_id
+) seeded
+WHERE rt.id = seeded.recurring_task_id
+    AND rt.occurrences_tracked_from IS NULL;
+
+-- Verify the column was added
+SELECT
+    column_name,
+    data_type,
+    is_nullable
+FROM information_schema.columns
+WHERE table_name = 'recurring_tasks'
+    AND column_name = 'occurrences_tracked_from';
@@ -0,0 +1,24 @@
+-- Migration script to make tasks.created_at NOT NULL, so every task has a position in the
+-- task list order (created_at DESC, id DESC) and can be encoded in a keyset cursor
+-- Run this script in pgAdmin or any PostgreSQL client
+
+-- Legacy rows without created_at: the last update is the closest known time
+UPDATE tasks
+SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP)
+WHERE created_at IS NULL;
+
+ALTER TABLE tasks
+ALTER COLUMN created_at SET DEFAULT CURRENT_TIMESTAMP;
+
+ALTER TABLE tasks
+ALTER COLUMN created_at SET NOT NULL;
+
+-- Verify the column is now NOT NULL
+SELECT
+    column_name,
+    data_type,
+    is_nullable,
+    column_default
+FROM information_schema.columns
+WHERE table_name = 'tasks'
+    AND column_name = 'created_at';
@@ -2,6 +2,11 @@
 echo Starting Task Management API Server...
 echo.
 cd /d "%~dp0"
+python -m app.services.migrate
+if errorlevel 1 (
+    pause
+    exit /b 1
+)
 python -m uvicorn app.main:app --host 0.0.0.0 --port 8005 --reload
 pause
 
@@ -1,5 +1,6 @@
 #!/bin/bash
 echo "Starting Task Management API Server..."
 cd "$(dirname "$0")"
+python -m app.services.migrate || exit 1
 uvicorn app.main:app --host 0.0.0.0 --port 8005 --reload
 
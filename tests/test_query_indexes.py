@@ -0,0 +1,123 @@
+"""
+The hot crud queries must be served by indexes.
+
+Each check calls a crud function inside a transaction that is rolled back, captures the SQL it
+emits and runs EXPLAIN on it with sequential scans disabled. The planner only falls back to a
+Seq Scan when no index can serve the query, so a Seq Scan on a checked table fails the test.
+Older single-column indexes (e.g. on tasks.agency_id) can serve most of these queries too, so
+each check also names the indexes its plan must use.
+
+Needs a migrated database (python -m app.services.migrate); skipped when DATABASE_URL is not set.
+"""
+import os
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.database import engine
+from app.crud import (
+    crud_task,
+    crud_task_collaborator,
+    crud_task_comment,
+    crud_task_comment_read,
+    crud_task_timer,
+    crud_time_bucket,
+)
+from app.models.task import TaskStatus
+
+AGENCY_ID, CLIENT_ID, TASK_ID, USER_ID = (uuid.uuid4() for _ in range(4))
+TODAY = date.today()
+
+# (name, tables that must not be sequentially scanned, indexes the plan must use, crud call)
+CHECKS = [
+    ("tasks by agency (first page)", ("tasks",), ("ix_tasks_agency_created_at_id",),
+     lambda db: crud_task.get_tasks_by_agency(db, AGENCY_ID)),
+    ("tasks by agency (cursor page)", ("tasks",), ("ix_tasks_agency_created_at_id",),
+     lambda db: crud_task.get_tasks_by_agency(db, AGENCY_ID, cursor=(datetime.utcnow(), uuid.uuid4()))),
+    ("tasks by agency and client", ("tasks",), ("ix_tasks_agency_client_created_at_id",),
+     lambda db: crud_task.get_tasks_by_agency(db, AGENCY_ID, client_id=CLIENT_ID)),
+    ("tasks by agency, assignee and status", ("tasks",), ("ix_tasks_agency_assignee_status",),
+     lambda db: crud_task.get_tasks_by_agency(db, AGENCY_ID, assigned_to=USER_ID, status=TaskStatus.pending)),
+    ("task exists", ("tasks",), ("tasks_pkey",),
+     lambda db: crud_task.task_exists(db, TASK_ID, AGENCY_ID)),
+    ("active timer of a user", ("task_timers",), ("ix_task_timers_task_user_active",),
+     lambda db: crud_task_timer.get_active_timer(db, TASK_ID, USER_ID)),
+    ("logged time summary", ("task_timers", "task_time_rollups"),
+     ("ix_task_timers_task_user_active", "task_time_rollups_pkey"),
+     lambda db: crud_task_timer.get_logged_time_summary(db, TASK_ID, USER_ID)),
+    ("task comments", ("task_comments",), ("ix_task_comments_task_created_at",),
+     lambda db: crud_task_comment.get_task_comments(db, TASK_ID)),
+    ("unread comments of a task", ("task_comments", "task_comment_read_watermarks"),
+     ("ix_task_comments_task_created_at",),
+     lambda db: crud_task_comment_read.get_unread_comment_ids(db, TASK_ID, USER_ID)),
+    ("tasks with unread comments", ("task_comments", "task_comment_read_watermarks"),
+     ("ix_task_comments_task_created_at",),
+     lambda db: crud_task_comment_read.get_task_ids_with_unread_comments(db, [TASK_ID, uuid.uuid4()], USER_ID)),
+    ("task collaborators", ("task_collaborators",), (),
+     lambda db: crud_task_collaborator.get_task_collaborators(db, TASK_ID)),
+    ("timesheet", ("time_buckets_daily",), ("ix_time_buckets_daily_agency_date",),
+     lambda db: crud_time_bucket.get_timesheet(db, AGENCY_ID, TODAY - timedelta(days=30), TODAY, ["user"])),
+]
+
+def _seq_scans(plan: dict, tables) -> list:
+    """Checked tables read by a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan tree"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in tables:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child, tables))
+    return found
+
+def _index_names(plan: dict) -> set:
+    """Names of the indexes used anywhere in an EXPLAIN (FORMAT JSON) plan tree"""
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        names |= _index_names(child)
+    return names
+
+@pytest.fixture
+def connection():
+    """Connection in a transaction that is rolled back, with sequential scans disabled"""
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            yield connection
+        finally:
+            transaction.rollback()
+
+@pytest.mark.parametrize("name,tables,indexes,run", CHECKS, ids=[check[0] for check in CHECKS])
+def test_query_is_served_by_indexes(connection, name, tables, indexes, run):
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    db = Session(bind=connection)
+    event.listen(connection, "before_cursor_execute", capture)
+    try:
+        run(db)
+    finally:
+        event.remove(connection, "before_cursor_execute", capture)
+        db.close()
+
+    assert captured, f"{name} issued no SELECT"
+    problems = []
+    used_indexes = set()
+    for statement, parameters in captured:
+        plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()[0]["Plan"]
+        used_indexes |= _index_names(plan)
+        for table in _seq_scans(plan, tables):
+            problems.append(f"Seq Scan on {table}: {' '.join(statement.split())[:200]}")
+    for index in indexes:
+        if index not in used_indexes:
+            problems.append(f"{index} not used (plans used: {', '.join(sorted(used_indexes)) or 'no index'})")
+    assert not problems, "\n".join(problems)